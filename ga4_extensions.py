@@ -4,281 +4,375 @@ GA4 API 擴展模組
 """
 
 import os
-import json
-from typing import Dict, List, Optional
+import asyncio
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
 
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import (
     RunRealtimeReportRequest,
     RunReportRequest,
     DateRange,
     Dimension,
     Metric,
-    OrderBy
+    OrderBy,
+    BatchRunReportsRequest,
+    BatchRunPivotReportsRequest,
+    FilterExpression,
+    Filter
 )
-from google.oauth2 import service_account
+from google.api_core.exceptions import InvalidArgument
 from pydantic import BaseModel
 
+from services.ga4_clients import ga4_client_registry
+from services.ga4_executor import ga4_executor
+from services.ga4_decoder import decode_rows, decode_totals
+from services.report_cache import report_cache, mark_stale, freshness_scope, CACHE_FRESH, CACHE_STALE
+from services.single_flight import ga4_single_flight
+from services.report_partitioner import report_partitioner
+from services.date_resolver import date_resolver
+from services.property_metadata import property_metadata
+from services.realtime_capabilities import realtime_capabilities, CAPABILITY_PAGE_PATH
+from services.report_query import report_query_compiler, ReportQuery
+from services.query_planner import query_planner
+from services.report_cube import report_cubes, CUBE_DEFINITIONS, CUBE_METRICS
+from services.report_store import report_store
+from services.report_compare import report_comparator, CompareQuery
+from services.report_pivot import report_pivot_compiler, PivotQuery
+from services.cache_warmer import cache_warmer
+
 logger = logging.getLogger(__name__)
 
 class GA4DataService:
     """GA4數據服務類"""
-    
-    def __init__(self):
-        self.property_id = os.getenv("GA4_PROPERTY_ID")
-        self.client = self._get_client()
-    
+
+    # 可合併進 batchRunReports 的歷史報表面板：面板名稱 -> (建立查詢方法, 解析方法, 是否接受 limit)
+    HISTORICAL_PANELS = {
+        "traffic_sources": ("_build_traffic_sources_request", "_parse_traffic_sources", False),
+        "pageviews": ("_build_pageviews_request", "_parse_pageviews", False),
+        "devices": ("_build_devices_request", "_parse_devices", False),
+        "geographic": ("_build_geographic_request", "_parse_geographic", False),
+        "top_pages": ("_build_top_pages_request", "_parse_top_pages", True),
+        "search_terms": ("_build_search_terms_request", "_parse_search_terms", True),
+        "performance": ("_build_performance_request", "_parse_performance", True),
+    }
+
+    # 即時面板：面板名稱 -> 查詢方法
+    REALTIME_PANELS = {
+        "realtime_overview": "get_realtime_overview",
+        "realtime_top_pages": "get_realtime_top_pages",
+    }
+
+    # GA4 batchRunReports 單次最多 5 個報表
+    MAX_BATCH_REPORTS = 5
+
+    # 每日分區同時查詢的上限（GA4 每個屬性的並行請求數有限）
+    MAX_PARTITION_CONCURRENCY = 5
+
+    # 即時總覽的國家 × 設備組合上限（總數另由 GA4 總計列提供）
+    REALTIME_OVERVIEW_LIMIT = 1000
+
+    def __init__(self, property_id: Optional[str] = None, client=None):
+        self.property_id = property_id or os.getenv("GA4_PROPERTY_ID")
+        self.client = client or self._get_client()
+
     def _get_client(self):
-        """初始化GA4客戶端"""
-        service_account_json = os.getenv("SERVICE_ACCOUNT_JSON")
-        if not service_account_json:
-            raise ValueError("SERVICE_ACCOUNT_JSON 環境變數未設定")
-        
-        credentials_info = json.loads(service_account_json)
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=["https://www.googleapis.com/auth/analytics.readonly"]
+        """獲取共用的 Service Account GA4 客戶端"""
+        return ga4_client_registry.get_service_account_client()
+
+    async def _run_report(self, request: RunReportRequest):
+        """執行 run_report（經由回應快取與非阻塞執行層）"""
+        property_metadata.validate(self.property_id, request)
+        date_resolver.canonicalize(request, self.property_id)
+        return await self._execute("run_report", request)
+
+    async def _run_realtime_report(self, request: RunRealtimeReportRequest):
+        """執行 run_realtime_report（經由回應快取與非阻塞執行層）"""
+        return await self._execute("run_realtime_report", request)
+
+    async def _run_partitioned_report(self, request: RunReportRequest):
+        """依日期分區執行 run_report：每日分區各自快取，只查詢缺少或仍在變動的日期後於本地合併；
+        無法精確合併的查詢直接整段查詢"""
+        date_resolver.canonicalize(request, self.property_id)
+        partitions = report_partitioner.split(request, self.property_id)
+        if partitions is None:
+            return await self._run_report(request)
+
+        responses = []
+        for i in range(0, len(partitions), self.MAX_PARTITION_CONCURRENCY):
+            chunk = partitions[i:i + self.MAX_PARTITION_CONCURRENCY]
+            responses.extend(await asyncio.gather(*(self._run_report(partition) for partition in chunk)))
+
+        merged = report_partitioner.merge(request, responses)
+        if merged is None:
+            return await self._run_report(request)
+        return merged
+
+    async def _run_batch_reports(self, requests: List[RunReportRequest]) -> List:
+        """以單一 batchRunReports 執行多個報表（最多 5 個），依序回傳各自的回應"""
+        for request in requests:
+            property_metadata.validate(self.property_id, request)
+            date_resolver.canonicalize(request, self.property_id)
+        batch_request = BatchRunReportsRequest(
+            property=f"properties/{self.property_id}",
+            requests=requests
         )
-        
-        return BetaAnalyticsDataClient(credentials=credentials)
-    
-    def get_realtime_overview(self) -> Dict:
-        """獲取實時總覽數據"""
+        response = await self._execute("batch_run_reports", batch_request)
+        return list(response.reports)
+
+    def _policy_for(self, method: str, request) -> Tuple[int, int]:
+        """依查詢類型與日期範圍決定快取的 (TTL 秒數, 寬限秒數)"""
+        if method == "run_realtime_report":
+            return report_cache.policy_for(request, realtime=True)
+        if method in ("batch_run_reports", "batch_run_pivot_reports"):
+            # 批次回應整體快取，以最短的 TTL 與寬限期為準
+            policies = [report_cache.policy_for(item, property_id=self.property_id) for item in request.requests]
+            return min(ttl for ttl, _ in policies), min(grace for _, grace in policies)
+        return report_cache.policy_for(request, property_id=self.property_id)
+
+    async def _execute(self, method: str, request):
+        """查詢屬性層級的回應快取；過期但在寬限期內時先回傳舊資料並於背景更新，
+        未命中時合併相同的進行中請求後才呼叫 GA4"""
+        cache_key = report_cache.make_key(self.property_id, request)
+        cached, state = report_cache.lookup(cache_key)
+
+        async def fetch():
+            # 每次更新時重新計算快取期限（例如跨日後的相對日期）
+            ttl, grace = self._policy_for(method, request)
+            if method == "run_report":
+                # 已結束日期的查詢優先讀取持久化快照；其餘在同一時間窗內的相容查詢合併為單一 GA4 查詢
+                response = await report_store.load(self.property_id, request)
+                if response is None:
+                    response = await query_planner.run(self.property_id, request, self._call_run_report)
+                    await report_store.save(self.property_id, request, response)
+            else:
+                response = await ga4_executor.run(getattr(self.client, method), request=request)
+            report_cache.set(cache_key, response, ttl, grace)
+            return response
+
+        # 記錄查詢熱度，熱門查詢由預熱排程在到期前更新；
+        # 即時報表的快取期限只有數十秒，預熱會耗盡每小時預算，不列入預熱
+        if method != "run_realtime_report":
+            cache_warmer.record(cache_key, fetch)
+        if state == CACHE_FRESH:
+            return cached
+
+        if state == CACHE_STALE:
+            async def refresh():
+                try:
+                    return await fetch()
+                except Exception as e:
+                    logger.warning(f"背景更新 GA4 快取失敗: {e}")
+                    raise
+
+            # stale-while-revalidate：背景更新（已在更新中則不重複發送）
+            ga4_single_flight.start(cache_key, refresh)
+            mark_stale()
+            return cached
+
+        return await ga4_single_flight.do(cache_key, fetch)
+
+    async def _call_run_report(self, request: RunReportRequest):
+        """直接呼叫 GA4 run_report（不經快取）"""
+        return await ga4_executor.run(self.client.run_report, request=request)
+
+    async def get_active_users(self) -> int:
+        """獲取即時在線人數"""
         request = RunRealtimeReportRequest(
             property=f"properties/{self.property_id}",
-            metrics=[
-                {"name": "activeUsers"},
-                {"name": "screenPageViews"},
-                {"name": "eventCount"}
-            ],
-            dimensions=[
-                {"name": "country"},
-                {"name": "deviceCategory"}
-            ],
-            limit=10
+            metrics=[{"name": "activeUsers"}]
         )
-        
-        response = self.client.run_realtime_report(request=request)
-        
-        # 解析數據
-        active_users = 0
-        page_views = 0
-        events = 0
-        countries = []
-        devices = []
-        
-        if response.rows:
-            for row in response.rows:
-                active_users += int(row.metric_values[0].value)
-                page_views += int(row.metric_values[1].value)
-                events += int(row.metric_values[2].value)
-                
-                country = row.dimension_values[0].value
-                device = row.dimension_values[1].value
-                
-                if country not in [c["name"] for c in countries]:
-                    countries.append({
-                        "name": country,
-                        "users": int(row.metric_values[0].value)
-                    })
-                
-                if device not in [d["name"] for d in devices]:
-                    devices.append({
-                        "name": device,
-                        "users": int(row.metric_values[0].value)
-                    })
-        
+
+        response = await self._run_realtime_report(request)
+
+        rows = decode_rows(response)
+        return rows[0]["activeUsers"] if rows else 0
+
+    async def get_realtime_overview(self) -> Dict:
+        """獲取實時總覽數據"""
+        # 總數由 GA4 計算（metric_aggregations=TOTAL），不受回傳列數限制影響
+        request = report_query_compiler.build(
+            report_query_compiler.preset("realtime_overview", limit=self.REALTIME_OVERVIEW_LIMIT),
+            self.property_id
+        )
+
+        response = await self._run_realtime_report(request)
+
+        # 以字典累加各國家/設備的用戶數
+        countries = {}
+        devices = {}
+        row_totals = {"activeUsers": 0, "screenPageViews": 0, "eventCount": 0}
+
+        for row in decode_rows(response):
+            users = row["activeUsers"]
+            countries[row["country"]] = countries.get(row["country"], 0) + users
+            devices[row["deviceCategory"]] = devices.get(row["deviceCategory"], 0) + users
+            for name in row_totals:
+                row_totals[name] += row[name]
+
+        # 沒有總計列時（例如無數據）退回逐列加總
+        totals = decode_totals(response) or row_totals
+
+        top_countries = sorted(countries.items(), key=lambda item: item[1], reverse=True)[:5]
+
         return {
-            "activeUsers": active_users,
-            "pageViews": page_views,
-            "events": events,
-            "topCountries": sorted(countries, key=lambda x: x["users"], reverse=True)[:5],
-            "deviceBreakdown": devices
+            "activeUsers": totals["activeUsers"],
+            "pageViews": totals["screenPageViews"],
+            "events": totals["eventCount"],
+            "topCountries": [{"name": name, "users": users} for name, users in top_countries],
+            "deviceBreakdown": [{"name": name, "users": users} for name, users in devices.items()]
         }
-    
-    def get_realtime_top_pages(self, limit: int = 10) -> List[Dict]:
+
+    async def get_realtime_top_pages(self, limit: int = 10) -> List[Dict]:
         """獲取實時熱門頁面 (注意：GA4實時API對URL路徑支援有限)"""
-        # 嘗試獲取帶有路徑的實時數據
-        try:
-            request = RunRealtimeReportRequest(
-                property=f"properties/{self.property_id}",
-                metrics=[
-                    {"name": "activeUsers"},
-                    {"name": "screenPageViews"}
-                ],
-                dimensions=[
-                    {"name": "pagePath"},
-                    {"name": "pageTitle"}
-                ],
-                order_bys=[OrderBy(metric={"metric_name": "activeUsers"}, desc=True)],
-                limit=limit
-            )
-            
-            response = self.client.run_realtime_report(request=request)
-            
-            pages = []
-            if response.rows:
-                for row in response.rows:
+        # 已知不支援路徑維度的屬性直接使用回退查詢，記錄過期後才重新探測
+        supported = realtime_capabilities.get(self.property_id, CAPABILITY_PAGE_PATH)
+        if supported is not False:
+            # 嘗試獲取帶有路徑的實時數據
+            try:
+                request = RunRealtimeReportRequest(
+                    property=f"properties/{self.property_id}",
+                    metrics=[
+                        {"name": "activeUsers"},
+                        {"name": "screenPageViews"}
+                    ],
+                    dimensions=[
+                        {"name": "pagePath"},
+                        {"name": "pageTitle"}
+                    ],
+                    order_bys=[OrderBy(metric={"metric_name": "activeUsers"}, desc=True)],
+                    limit=limit
+                )
+
+                response = await self._run_realtime_report(request)
+                realtime_capabilities.record(self.property_id, CAPABILITY_PAGE_PATH, True)
+
+                pages = []
+                for row in decode_rows(response):
                     pages.append({
-                        "pagePath": row.dimension_values[0].value,
-                        "pageTitle": row.dimension_values[1].value if len(row.dimension_values) > 1 else "未知標題",
-                        "activeUsers": int(row.metric_values[0].value),
-                        "pageViews": int(row.metric_values[1].value)
+                        "pagePath": row["pagePath"],
+                        "pageTitle": row.get("pageTitle", "未知標題"),
+                        "activeUsers": row["activeUsers"],
+                        "pageViews": row["screenPageViews"]
                     })
                 return pages
-        except Exception as e:
-            logger.warning(f"無法取得實時頁面路徑數據，回退至螢幕名稱: {e}")
-        
+            except InvalidArgument as e:
+                # GA4 拒絕此維度組合：記錄為不支援
+                realtime_capabilities.record(self.property_id, CAPABILITY_PAGE_PATH, False)
+                logger.warning(f"無法取得實時頁面路徑數據，回退至螢幕名稱: {e}")
+            except Exception as e:
+                # 暫時性錯誤不記錄能力，下次仍會嘗試
+                logger.warning(f"無法取得實時頁面路徑數據，回退至螢幕名稱: {e}")
+
         # 回退方案：使用screenName
-        request = RunRealtimeReportRequest(
-            property=f"properties/{self.property_id}",
-            metrics=[
-                {"name": "activeUsers"},
-                {"name": "screenPageViews"}
-            ],
-            dimensions=[
-                {"name": "unifiedScreenName"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "activeUsers"}, desc=True)],
-            limit=limit
+        request = report_query_compiler.build(
+            report_query_compiler.preset("realtime_top_screens", limit=limit),
+            self.property_id
         )
-        
-        response = self.client.run_realtime_report(request=request)
-        
+
+        response = await self._run_realtime_report(request)
+
         pages = []
-        if response.rows:
-            for row in response.rows:
-                pages.append({
-                    "screenName": row.dimension_values[0].value,
-                    "note": "實時API限制：無法提供完整URL路徑",
-                    "activeUsers": int(row.metric_values[0].value),
-                    "pageViews": int(row.metric_values[1].value)
-                })
-        
+        for row in decode_rows(response):
+            pages.append({
+                "screenName": row["unifiedScreenName"],
+                "note": "實時API限制：無法提供完整URL路徑",
+                "activeUsers": row["activeUsers"],
+                "pageViews": row["screenPageViews"]
+            })
+
         return pages
-    
-    def get_top_pages_analytics(self, start_date: str = "1daysAgo", end_date: str = "today", limit: int = 20) -> List[Dict]:
+
+    async def get_top_pages_analytics(self, start_date: str = "1daysAgo", end_date: str = "today", limit: int = 20) -> List[Dict]:
         """獲取熱門頁面分析數據 (包含完整URL路徑)"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "screenPageViews"},
-                {"name": "totalUsers"},
-                {"name": "sessions"},
-                {"name": "averageSessionDuration"},
-                {"name": "bounceRate"}
-            ],
-            dimensions=[
-                {"name": "pagePath"},
-                {"name": "pageTitle"},
-                {"name": "fullPageUrl"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "screenPageViews"}, desc=True)],
-            limit=limit
+        request = self._build_top_pages_request(start_date, end_date, limit)
+        return self._parse_top_pages(await self._run_partitioned_report(request))
+
+    def _build_top_pages_request(self, start_date: str, end_date: str, limit: int) -> RunReportRequest:
+        """建立熱門頁面查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("top_pages", start_date, end_date, limit), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_top_pages(self, response) -> List[Dict]:
+        """解析熱門頁面數據"""
         pages = []
-        if response.rows:
-            for row in response.rows:
-                pages.append({
-                    "pagePath": row.dimension_values[0].value,
-                    "pageTitle": row.dimension_values[1].value if len(row.dimension_values) > 1 else "未知標題",
-                    "fullUrl": row.dimension_values[2].value if len(row.dimension_values) > 2 else "",
-                    "pageViews": int(row.metric_values[0].value),
-                    "totalUsers": int(row.metric_values[1].value),
-                    "sessions": int(row.metric_values[2].value),
-                    "avgSessionDuration": round(float(row.metric_values[3].value), 2),
-                    "bounceRate": round(float(row.metric_values[4].value) * 100, 2)
-                })
-        
+        for row in decode_rows(response):
+            pages.append({
+                "pagePath": row["pagePath"],
+                "pageTitle": row.get("pageTitle", "未知標題"),
+                "fullUrl": row.get("fullPageUrl", ""),
+                "pageViews": row["screenPageViews"],
+                "totalUsers": row["totalUsers"],
+                "sessions": row["sessions"],
+                "avgSessionDuration": round(row["averageSessionDuration"], 2),
+                "bounceRate": round(row["bounceRate"] * 100, 2)
+            })
+
         return pages
-    
-    def get_traffic_sources(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
+
+    async def get_traffic_sources(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
         """獲取流量來源數據"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "sessions"},
-                {"name": "totalUsers"},
-                {"name": "newUsers"},
-                {"name": "bounceRate"}
-            ],
-            dimensions=[
-                {"name": "sessionDefaultChannelGroup"},
-                {"name": "sessionSource"},
-                {"name": "sessionMedium"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "sessions"}, desc=True)],
-            limit=20
+        request = self._build_traffic_sources_request(start_date, end_date)
+        return self._parse_traffic_sources(await self._run_partitioned_report(request))
+
+    def _build_traffic_sources_request(self, start_date: str, end_date: str) -> RunReportRequest:
+        """建立流量來源查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("traffic_sources", start_date, end_date), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_traffic_sources(self, response) -> List[Dict]:
+        """解析流量來源數據"""
         sources = []
-        if response.rows:
-            for row in response.rows:
-                sources.append({
-                    "channelGroup": row.dimension_values[0].value,
-                    "source": row.dimension_values[1].value,
-                    "medium": row.dimension_values[2].value,
-                    "sessions": int(row.metric_values[0].value),
-                    "totalUsers": int(row.metric_values[1].value),
-                    "newUsers": int(row.metric_values[2].value),
-                    "bounceRate": round(float(row.metric_values[3].value) * 100, 2)
-                })
-        
+        for row in decode_rows(response):
+            sources.append({
+                "channelGroup": row["sessionDefaultChannelGroup"],
+                "source": row["sessionSource"],
+                "medium": row["sessionMedium"],
+                "sessions": row["sessions"],
+                "totalUsers": row["totalUsers"],
+                "newUsers": row["newUsers"],
+                "bounceRate": round(row["bounceRate"] * 100, 2)
+            })
+
         return sources
-    
-    def get_pageviews_analytics(self, start_date: str = "7daysAgo", end_date: str = "today") -> Dict:
+
+    async def get_pageviews_analytics(self, start_date: str = "7daysAgo", end_date: str = "today") -> Dict:
         """獲取頁面瀏覽分析數據"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "screenPageViews"},
-                {"name": "sessions"},
-                {"name": "averageSessionDuration"},
-                {"name": "bounceRate"}
-            ],
-            dimensions=[
-                {"name": "pagePath"},
-                {"name": "pageTitle"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "screenPageViews"}, desc=True)],
-            limit=20
+        request = self._build_pageviews_request(start_date, end_date)
+        return self._parse_pageviews(await self._run_partitioned_report(request))
+
+    def _build_pageviews_request(self, start_date: str, end_date: str) -> RunReportRequest:
+        """建立頁面瀏覽查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("pageviews", start_date, end_date), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_pageviews(self, response) -> Dict:
+        """解析頁面瀏覽數據"""
         total_pageviews = 0
         total_unique_views = 0
         pages = []
-        
-        if response.rows:
-            for row in response.rows:
-                pageviews = int(row.metric_values[0].value)
-                sessions = int(row.metric_values[1].value)
-                avg_duration = float(row.metric_values[2].value)
-                bounce_rate = float(row.metric_values[3].value) * 100
-                
-                total_pageviews += pageviews
-                total_unique_views += sessions
-                
-                pages.append({
-                    "path": row.dimension_values[0].value,
-                    "title": row.dimension_values[1].value or "未知標題",
-                    "pageViews": pageviews,
-                    "sessions": sessions,
-                    "avgSessionDuration": round(avg_duration, 2),
-                    "bounceRate": round(bounce_rate, 2)
-                })
-        
+
+        for row in decode_rows(response):
+            pageviews = row["screenPageViews"]
+            sessions = row["sessions"]
+            avg_duration = row["averageSessionDuration"]
+            bounce_rate = row["bounceRate"] * 100
+
+            total_pageviews += pageviews
+            total_unique_views += sessions
+
+            pages.append({
+                "path": row["pagePath"],
+                "title": row["pageTitle"] or "未知標題",
+                "pageViews": pageviews,
+                "sessions": sessions,
+                "avgSessionDuration": round(avg_duration, 2),
+                "bounceRate": round(bounce_rate, 2)
+            })
+
         return {
             "summary": {
                 "totalPageViews": total_pageviews,
@@ -287,166 +381,126 @@ class GA4DataService:
             },
             "topPages": pages
         }
-    
-    def get_device_analytics(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
+
+    async def get_device_analytics(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
         """獲取設備分析數據"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "totalUsers"},
-                {"name": "sessions"},
-                {"name": "bounceRate"},
-                {"name": "averageSessionDuration"}
-            ],
-            dimensions=[
-                {"name": "deviceCategory"},
-                {"name": "operatingSystem"},
-                {"name": "browser"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "totalUsers"}, desc=True)],
-            limit=15
+        request = self._build_devices_request(start_date, end_date)
+        return self._parse_devices(await self._run_partitioned_report(request))
+
+    def _build_devices_request(self, start_date: str, end_date: str) -> RunReportRequest:
+        """建立設備分析查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("devices", start_date, end_date), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_devices(self, response) -> List[Dict]:
+        """解析設備分析數據"""
         devices = []
-        if response.rows:
-            for row in response.rows:
-                devices.append({
-                    "deviceCategory": row.dimension_values[0].value,
-                    "operatingSystem": row.dimension_values[1].value,
-                    "browser": row.dimension_values[2].value,
-                    "totalUsers": int(row.metric_values[0].value),
-                    "sessions": int(row.metric_values[1].value),
-                    "bounceRate": round(float(row.metric_values[2].value) * 100, 2),
-                    "avgSessionDuration": round(float(row.metric_values[3].value), 2)
-                })
-        
+        for row in decode_rows(response):
+            devices.append({
+                "deviceCategory": row["deviceCategory"],
+                "operatingSystem": row["operatingSystem"],
+                "browser": row["browser"],
+                "totalUsers": row["totalUsers"],
+                "sessions": row["sessions"],
+                "bounceRate": round(row["bounceRate"] * 100, 2),
+                "avgSessionDuration": round(row["averageSessionDuration"], 2)
+            })
+
         return devices
-    
-    def get_geographic_data(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
+
+    async def get_geographic_data(self, start_date: str = "7daysAgo", end_date: str = "today") -> List[Dict]:
         """獲取地理位置數據"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "totalUsers"},
-                {"name": "sessions"},
-                {"name": "screenPageViews"}
-            ],
-            dimensions=[
-                {"name": "country"},
-                {"name": "city"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "totalUsers"}, desc=True)],
-            limit=20
+        request = self._build_geographic_request(start_date, end_date)
+        return self._parse_geographic(await self._run_partitioned_report(request))
+
+    def _build_geographic_request(self, start_date: str, end_date: str) -> RunReportRequest:
+        """建立地理位置查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("geographic", start_date, end_date), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_geographic(self, response) -> List[Dict]:
+        """解析地理位置數據"""
         locations = []
-        if response.rows:
-            for row in response.rows:
-                locations.append({
-                    "country": row.dimension_values[0].value,
-                    "city": row.dimension_values[1].value,
-                    "totalUsers": int(row.metric_values[0].value),
-                    "sessions": int(row.metric_values[1].value),
-                    "pageViews": int(row.metric_values[2].value)
-                })
-        
-        return locations 
-    
-    def get_search_terms(self, start_date: str = "7daysAgo", end_date: str = "today", limit: int = 20) -> List[Dict]:
+        for row in decode_rows(response):
+            locations.append({
+                "country": row["country"],
+                "city": row["city"],
+                "totalUsers": row["totalUsers"],
+                "sessions": row["sessions"],
+                "pageViews": row["screenPageViews"]
+            })
+
+        return locations
+
+    async def get_search_terms(self, start_date: str = "7daysAgo", end_date: str = "today", limit: int = 20) -> List[Dict]:
         """獲取站內搜索數據"""
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "totalUsers"},
-                {"name": "sessions"},
-                {"name": "screenPageViews"},
-                {"name": "averageSessionDuration"}
-            ],
-            dimensions=[
-                {"name": "searchTerm"},
-                {"name": "pagePath"}
-            ],
-            # 注意：站內搜索需要GA4設置才能工作，先嘗試不使用過濾器
-            order_bys=[OrderBy(metric={"metric_name": "totalUsers"}, desc=True)],
-            limit=limit
+        request = self._build_search_terms_request(start_date, end_date, limit)
+        return self._parse_search_terms(await self._run_partitioned_report(request))
+
+    def _build_search_terms_request(self, start_date: str, end_date: str, limit: int) -> RunReportRequest:
+        """建立站內搜索查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("search_terms", start_date, end_date, limit), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_search_terms(self, response) -> List[Dict]:
+        """解析站內搜索數據"""
         searches = []
-        if response.rows:
-            for row in response.rows:
-                searches.append({
-                    "searchTerm": row.dimension_values[0].value,
-                    "searchPage": row.dimension_values[1].value if len(row.dimension_values) > 1 else "",
-                    "totalUsers": int(row.metric_values[0].value),
-                    "sessions": int(row.metric_values[1].value),
-                    "pageViews": int(row.metric_values[2].value),
-                    "avgSessionDuration": round(float(row.metric_values[3].value), 2)
-                })
-        
+        for row in decode_rows(response):
+            searches.append({
+                "searchTerm": row["searchTerm"],
+                "searchPage": row.get("pagePath", ""),
+                "totalUsers": row["totalUsers"],
+                "sessions": row["sessions"],
+                "pageViews": row["screenPageViews"],
+                "avgSessionDuration": round(row["averageSessionDuration"], 2)
+            })
+
         return searches
-    
-    def get_performance_metrics(self, start_date: str = "7daysAgo", end_date: str = "today", limit: int = 20) -> Dict:
+
+    async def get_performance_metrics(self, start_date: str = "7daysAgo", end_date: str = "today", limit: int = 20) -> Dict:
         """獲取頁面效能數據 (Core Web Vitals)"""
-        # 頁面載入時間數據
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "averageSessionDuration"},
-                {"name": "bounceRate"},
-                {"name": "screenPageViews"},
-                {"name": "engagementRate"},
-                {"name": "sessionsPerUser"}
-            ],
-            dimensions=[
-                {"name": "pagePath"},
-                {"name": "pageTitle"},
-                {"name": "deviceCategory"}
-            ],
-            order_bys=[OrderBy(metric={"metric_name": "screenPageViews"}, desc=True)],
-            limit=limit
+        request = self._build_performance_request(start_date, end_date, limit)
+        return self._parse_performance(await self._run_partitioned_report(request))
+
+    def _build_performance_request(self, start_date: str, end_date: str, limit: int) -> RunReportRequest:
+        """建立頁面效能查詢"""
+        return report_query_compiler.build(
+            report_query_compiler.preset("performance", start_date, end_date, limit), self.property_id
         )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_performance(self, response) -> Dict:
+        """解析頁面效能數據"""
         pages_performance = []
         total_bounce_rate = 0
         total_engagement_rate = 0
         total_pages = 0
-        
-        if response.rows:
-            for row in response.rows:
-                bounce_rate = float(row.metric_values[1].value) * 100
-                engagement_rate = float(row.metric_values[3].value) * 100
-                
-                total_bounce_rate += bounce_rate
-                total_engagement_rate += engagement_rate
-                total_pages += 1
-                
-                pages_performance.append({
-                    "pagePath": row.dimension_values[0].value,
-                    "pageTitle": row.dimension_values[1].value if len(row.dimension_values) > 1 else "未知標題",
-                    "deviceCategory": row.dimension_values[2].value if len(row.dimension_values) > 2 else "未知設備",
-                    "avgSessionDuration": round(float(row.metric_values[0].value), 2),
-                    "bounceRate": round(bounce_rate, 2),
-                    "pageViews": int(row.metric_values[2].value),
-                    "engagementRate": round(engagement_rate, 2),
-                    "sessionsPerUser": round(float(row.metric_values[4].value), 2)
-                })
-        
+
+        for row in decode_rows(response):
+            bounce_rate = row["bounceRate"] * 100
+            engagement_rate = row["engagementRate"] * 100
+
+            total_bounce_rate += bounce_rate
+            total_engagement_rate += engagement_rate
+            total_pages += 1
+
+            pages_performance.append({
+                "pagePath": row["pagePath"],
+                "pageTitle": row.get("pageTitle", "未知標題"),
+                "deviceCategory": row.get("deviceCategory", "未知設備"),
+                "avgSessionDuration": round(row["averageSessionDuration"], 2),
+                "bounceRate": round(bounce_rate, 2),
+                "pageViews": row["screenPageViews"],
+                "engagementRate": round(engagement_rate, 2),
+                "sessionsPerUser": round(row["sessionsPerUser"], 2)
+            })
+
         # 計算整體效能指標
         avg_bounce_rate = round(total_bounce_rate / total_pages, 2) if total_pages > 0 else 0
         avg_engagement_rate = round(total_engagement_rate / total_pages, 2) if total_pages > 0 else 0
-        
+
         return {
             "summary": {
                 "totalPagesAnalyzed": total_pages,
@@ -456,37 +510,26 @@ class GA4DataService:
             },
             "pagePerformance": pages_performance
         }
-    
-    def get_single_page_analytics(self, page_path: str, start_date: str = "7daysAgo", end_date: str = "today") -> Dict:
-        """獲取單篇頁面的詳細分析數據"""
+
+    async def get_single_page_analytics(self, page_path: str, start_date: str = "7daysAgo", end_date: str = "today") -> Dict:
+        """獲取單篇頁面的詳細分析數據（每日數據依日期分區，流量來源與設備分布以單一 batchRunReports 取得）"""
         # 處理URL，提取路徑部分
         if page_path.startswith("http"):
             from urllib.parse import urlparse
             parsed = urlparse(page_path)
             page_path = parsed.path
-        
+
         # 確保路徑以 / 開始
         if not page_path.startswith("/"):
             page_path = "/" + page_path
-        
-        # 使用篩選器查詢特定頁面
-        from google.analytics.data_v1beta.types import FilterExpression, Filter
-        
-        # 創建頁面路徑篩選器
-        path_filter = FilterExpression(
-            filter=Filter(
-                field_name="pagePath",
-                string_filter=Filter.StringFilter(
-                    match_type=Filter.StringFilter.MatchType.EXACT,
-                    value=page_path
-                )
-            )
-        )
-        
+
+        # 三個子查詢共用同一個頁面路徑篩選器
+        path_filter = self._build_page_path_filter(page_path)
+        date_ranges = [DateRange(start_date=start_date, end_date=end_date)]
+
         # 基礎數據查詢
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        daily_request = RunReportRequest(
+            date_ranges=date_ranges,
             metrics=[
                 {"name": "screenPageViews"},
                 {"name": "totalUsers"},
@@ -506,10 +549,51 @@ class GA4DataService:
             order_bys=[OrderBy(dimension={"dimension_name": "date"}, desc=False)],
             limit=100
         )
-        
-        response = self.client.run_report(request=request)
-        
-        if not response.rows:
+
+        # 流量來源查詢（針對此頁面）
+        traffic_request = RunReportRequest(
+            date_ranges=date_ranges,
+            metrics=[
+                {"name": "sessions"},
+                {"name": "totalUsers"},
+                {"name": "screenPageViews"}
+            ],
+            dimensions=[
+                {"name": "sessionDefaultChannelGroup"},
+                {"name": "sessionSource"},
+                {"name": "sessionMedium"}
+            ],
+            dimension_filter=path_filter,
+            order_bys=[OrderBy(metric={"metric_name": "sessions"}, desc=True)],
+            limit=10
+        )
+
+        # 設備分布查詢（針對此頁面）
+        device_request = RunReportRequest(
+            date_ranges=date_ranges,
+            metrics=[
+                {"name": "totalUsers"},
+                {"name": "sessions"},
+                {"name": "screenPageViews"}
+            ],
+            dimensions=[
+                {"name": "deviceCategory"},
+                {"name": "operatingSystem"}
+            ],
+            dimension_filter=path_filter,
+            order_bys=[OrderBy(metric={"metric_name": "totalUsers"}, desc=True)],
+            limit=10
+        )
+
+        # 每日數據依日期分區（已結束的日期長期快取），流量來源與設備分布合併為一次 batchRunReports
+        daily_request.property = f"properties/{self.property_id}"
+        response, (traffic_response, device_response) = await asyncio.gather(
+            self._run_partitioned_report(daily_request),
+            self._run_batch_reports([traffic_request, device_request])
+        )
+
+        rows = decode_rows(response)
+        if not rows:
             return {
                 "error": "未找到該頁面的數據",
                 "pagePath": page_path,
@@ -520,7 +604,7 @@ class GA4DataService:
                     "請檢查URL格式是否正確"
                 ]
             }
-        
+
         # 匯總數據
         total_pageviews = 0
         total_users = 0
@@ -528,27 +612,27 @@ class GA4DataService:
         total_engagement_duration = 0
         daily_data = []
         page_title = "未知標題"
-        
-        for row in response.rows:
-            pageviews = int(row.metric_values[0].value)
-            users = int(row.metric_values[1].value)
-            sessions = int(row.metric_values[2].value)
-            avg_duration = float(row.metric_values[3].value)
-            bounce_rate = float(row.metric_values[4].value) * 100
-            engagement_rate = float(row.metric_values[5].value) * 100
-            new_users = int(row.metric_values[6].value)
-            engagement_duration = float(row.metric_values[7].value)
-            
+
+        for row in rows:
+            pageviews = row["screenPageViews"]
+            users = row["totalUsers"]
+            sessions = row["sessions"]
+            avg_duration = row["averageSessionDuration"]
+            bounce_rate = row["bounceRate"] * 100
+            engagement_rate = row["engagementRate"] * 100
+            new_users = row["newUsers"]
+            engagement_duration = row["userEngagementDuration"]
+
             total_pageviews += pageviews
             total_users += users
             total_sessions += sessions
             total_engagement_duration += engagement_duration
-            
+
             if not page_title or page_title == "未知標題":
-                page_title = row.dimension_values[1].value if len(row.dimension_values) > 1 else "未知標題"
-            
+                page_title = row.get("pageTitle", "未知標題")
+
             daily_data.append({
-                "date": row.dimension_values[2].value,
+                "date": row["date"],
                 "pageViews": pageviews,
                 "users": users,
                 "sessions": sessions,
@@ -557,18 +641,12 @@ class GA4DataService:
                 "engagementRate": round(engagement_rate, 2),
                 "newUsers": new_users
             })
-        
+
         # 計算平均值
         avg_bounce_rate = sum(day["bounceRate"] for day in daily_data) / len(daily_data) if daily_data else 0
         avg_engagement_rate = sum(day["engagementRate"] for day in daily_data) / len(daily_data) if daily_data else 0
         avg_session_duration = total_engagement_duration / total_sessions if total_sessions > 0 else 0
-        
-        # 獲取流量來源數據（針對此頁面）
-        traffic_sources = self._get_page_traffic_sources(page_path, start_date, end_date)
-        
-        # 獲取設備分布數據（針對此頁面）
-        device_breakdown = self._get_page_device_breakdown(page_path, start_date, end_date)
-        
+
         return {
             "pagePath": page_path,
             "pageTitle": page_title,
@@ -584,15 +662,13 @@ class GA4DataService:
                 "performanceGrade": self._calculate_performance_grade(avg_bounce_rate, avg_engagement_rate)
             },
             "dailyBreakdown": daily_data,
-            "trafficSources": traffic_sources,
-            "deviceBreakdown": device_breakdown
+            "trafficSources": self._parse_page_traffic_sources(traffic_response),
+            "deviceBreakdown": self._parse_page_device_breakdown(device_response)
         }
-    
-    def _get_page_traffic_sources(self, page_path: str, start_date: str, end_date: str) -> List[Dict]:
-        """獲取特定頁面的流量來源"""
-        from google.analytics.data_v1beta.types import FilterExpression, Filter
-        
-        path_filter = FilterExpression(
+
+    def _build_page_path_filter(self, page_path: str) -> FilterExpression:
+        """建立精確比對頁面路徑的篩選器"""
+        return FilterExpression(
             filter=Filter(
                 field_name="pagePath",
                 string_filter=Filter.StringFilter(
@@ -601,87 +677,196 @@ class GA4DataService:
                 )
             )
         )
-        
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "sessions"},
-                {"name": "totalUsers"},
-                {"name": "screenPageViews"}
-            ],
-            dimensions=[
-                {"name": "sessionDefaultChannelGroup"},
-                {"name": "sessionSource"},
-                {"name": "sessionMedium"}
-            ],
-            dimension_filter=path_filter,
-            order_bys=[OrderBy(metric={"metric_name": "sessions"}, desc=True)],
-            limit=10
-        )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_page_traffic_sources(self, response) -> List[Dict]:
+        """解析特定頁面的流量來源"""
         sources = []
-        if response.rows:
-            for row in response.rows:
-                sources.append({
-                    "channelGroup": row.dimension_values[0].value,
-                    "source": row.dimension_values[1].value,
-                    "medium": row.dimension_values[2].value,
-                    "sessions": int(row.metric_values[0].value),
-                    "users": int(row.metric_values[1].value),
-                    "pageViews": int(row.metric_values[2].value)
-                })
-        
+        for row in decode_rows(response):
+            sources.append({
+                "channelGroup": row["sessionDefaultChannelGroup"],
+                "source": row["sessionSource"],
+                "medium": row["sessionMedium"],
+                "sessions": row["sessions"],
+                "users": row["totalUsers"],
+                "pageViews": row["screenPageViews"]
+            })
+
         return sources
-    
-    def _get_page_device_breakdown(self, page_path: str, start_date: str, end_date: str) -> List[Dict]:
-        """獲取特定頁面的設備分布"""
-        from google.analytics.data_v1beta.types import FilterExpression, Filter
-        
-        path_filter = FilterExpression(
-            filter=Filter(
-                field_name="pagePath",
-                string_filter=Filter.StringFilter(
-                    match_type=Filter.StringFilter.MatchType.EXACT,
-                    value=page_path
-                )
-            )
-        )
-        
-        request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-            metrics=[
-                {"name": "totalUsers"},
-                {"name": "sessions"},
-                {"name": "screenPageViews"}
-            ],
-            dimensions=[
-                {"name": "deviceCategory"},
-                {"name": "operatingSystem"}
-            ],
-            dimension_filter=path_filter,
-            order_bys=[OrderBy(metric={"metric_name": "totalUsers"}, desc=True)],
-            limit=10
-        )
-        
-        response = self.client.run_report(request=request)
-        
+
+    def _parse_page_device_breakdown(self, response) -> List[Dict]:
+        """解析特定頁面的設備分布"""
         devices = []
-        if response.rows:
-            for row in response.rows:
-                devices.append({
-                    "deviceCategory": row.dimension_values[0].value,
-                    "operatingSystem": row.dimension_values[1].value,
-                    "users": int(row.metric_values[0].value),
-                    "sessions": int(row.metric_values[1].value),
-                    "pageViews": int(row.metric_values[2].value)
-                })
-        
+        for row in decode_rows(response):
+            devices.append({
+                "deviceCategory": row["deviceCategory"],
+                "operatingSystem": row["operatingSystem"],
+                "users": row["totalUsers"],
+                "sessions": row["sessions"],
+                "pageViews": row["screenPageViews"]
+            })
+
         return devices
 
+    async def run_query(self, query: ReportQuery) -> Dict:
+        """執行通用報表查詢（驗證、成本限制後經由快取、請求合併與日期分區）"""
+        query = report_query_compiler.resolve(query)
+        request = report_query_compiler.compile(query, self.property_id)
+
+        if query.realtime:
+            response = await self._run_realtime_report(request)
+        else:
+            response = await self._run_partitioned_report(request)
+
+        return {
+            "dimensions": [header.name for header in response.dimension_headers],
+            "metrics": [header.name for header in response.metric_headers],
+            "rows": decode_rows(response),
+            "rowCount": response.row_count,
+            "totals": decode_totals(response) if query.totals else None
+        }
+
+    async def compare_periods(self, compare: CompareQuery) -> Dict:
+        """期間比較：所有期間以單次 run_report（多個日期範圍）查詢，於本地計算差值與成長率"""
+        periods = report_comparator.periods(compare, self.property_id)
+        request = report_comparator.compile(compare, periods, self.property_id)
+        response = await self._run_report(request)
+        return report_comparator.compare(request, response, compare.query, compare.limit, compare.movers)
+
+    async def run_pivot(self, query: PivotQuery) -> Dict:
+        """執行交叉表查詢（單次 run_pivot_report，經由回應快取），回傳密集矩陣"""
+        request = report_pivot_compiler.compile(query, self.property_id)
+        date_resolver.canonicalize(request, self.property_id)
+        response = await self._execute("run_pivot_report", request)
+        return report_pivot_compiler.decode(request, response)
+
+    async def run_pivots(self, queries: List[PivotQuery]) -> List[Dict]:
+        """以單一 batchRunPivotReports 執行多個交叉表（最多 5 個），依序回傳各自的密集矩陣"""
+        if not 1 <= len(queries) <= report_pivot_compiler.MAX_BATCH_REPORTS:
+            raise ValueError(f"交叉表數量必須介於 1 與 {report_pivot_compiler.MAX_BATCH_REPORTS} 之間")
+        if len(queries) == 1:
+            return [await self.run_pivot(queries[0])]
+
+        requests = [report_pivot_compiler.compile(query, self.property_id) for query in queries]
+        for request in requests:
+            date_resolver.canonicalize(request, self.property_id)
+        batch_request = BatchRunPivotReportsRequest(
+            property=f"properties/{self.property_id}",
+            requests=requests
+        )
+        response = await self._execute("batch_run_pivot_reports", batch_request)
+        return [
+            report_pivot_compiler.decode(request, pivot_response)
+            for request, pivot_response in zip(requests, response.pivot_reports)
+        ]
+
+    async def get_breakdown(self, by: List[str], metrics: List[str], start_date: str = "7daysAgo",
+                            end_date: str = "today", limit: int = 20) -> Dict:
+        """依指定維度細分指標：能由報表立方體彙總時在本地計算，否則直接查詢 GA4"""
+        cube_name = report_cubes.select(by, metrics)
+        cube = None
+        if cube_name:
+            request = report_query_compiler.compile(
+                ReportQuery(
+                    dimensions=CUBE_DEFINITIONS[cube_name],
+                    metrics=CUBE_METRICS,
+                    start_date=start_date,
+                    end_date=end_date,
+                    limit=report_partitioner.row_limit
+                ),
+                self.property_id
+            )
+            date_resolver.canonicalize(request, self.property_id)
+            date_range = request.date_ranges[0]
+            cube = report_cubes.get(self.property_id, cube_name, date_range.start_date, date_range.end_date)
+            if cube is None:
+                with freshness_scope() as freshness:
+                    response = await self._run_partitioned_report(request)
+                ttl, _ = report_cache.policy_for(request, property_id=self.property_id)
+                # 部分分區來自過期快取時只用於本次回應，不快取立方體，下次請求改用背景更新後的分區
+                cube = report_cubes.build(
+                    self.property_id, cube_name, date_range.start_date, date_range.end_date, response, ttl,
+                    cache=not freshness.stale
+                )
+
+        if cube is None:
+            result = await self.run_query(ReportQuery(
+                dimensions=by,
+                metrics=metrics,
+                start_date=start_date,
+                end_date=end_date,
+                order_by=[{"field": metrics[0]}] if metrics else [],
+                limit=limit
+            ))
+            return {"dimensions": by, "metrics": metrics, "rows": result["rows"],
+                    "rowCount": result["rowCount"], "source": "ga4"}
+
+        rows = cube.rollup(by, metrics)
+        rows.sort(key=lambda row: row[metrics[0]], reverse=True)
+        return {"dimensions": by, "metrics": metrics, "rows": rows[:limit],
+                "rowCount": len(rows), "source": f"cube:{cube_name}"}
+
+    async def get_analytics_bundle(self, panels: List[str], start_date: str = "7daysAgo",
+                                   end_date: str = "today", limit: int = 20) -> Dict:
+        """一次取得多個面板：可分區的歷史面板依日期分區查詢，其餘每 5 個合併為一次 batchRunReports，即時面板並行查詢"""
+        unknown = [panel for panel in panels if panel not in self.HISTORICAL_PANELS and panel not in self.REALTIME_PANELS]
+        if unknown:
+            raise ValueError(f"不支援的面板: {', '.join(unknown)}")
+
+        # 去除重複並保留順序
+        panels = list(dict.fromkeys(panels))
+        historical = [panel for panel in panels if panel in self.HISTORICAL_PANELS]
+        realtime = [panel for panel in panels if panel in self.REALTIME_PANELS]
+
+        requests = {}
+        for panel in historical:
+            build_method, _, uses_limit = self.HISTORICAL_PANELS[panel]
+            args = (start_date, end_date, limit) if uses_limit else (start_date, end_date)
+            requests[panel] = getattr(self, build_method)(*args)
+
+        # 可依日期分區的面板各自查詢以重用每日分區快取，其餘每 5 個合併為一次 batchRunReports
+        partitioned = [panel for panel in historical if report_partitioner.can_partition(requests[panel], self.property_id)]
+        batched = [panel for panel in historical if panel not in partitioned]
+        batches = [
+            batched[i:i + self.MAX_BATCH_REPORTS]
+            for i in range(0, len(batched), self.MAX_BATCH_REPORTS)
+        ]
+
+        async def run_batch(batch_panels: List[str]) -> Dict:
+            responses = await self._run_batch_reports([requests[panel] for panel in batch_panels])
+            return {
+                panel: getattr(self, self.HISTORICAL_PANELS[panel][1])(response)
+                for panel, response in zip(batch_panels, responses)
+            }
+
+        async def run_partitioned(panel: str) -> Dict:
+            response = await self._run_partitioned_report(requests[panel])
+            return {panel: getattr(self, self.HISTORICAL_PANELS[panel][1])(response)}
+
+        async def run_realtime(panel: str) -> Dict:
+            method = getattr(self, self.REALTIME_PANELS[panel])
+            result = await (method(limit) if panel == "realtime_top_pages" else method())
+            return {panel: result}
+
+        jobs = [(batch, run_batch(batch)) for batch in batches]
+        jobs += [([panel], run_partitioned(panel)) for panel in partitioned]
+        jobs += [([panel], run_realtime(panel)) for panel in realtime]
+        results = await asyncio.gather(*(job for _, job in jobs), return_exceptions=True)
+
+        data = {}
+        errors = {}
+        for (job_panels, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"面板查詢失敗 {job_panels}: {result}")
+                for panel in job_panels:
+                    errors[panel] = str(result)
+            else:
+                data.update(result)
+
+        return {
+            "data": {panel: data[panel] for panel in panels if panel in data},
+            "errors": errors
+        }
+
     def _calculate_performance_grade(self, bounce_rate: float, engagement_rate: float) -> str:
         """計算網站效能等級"""
         if bounce_rate < 25 and engagement_rate > 70:
@@ -1,5 +1,4 @@
 import os
-import json
 from typing import Dict, Optional, List
 from datetime import datetime, timedelta
 import logging
@@ -7,14 +6,14 @@ import logging
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Header, status
 from fastapi.middleware.cors import CORSMiddleware
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import RunRealtimeReportRequest
-from google.oauth2 import service_account
 from pydantic import BaseModel
 import time
 
 # 導入GA4擴展功能
 from ga4_extensions import GA4DataService
+from services.ga4_clients import ga4_client_registry
+from services.ga4_executor import ga4_executor
 
 # 載入環境變數 (本地開發用)
 load_dotenv()
@@ -184,21 +183,9 @@ except Exception as e:
 
 # GA4 客戶端初始化
 def get_ga4_client():
-    """初始化GA4客戶端"""
+    """獲取共用的GA4客戶端（進程內重用，避免每次請求重建通道與憑證）"""
     try:
-        if not SERVICE_ACCOUNT_JSON:
-            raise ValueError("SERVICE_ACCOUNT_JSON 環境變數未設定")
-        
-        # 解析Service Account JSON
-        credentials_info = json.loads(SERVICE_ACCOUNT_JSON)
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=["https://www.googleapis.com/auth/analytics.readonly"]
-        )
-        
-        client = BetaAnalyticsDataClient(credentials=credentials)
-        logger.info("GA4客戶端初始化成功")
-        return client
+        return ga4_client_registry.get_service_account_client()
     
     except Exception as e:
         logger.error(f"GA4客戶端初始化失敗: {str(e)}")
@@ -288,7 +275,7 @@ async def get_active_users(x_api_key: Optional[str] = Header(None)):
         logger.info(f"用戶 {user_name} 請求GA4數據")
         
         # 執行請求
-        response = client.run_realtime_report(request=request)
+        response = await ga4_executor.run(client.run_realtime_report, request=request)
         
         # 解析響應
         active_users = 0
@@ -325,7 +312,7 @@ async def get_realtime_overview(x_api_key: Optional[str] = Header(None)):
     
     try:
         logger.info(f"用戶 {user_name} 請求實時總覽數據")
-        data = ga4_service.get_realtime_overview()
+        data = await ga4_service.get_realtime_overview()
         logger.info(f"實時總覽查詢成功 - 用戶: {user_name}")
         
         return RealtimeOverviewResponse(
@@ -353,7 +340,7 @@ async def get_realtime_top_pages(limit: int = 10, x_api_key: Optional[str] = Hea
     
     try:
         logger.info(f"用戶 {user_name} 請求實時熱門頁面")
-        pages = ga4_service.get_realtime_top_pages(limit=limit)
+        pages = await ga4_service.get_realtime_top_pages(limit=limit)
         logger.info(f"實時熱門頁面查詢成功 - 用戶: {user_name}, 頁面數: {len(pages)}")
         
         return TopPagesResponse(
@@ -385,7 +372,7 @@ async def get_traffic_sources(
     
     try:
         logger.info(f"用戶 {user_name} 請求流量來源分析")
-        sources = ga4_service.get_traffic_sources(start_date=start_date, end_date=end_date)
+        sources = await ga4_service.get_traffic_sources(start_date=start_date, end_date=end_date)
         logger.info(f"流量來源分析成功 - 用戶: {user_name}, 來源數: {len(sources)}")
         
         return TrafficSourcesResponse(
@@ -418,7 +405,7 @@ async def get_pageviews_analytics(
     
     try:
         logger.info(f"用戶 {user_name} 請求頁面瀏覽分析")
-        analytics = ga4_service.get_pageviews_analytics(start_date=start_date, end_date=end_date)
+        analytics = await ga4_service.get_pageviews_analytics(start_date=start_date, end_date=end_date)
         logger.info(f"頁面瀏覽分析成功 - 用戶: {user_name}")
         
         return PageAnalyticsResponse(
@@ -451,7 +438,7 @@ async def get_device_analytics(
     
     try:
         logger.info(f"用戶 {user_name} 請求設備分析數據")
-        devices = ga4_service.get_device_analytics(start_date=start_date, end_date=end_date)
+        devices = await ga4_service.get_device_analytics(start_date=start_date, end_date=end_date)
         logger.info(f"設備分析成功 - 用戶: {user_name}, 設備數: {len(devices)}")
         
         return DeviceAnalyticsResponse(
@@ -484,7 +471,7 @@ async def get_geographic_data(
     
     try:
         logger.info(f"用戶 {user_name} 請求地理位置數據")
-        locations = ga4_service.get_geographic_data(start_date=start_date, end_date=end_date)
+        locations = await ga4_service.get_geographic_data(start_date=start_date, end_date=end_date)
         logger.info(f"地理位置數據查詢成功 - 用戶: {user_name}, 位置數: {len(locations)}")
         
         return GeographicDataResponse(
@@ -518,7 +505,7 @@ async def get_top_pages_analytics(
     
     try:
         logger.info(f"用戶 {user_name} 請求熱門頁面分析數據")
-        pages = ga4_service.get_top_pages_analytics(
+        pages = await ga4_service.get_top_pages_analytics(
             start_date=start_date, 
             end_date=end_date, 
             limit=limit
@@ -557,7 +544,7 @@ async def get_search_terms(
     
     try:
         logger.info(f"用戶 {user_name} 請求站內搜索數據")
-        search_terms = ga4_service.get_search_terms(
+        search_terms = await ga4_service.get_search_terms(
             start_date=start_date, 
             end_date=end_date, 
             limit=limit
@@ -596,7 +583,7 @@ async def get_performance_metrics(
     
     try:
         logger.info(f"用戶 {user_name} 請求頁面效能數據")
-        performance = ga4_service.get_performance_metrics(
+        performance = await ga4_service.get_performance_metrics(
             start_date=start_date, 
             end_date=end_date, 
             limit=limit
@@ -646,7 +633,7 @@ async def get_single_page_analytics(
     
     try:
         logger.info(f"用戶 {user_name} 請求單篇頁面分析: {page_path}")
-        page_data = ga4_service.get_single_page_analytics(
+        page_data = await ga4_service.get_single_page_analytics(
             page_path=page_path,
             start_date=start_date, 
             end_date=end_date
@@ -50,6 +50,7 @@ def custom_openapi():
 - ✅ 頁面瀏覽統計
 - ✅ 設備和地理位置分析
 - ✅ 搜索詞和性能指標
+- ✅ 多面板組合查詢 (單次請求取得整個儀表板)
 
 ### 使用說明
 所有 API 端點都需要認證。請使用 API Key 或 OAuth token 進行身份驗證。
@@ -64,6 +65,7 @@ def custom_openapi():
         "/active-users",
         "/realtime/overview",
         "/realtime/top-pages",
+        "/realtime/stream",
         "/analytics/traffic-sources",
         "/analytics/pageviews",
         "/analytics/devices",
@@ -71,6 +73,18 @@ def custom_openapi():
         "/analytics/top-pages",
         "/analytics/search-terms",
         "/analytics/performance",
+        "/analytics/breakdown",
+        "/analytics/bundle",
+        "/analytics/query",
+        "/analytics/query/presets",
+        "/analytics/compare",
+        "/analytics/pivot",
+        "/analytics/pivot/batch",
+        "/analytics/pivot/presets",
+        "/analytics/sql",
+        "/analytics/sql/tables",
+        "/analytics/saved-reports",
+        "/analytics/saved-reports/{report_id}",
         "/auth/google/url",
         "/auth/status"
     ]
@@ -82,21 +96,19 @@ def custom_openapi():
     
     openapi_schema["paths"] = filtered_paths
     
-    # 添加安全定義
-    openapi_schema["components"] = {
-        "securitySchemes": {
-            "ApiKeyAuth": {
-                "type": "apiKey",
-                "in": "header",
-                "name": "X-API-Key",
-                "description": "API Key 認證"
-            },
-            "BearerAuth": {
-                "type": "http",
-                "scheme": "bearer",
-                "bearerFormat": "JWT",
-                "description": "OAuth 2.0 Bearer Token"
-            }
+    # 添加安全定義（保留請求模型的 schemas）
+    openapi_schema.setdefault("components", {})["securitySchemes"] = {
+        "ApiKeyAuth": {
+            "type": "apiKey",
+            "in": "header",
+            "name": "X-API-Key",
+            "description": "API Key 認證"
+        },
+        "BearerAuth": {
+            "type": "http",
+            "scheme": "bearer",
+            "bearerFormat": "JWT",
+            "description": "OAuth 2.0 Bearer Token"
         }
     }
     
@@ -131,11 +143,13 @@ app.add_middleware(
 # 包含路由模組
 from routers import analytics, auth
 from routers import dashboard
+from routers import saved_reports
 # from routers.user import router as user_router  # 稍後創建
 
 app.include_router(analytics.router)
 app.include_router(auth.router)
 app.include_router(dashboard.router)
+app.include_router(saved_reports.router)
 # app.include_router(user_router)  # 稍後啟用
 
 # 基礎端點
@@ -163,6 +177,25 @@ async def health_check():
     try:
         from database import test_database_connection
         from oauth import oauth_handler
+        from services.ga4_clients import ga4_client_registry
+        from services.ga4_executor import ga4_executor
+        from services.report_cache import report_cache
+        from services.single_flight import ga4_single_flight
+        from services.realtime_poller import realtime_poller
+        from services.ga4_service import ga4_service
+        from services.report_partitioner import report_partitioner
+        from services.date_resolver import date_resolver
+        from services.metadata_sync import metadata_sync
+        from services.realtime_capabilities import realtime_capabilities
+        from services.report_query import report_query_compiler
+        from services.query_planner import query_planner
+        from services.report_cube import report_cubes
+        from services.report_snapshots import report_snapshot_job
+        from services.snapshot_sql import snapshot_sql
+        from services.cache_warmer import cache_warmer
+        from services.saved_reports import saved_report_scheduler
+        from services.report_compare import report_comparator
+        from services.report_pivot import report_pivot_compiler
         
         # 測試資料庫連接
         db_status = "healthy"
@@ -192,6 +225,27 @@ async def health_check():
                 "ga4_analytics": "available",
                 "authentication": "available",
                 "rate_limiting": "active"
+            },
+            "ga4_runtime": {
+                "clients": ga4_client_registry.stats(),
+                "data_services": ga4_service.stats(),
+                "executor": ga4_executor.stats(),
+                "cache": report_cache.stats(),
+                "partitions": report_partitioner.stats(),
+                "dates": date_resolver.stats(),
+                "single_flight": ga4_single_flight.stats(),
+                "realtime_poller": realtime_poller.stats(),
+                "metadata_sync": metadata_sync.stats(),
+                "realtime_capabilities": realtime_capabilities.stats(),
+                "query_compiler": report_query_compiler.stats(),
+                "query_planner": query_planner.stats(),
+                "cubes": report_cubes.stats(),
+                "snapshots": report_snapshot_job.stats(),
+                "snapshot_sql": snapshot_sql.stats(),
+                "cache_warmer": cache_warmer.stats(),
+                "saved_reports": saved_report_scheduler.stats(),
+                "comparisons": report_comparator.stats(),
+                "pivots": report_pivot_compiler.stats()
             }
         }
     
@@ -437,8 +491,64 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"資料庫初始化失敗: {e}")
     
+    try:
+        # 啟動背景即時數據輪詢器
+        from services.realtime_poller import realtime_poller
+        await realtime_poller.start()
+    except Exception as e:
+        logger.warning(f"即時數據輪詢器啟動失敗: {e}")
+    
+    try:
+        # 啟動背景屬性中繼資料同步
+        from services.metadata_sync import metadata_sync
+        await metadata_sync.start()
+    except Exception as e:
+        logger.warning(f"屬性中繼資料同步啟動失敗: {e}")
+    
+    try:
+        # 掛上報表快照儲存並啟動每日快照工作
+        from database import async_session_factory
+        from services.report_store import report_store
+        from services.report_snapshots import report_snapshot_job
+        report_store.attach(async_session_factory)
+        await report_snapshot_job.start()
+    except Exception as e:
+        logger.warning(f"每日報表快照啟動失敗: {e}")
+    
+    try:
+        # 啟動熱門查詢的快取預熱
+        from services.cache_warmer import cache_warmer
+        await cache_warmer.start()
+    except Exception as e:
+        logger.warning(f"快取預熱啟動失敗: {e}")
+    
+    try:
+        # 啟動已儲存報表的更新排程
+        from services.saved_reports import saved_report_scheduler
+        await saved_report_scheduler.start()
+    except Exception as e:
+        logger.warning(f"已儲存報表排程啟動失敗: {e}")
+    
     logger.info("GA4 Analytics API V2 啟動完成")
 
+# 關閉事件
+@app.on_event("shutdown")
+async def shutdown_event():
+    """應用關閉時釋放資源"""
+    from services.ga4_executor import ga4_executor
+    from services.realtime_poller import realtime_poller
+    from services.metadata_sync import metadata_sync
+    from services.report_snapshots import report_snapshot_job
+    from services.cache_warmer import cache_warmer
+    from services.saved_reports import saved_report_scheduler
+    await realtime_poller.stop()
+    await metadata_sync.stop()
+    await report_snapshot_job.stop()
+    await cache_warmer.stop()
+    await saved_report_scheduler.stop()
+    ga4_executor.shutdown()
+    logger.info("GA4 Analytics API V2 已關閉")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
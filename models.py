@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -115,6 +115,42 @@ class GoogleAnalyticsProperty(Base):
     def __repr__(self):
         return f"<GoogleAnalyticsProperty(id={self.id}, property_id='{self.property_id}', name='{self.property_name}')>"
 
+class GA4PropertyMetadata(Base):
+    """GA4 屬性中繼資料模型（可用維度與指標，含自訂定義）"""
+    __tablename__ = "ga4_property_metadata"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    property_id = Column(String(50), unique=True, index=True, nullable=False)
+    dimensions = Column(Text, nullable=False)  # JSON: [{"api_name": ..., "custom": bool}]
+    metrics = Column(Text, nullable=False)  # JSON: [{"api_name": ..., "type": ..., "custom": bool}]
+    synced_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<GA4PropertyMetadata(property_id='{self.property_id}', synced_at={self.synced_at})>"
+
+class GA4ReportSnapshot(Base):
+    """已結束日期的 GA4 報表快照（序列化的 RunReportResponse）"""
+    __tablename__ = "ga4_report_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    request_key = Column(String(120), unique=True, nullable=False)  # 屬性 ID + 查詢內容雜湊
+    property_id = Column(String(50), nullable=False)
+    start_date = Column(String(10), nullable=False)
+    end_date = Column(String(10), nullable=False)
+    row_count = Column(Integer, default=0, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 索引
+    __table_args__ = (
+        Index('ix_ga4_report_snapshots_property_date', 'property_id', 'start_date'),
+    )
+    
+    def __repr__(self):
+        return f"<GA4ReportSnapshot(property_id='{self.property_id}', start_date='{self.start_date}', end_date='{self.end_date}')>"
+
 class UserApiKey(Base):
     """用戶 API Key 模型"""
     __tablename__ = "user_api_keys"
@@ -142,4 +178,33 @@ class UserApiKey(Base):
     )
     
     def __repr__(self):
-        return f"<UserApiKey(id={self.id}, key_name='{self.key_name}', user_id={self.user_id}, property_id={self.property_id})>" 
\ No newline at end of file
+        return f"<UserApiKey(id={self.id}, key_name='{self.key_name}', user_id={self.user_id}, property_id={self.property_id})>"
+
+class SavedReport(Base):
+    """已儲存報表模型（查詢定義與伺服器端更新排程）"""
+    __tablename__ = "saved_reports"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String(150), nullable=False)  # 認證類型 + 用戶 ID / 名稱
+    owner_type = Column(String(20), nullable=False)  # oauth, user_api_key, api_key
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    property_id = Column(String(50), nullable=False)
+    name = Column(String(100), nullable=False)
+    query = Column(Text, nullable=False)  # JSON: ReportQuery
+    refresh_interval = Column(Integer, nullable=False)  # 秒
+    result = Column(Text, nullable=True)  # JSON: 最近一次的查詢結果
+    materialized_at = Column(DateTime(timezone=True), nullable=True)
+    next_refresh_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(Text, nullable=True)
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # 索引
+    __table_args__ = (
+        Index('ix_saved_reports_owner_active', 'owner', 'is_active'),
+        Index('ix_saved_reports_next_refresh', 'is_active', 'next_refresh_at'),
+    )
+    
+    def __repr__(self):
+        return f"<SavedReport(id={self.id}, name='{self.name}', property_id='{self.property_id}')>"
@@ -202,6 +202,8 @@ class GoogleOAuthHandler:
                             properties.append({
                                 "property_id": property_id,
                                 "display_name": property_obj.display_name,
+                                "time_zone": property_obj.time_zone or None,
+                                "currency_code": property_obj.currency_code or None,
                                 "property_type": "GA4",
                                 "parent": account_name,
                                 "create_time": property_obj.create_time.isoformat() if property_obj.create_time else None
@@ -396,6 +398,8 @@ class OAuthUserManager:
             if existing_prop:
                 # 更新現有屬性
                 existing_prop.property_name = prop_info.get("display_name")
+                existing_prop.time_zone = prop_info.get("time_zone") or existing_prop.time_zone
+                existing_prop.currency_code = prop_info.get("currency_code") or existing_prop.currency_code
                 existing_prop.is_active = True
                 existing_prop.updated_at = datetime.utcnow()
             else:
@@ -404,6 +408,8 @@ class OAuthUserManager:
                     user_id=user_id,
                     property_id=property_id,
                     property_name=prop_info.get("display_name"),
+                    time_zone=prop_info.get("time_zone"),
+                    currency_code=prop_info.get("currency_code"),
                     is_active=True
                 )
                 db.add(ga4_property)
@@ -422,6 +428,14 @@ class OAuthUserManager:
         )
         return result.scalar_one_or_none()
     
+    @staticmethod
+    async def get_valid_access_token(db: AsyncSession, user_id: int, oauth_handler: GoogleOAuthHandler) -> Optional[str]:
+        """獲取用戶可用的 access token，已過期時以 refresh token 刷新（供背景工作使用）"""
+        token = await OAuthUserManager.get_user_active_token(db, user_id)
+        if token is not None:
+            return token.access_token
+        return await OAuthUserManager.refresh_user_token(db, user_id, oauth_handler)
+    
     @staticmethod
     async def refresh_user_token(db: AsyncSession, user_id: int, oauth_handler: GoogleOAuthHandler) -> Optional[str]:
         """刷新用戶的 access token"""
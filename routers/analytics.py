@@ -1,16 +1,23 @@
+import json
+import asyncio
 import logging
 from typing import Optional, List
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from google.analytics.data_v1beta.types import RunRealtimeReportRequest
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_db, async_session_factory
 from services.auth_service import AuthenticationResult, auth_service
 from services.ga4_service import ga4_service
-from ga4_extensions import GA4DataService
+from services.report_cache import track_freshness
+from services.realtime_poller import realtime_poller
+from services.report_query import ReportQuery, QUERY_PRESETS
+from services.report_compare import CompareQuery
+from services.report_pivot import PivotQuery, PIVOT_PRESETS
+from services.snapshot_sql import snapshot_sql
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +35,7 @@ class ActiveUsersResponse(BaseModel):
     activeUsers: int
     property_id: str
     timestamp: str
+    stale: bool = False
     status: str = "success"
 
 class ActiveUsersResponseV1(BaseModel):
@@ -36,6 +44,14 @@ class ActiveUsersResponseV1(BaseModel):
     timestamp: str
     status: str = "success"
 
+class SnapshotSQLRequest(BaseModel):
+    sql: str
+    start_date: str = "28daysAgo"
+    end_date: str = "yesterday"
+
+class PivotBatchRequest(BaseModel):
+    pivots: List[PivotQuery]
+
 # 依賴函數
 async def verify_auth(
     request: Request,
@@ -46,42 +62,22 @@ async def verify_auth(
     """認證依賴函數"""
     return await auth_service.verify_authentication(request, x_api_key, authorization, db)
 
-# 初始化GA4數據服務
-try:
-    ga4_data_service = GA4DataService()
-    logger.info("GA4DataService 初始化成功")
-except Exception as e:
-    logger.warning(f"GA4DataService 初始化失敗: {str(e)}")
-    ga4_data_service = None
-
 @router.get("/active-users")
 async def get_active_users(
     auth: AuthenticationResult = Depends(verify_auth)
 ):
     """獲取即時在線人數"""
     try:
-        # 獲取GA4客戶端
-        client = ga4_service.get_ga4_client(auth)
-        
-        if not auth.ga4_property_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="未找到有效的GA4屬性ID"
-            )
-        
-        # 構建請求
-        request_data = RunRealtimeReportRequest(
-            property=f"properties/{auth.ga4_property_id}",
-            metrics=[{"name": "activeUsers"}]
-        )
-        
-        # 執行查詢
-        response = client.run_realtime_report(request_data)
+        freshness = track_freshness()
         
-        # 解析結果
-        active_users = 0
-        if response.rows:
-            active_users = int(response.rows[0].metric_values[0].value)
+        # 優先讀取背景輪詢器的快照，沒有新鮮快照時才即時查詢
+        snapshot = realtime_poller.get_snapshot(auth.ga4_property_id)
+        if snapshot:
+            active_users = snapshot["activeUsers"]
+        else:
+            # 依呼叫者的屬性與憑證取得數據服務（經由快取、請求合併與非阻塞執行層）
+            data_service = ga4_service.get_data_service(auth)
+            active_users = await data_service.get_active_users()
         
         # V1 兼容格式（舊版本）
         if auth.user_type == "api_key":
@@ -99,9 +95,12 @@ async def get_active_users(
             activeUsers=active_users,
             property_id=auth.ga4_property_id,
             timestamp=datetime.now().isoformat(),
+            stale=freshness.stale,
             status="success"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取在線人數失敗: {str(e)}")
         raise HTTPException(
@@ -109,30 +108,128 @@ async def get_active_users(
             detail=f"查詢失敗: {str(e)}"
         )
 
+@router.get("/realtime/stream")
+async def stream_active_users(
+    request: Request,
+    api_key: Optional[str] = None,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
+):
+    """以 Server-Sent Events 推送即時在線人數（數值變動時推送）
+    
+    瀏覽器 EventSource 無法設定標頭，因此也接受 api_key 查詢參數。
+    認證使用獨立的資料庫會話並在串流開始前關閉，避免長連線佔用連線池。
+    """
+    if not realtime_poller.running:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="即時數據輪詢器未運行"
+        )
+    
+    if not async_session_factory:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="資料庫未初始化"
+        )
+    
+    async with async_session_factory() as db:
+        auth = await auth_service.verify_authentication(
+            request, x_api_key or api_key, authorization, db
+        )
+    
+    if not auth.ga4_property_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="未找到有效的GA4屬性ID"
+        )
+    
+    property_id = auth.ga4_property_id
+    heartbeat = max(realtime_poller.interval, 15)
+    
+    # Service Account 無權存取的屬性由訂閱者的 OAuth token 輪詢（輪詢器每次取得有效的 token）
+    fallback_user_id = auth.user_id if auth.user_type == "oauth" else None
+    
+    def format_event(snapshot: dict) -> str:
+        if snapshot.get("stale"):
+            # 輪詢失敗但已有快照：推送最後的數值並標記為過期，串流繼續等待恢復
+            payload = {
+                "property_id": property_id,
+                "activeUsers": snapshot["activeUsers"],
+                "timestamp": snapshot["updated_at"],
+                "error": snapshot["error"]
+            }
+            return f"event: stale\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        if "error" in snapshot:
+            payload = {"property_id": property_id, "error": snapshot["error"]}
+            return f"retry: {realtime_poller.idle_interval * 1000}\nevent: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        payload = {
+            "property_id": property_id,
+            "activeUsers": snapshot["activeUsers"],
+            "timestamp": snapshot["updated_at"]
+        }
+        return f"id: {snapshot['version']}\nevent: active_users\ndata: {json.dumps(payload)}\n\n"
+    
+    async def event_stream():
+        queue = realtime_poller.subscribe(property_id, fallback_user_id)
+        logger.info(f"即時串流已連線 - 用戶: {auth.user_name}, 屬性: {property_id}")
+        try:
+            # 先送出目前的數值（輪詢失敗中則標記為過期），之後只在數值變動時推送
+            snapshot = realtime_poller.latest(property_id)
+            error_event = realtime_poller.error_event(property_id)
+            if snapshot:
+                yield format_event(error_event or snapshot)
+            elif fallback_user_id is None and error_event:
+                # 屬性輪詢失敗且沒有可改用的 OAuth 用戶，不必等到下一次退避後的輪詢
+                yield format_event(error_event)
+                return
+            
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(snapshot)
+                if "error" in snapshot and not snapshot.get("stale"):
+                    # 屬性無法輪詢：送出錯誤事件後結束串流，不再只送 keep-alive
+                    break
+        finally:
+            realtime_poller.unsubscribe(property_id, queue)
+            logger.info(f"即時串流已中斷 - 用戶: {auth.user_name}, 屬性: {property_id}")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/realtime/overview")
 async def get_realtime_overview(
     auth: AuthenticationResult = Depends(verify_auth)
 ):
     """獲取即時數據總覽"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
         
-        # 暫時使用預設的 GA4DataService 實例
-        overview = ga4_data_service.get_realtime_overview()
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        overview = await data_service.get_realtime_overview()
         
         return {
             "user": auth.user_name,
             "user_type": auth.user_type,
             "property_id": auth.ga4_property_id,
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": overview,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取即時總覽失敗: {str(e)}")
         raise HTTPException(
@@ -147,24 +244,25 @@ async def get_realtime_top_pages(
 ):
     """獲取即時熱門頁面"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
         
-        # 暫時使用預設的 GA4DataService 實例
-        top_pages = ga4_data_service.get_realtime_top_pages(limit)
+        top_pages = await data_service.get_realtime_top_pages(limit)
         
         return {
             "user": auth.user_name,
             "user_type": auth.user_type,
             "property_id": auth.ga4_property_id,
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": top_pages,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取即時熱門頁面失敗: {str(e)}")
         raise HTTPException(
@@ -180,14 +278,12 @@ async def get_traffic_sources(
 ):
     """獲取流量來源分析"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
         
-        # 暫時使用預設的 GA4DataService 實例
-        traffic_sources = ga4_data_service.get_traffic_sources(
+        traffic_sources = await data_service.get_traffic_sources(
             start_date, end_date
         )
         
@@ -197,10 +293,13 @@ async def get_traffic_sources(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": traffic_sources,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取流量來源失敗: {str(e)}")
         raise HTTPException(
@@ -216,14 +315,12 @@ async def get_pageviews_analytics(
 ):
     """獲取頁面瀏覽量分析"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
         
-        # 暫時使用預設的 GA4DataService 實例
-        pageviews = ga4_data_service.get_pageviews_analytics(
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        pageviews = await data_service.get_pageviews_analytics(
             start_date, end_date
         )
         
@@ -233,10 +330,13 @@ async def get_pageviews_analytics(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": pageviews,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取頁面瀏覽量失敗: {str(e)}")
         raise HTTPException(
@@ -252,14 +352,12 @@ async def get_device_analytics(
 ):
     """獲取設備分析數據"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
         
-        # 暫時使用預設的 GA4DataService 實例
-        devices = ga4_data_service.get_device_analytics(
+        devices = await data_service.get_device_analytics(
             start_date, end_date
         )
         
@@ -269,10 +367,13 @@ async def get_device_analytics(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": devices,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取設備分析失敗: {str(e)}")
         raise HTTPException(
@@ -288,14 +389,12 @@ async def get_geographic_data(
 ):
     """獲取地理位置數據"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
         
-        # 暫時使用預設的 GA4DataService 實例
-        geographic = ga4_data_service.get_geographic_data(
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        geographic = await data_service.get_geographic_data(
             start_date, end_date
         )
         
@@ -305,10 +404,13 @@ async def get_geographic_data(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": geographic,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取地理位置數據失敗: {str(e)}")
         raise HTTPException(
@@ -325,14 +427,12 @@ async def get_top_pages_analytics(
 ):
     """獲取熱門頁面分析（包含完整URL）"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
         
-        # 暫時使用預設的 GA4DataService 實例
-        top_pages = ga4_data_service.get_top_pages_analytics(
+        top_pages = await data_service.get_top_pages_analytics(
             start_date, end_date, limit
         )
         
@@ -342,10 +442,13 @@ async def get_top_pages_analytics(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": top_pages,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取熱門頁面分析失敗: {str(e)}")
         raise HTTPException(
@@ -362,14 +465,12 @@ async def get_search_terms(
 ):
     """獲取搜索詞分析"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
         
-        # 暫時使用預設的 GA4DataService 實例
-        search_terms = ga4_data_service.get_search_terms(
+        search_terms = await data_service.get_search_terms(
             start_date, end_date, limit
         )
         
@@ -379,10 +480,13 @@ async def get_search_terms(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": search_terms,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取搜索詞分析失敗: {str(e)}")
         raise HTTPException(
@@ -399,14 +503,12 @@ async def get_performance_metrics(
 ):
     """獲取性能指標分析"""
     try:
-        if not ga4_data_service:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GA4數據服務未初始化"
-            )
+        freshness = track_freshness()
         
-        # 暫時使用預設的 GA4DataService 實例
-        performance = ga4_data_service.get_performance_metrics(
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        performance = await data_service.get_performance_metrics(
             start_date, end_date, limit
         )
         
@@ -416,13 +518,360 @@ async def get_performance_metrics(
             "property_id": auth.ga4_property_id,
             "period": {"start_date": start_date, "end_date": end_date},
             "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
             "data": performance,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"獲取性能指標失敗: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"查詢失敗: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+@router.get("/analytics/breakdown")
+async def get_breakdown(
+    by: str = "deviceCategory",
+    metrics: str = "sessions,screenPageViews,bounceRate",
+    start_date: str = "7daysAgo",
+    end_date: str = "today",
+    limit: int = 20,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """依指定維度細分指標（較粗的細分由本地報表立方體彙總，不另外查詢 GA4）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        by_list = [name.strip() for name in by.split(",") if name.strip()]
+        metric_list = [name.strip() for name in metrics.split(",") if name.strip()]
+        if not metric_list:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="請至少指定一個指標"
+            )
+        
+        try:
+            breakdown = await data_service.get_breakdown(
+                by_list, metric_list, start_date, end_date, limit
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "period": {"start_date": start_date, "end_date": end_date},
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": breakdown,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取維度細分失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.get("/analytics/bundle")
+async def get_analytics_bundle(
+    panels: str = "realtime_overview,traffic_sources,devices,geographic,top_pages",
+    start_date: str = "7daysAgo",
+    end_date: str = "today",
+    limit: int = 20,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """一次取得多個分析面板（單次認證、合併 GA4 查詢）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        panel_list = [panel.strip() for panel in panels.split(",") if panel.strip()]
+        if not panel_list:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="請至少指定一個面板"
+            )
+        
+        try:
+            bundle = await data_service.get_analytics_bundle(
+                panel_list, start_date, end_date, limit
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "period": {"start_date": start_date, "end_date": end_date},
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": bundle["data"],
+            "errors": bundle["errors"],
+            "status": "success" if not bundle["errors"] else "partial"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取分析面板組合失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.post("/analytics/query")
+async def run_report_query(
+    query: ReportQuery,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """通用報表查詢（自訂維度、指標、篩選與排序，經驗證與成本限制）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        try:
+            result = await data_service.run_query(query)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "query": query.model_dump(exclude_unset=True),
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": result,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"通用報表查詢失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.get("/analytics/query/presets")
+async def list_query_presets(
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """列出可用的預設查詢"""
+    return {
+        "presets": {
+            name: preset.model_dump(exclude={"preset"})
+            for name, preset in QUERY_PRESETS.items()
+        },
+        "status": "success"
+    }
+
+@router.post("/analytics/compare")
+async def compare_periods(
+    compare: CompareQuery,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """期間比較（最多 4 個期間合併為單次 GA4 查詢，回傳差值、成長率與變動最大的項目）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        try:
+            result = await data_service.compare_periods(compare)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "query": compare.query.model_dump(exclude_unset=True),
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": result,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"期間比較失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.post("/analytics/pivot")
+async def run_pivot_report(
+    query: PivotQuery,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """交叉表查詢（單次 GA4 run_pivot_report，回傳 列 × 欄 的密集矩陣）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        try:
+            result = await data_service.run_pivot(query)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "query": query.model_dump(exclude_unset=True),
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": result,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"交叉表查詢失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.post("/analytics/pivot/batch")
+async def run_pivot_reports(
+    body: PivotBatchRequest,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """一次取得多個交叉表（最多 5 個，合併為單次 GA4 batchRunPivotReports）"""
+    try:
+        freshness = track_freshness()
+        
+        # 依呼叫者的屬性與憑證取得數據服務
+        data_service = ga4_service.get_data_service(auth)
+        
+        try:
+            results = await data_service.run_pivots(body.pivots)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "timestamp": datetime.now().isoformat(),
+            "stale": freshness.stale,
+            "data": results,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批次交叉表查詢失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.get("/analytics/pivot/presets")
+async def list_pivot_presets(
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """列出可用的預設交叉表"""
+    return {
+        "presets": {
+            name: preset.model_dump(exclude={"preset"})
+            for name, preset in PIVOT_PRESETS.items()
+        },
+        "status": "success"
+    }
+
+@router.post("/analytics/sql")
+async def run_snapshot_sql(
+    body: SnapshotSQLRequest,
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """以唯讀 SQL 查詢呼叫者屬性的本地報表快照（不消耗 GA4 配額）"""
+    try:
+        if not auth.ga4_property_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="未找到有效的GA4屬性ID"
+            )
+        
+        try:
+            result = await snapshot_sql.query(
+                auth.ga4_property_id, body.sql, body.start_date, body.end_date
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": auth.ga4_property_id,
+            "period": {"start_date": body.start_date, "end_date": body.end_date},
+            "timestamp": datetime.now().isoformat(),
+            "data": result,
+            "status": "success"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"快照 SQL 查詢失敗: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查詢失敗: {str(e)}"
+        )
+
+@router.get("/analytics/sql/tables")
+async def list_snapshot_tables(
+    auth: AuthenticationResult = Depends(verify_auth)
+):
+    """列出 SQL 查詢可用的快照資料表與欄位"""
+    return {
+        "tables": snapshot_sql.tables(),
+        "status": "success"
+    }
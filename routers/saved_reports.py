@@ -0,0 +1,238 @@
+import json
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+
+from database import get_db
+from models import SavedReport
+from routers.analytics import verify_auth
+from services.auth_service import AuthenticationResult
+from services.ga4_service import ga4_service
+from services.report_query import ReportQuery, report_query_compiler
+from services.saved_reports import saved_report_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 創建路由器
+router = APIRouter(
+    prefix="/analytics/saved-reports",
+    tags=["Saved Reports"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 報表名稱上限（對應 saved_reports.name 欄位長度）
+SAVED_REPORT_NAME_MAX_LENGTH = 100
+
+# 請求模型
+class CreateSavedReportRequest(BaseModel):
+    name: str
+    query: ReportQuery
+    refresh_interval: int = 900
+
+def _summary(report: SavedReport) -> dict:
+    """已儲存報表的摘要（不含結果）"""
+    return {
+        "id": report.id,
+        "name": report.name,
+        "property_id": report.property_id,
+        "query": json.loads(report.query),
+        "refresh_interval": report.refresh_interval,
+        "materialized_at": report.materialized_at.isoformat() if report.materialized_at else None,
+        "next_refresh_at": report.next_refresh_at.isoformat() if report.next_refresh_at else None,
+        "last_error": report.last_error
+    }
+
+async def _get_owned_report(db: AsyncSession, report_id: int, auth: AuthenticationResult) -> SavedReport:
+    """讀取呼叫者擁有的已儲存報表"""
+    result = await db.execute(
+        select(SavedReport).where(
+            SavedReport.id == report_id,
+            SavedReport.owner == saved_report_scheduler.owner_of(auth),
+            SavedReport.is_active == True
+        )
+    )
+    report = result.scalar_one_or_none()
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="已儲存報表不存在"
+        )
+    return report
+
+@router.post("")
+async def create_saved_report(
+    request: CreateSavedReportRequest,
+    auth: AuthenticationResult = Depends(verify_auth),
+    db: AsyncSession = Depends(get_db)
+):
+    """建立已儲存報表（查詢定義 + 更新間隔），並立即產生第一次結果"""
+    try:
+        data_service = ga4_service.get_data_service(auth)
+
+        name = request.name.strip()
+        if not name or len(name) > SAVED_REPORT_NAME_MAX_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"報表名稱長度必須介於 1 與 {SAVED_REPORT_NAME_MAX_LENGTH} 個字元之間"
+            )
+
+        if request.refresh_interval < saved_report_scheduler.min_interval:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"更新間隔不可少於 {saved_report_scheduler.min_interval} 秒"
+            )
+
+        owner = saved_report_scheduler.owner_of(auth)
+        count = await db.scalar(
+            select(func.count(SavedReport.id)).where(
+                SavedReport.owner == owner,
+                SavedReport.is_active == True
+            )
+        )
+        if count >= saved_report_scheduler.max_per_owner:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"已儲存報表數量已達上限 {saved_report_scheduler.max_per_owner}"
+            )
+
+        # 建立前先驗證查詢（欄位與成本限制）
+        try:
+            query = report_query_compiler.resolve(request.query)
+            report_query_compiler.compile(query, auth.ga4_property_id)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+        report = SavedReport(
+            owner=owner,
+            owner_type=auth.user_type,
+            user_id=auth.user_id,
+            property_id=auth.ga4_property_id,
+            name=name,
+            query=query.model_dump_json(),
+            refresh_interval=request.refresh_interval,
+            next_refresh_at=datetime.utcnow(),
+            is_active=True
+        )
+        db.add(report)
+        await db.flush()
+
+        await saved_report_scheduler.materialize(report, data_service)
+        await db.commit()
+        await db.refresh(report)
+
+        return {
+            "success": True,
+            "message": "已儲存報表建立成功",
+            "saved_report": _summary(report)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"建立已儲存報表失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="建立已儲存報表失敗"
+        )
+
+@router.get("")
+async def list_saved_reports(
+    auth: AuthenticationResult = Depends(verify_auth),
+    db: AsyncSession = Depends(get_db)
+):
+    """列出呼叫者的已儲存報表"""
+    try:
+        result = await db.execute(
+            select(SavedReport).where(
+                SavedReport.owner == saved_report_scheduler.owner_of(auth),
+                SavedReport.is_active == True
+            ).order_by(SavedReport.created_at.desc())
+        )
+
+        return {
+            "success": True,
+            "saved_reports": [_summary(report) for report in result.scalars().all()]
+        }
+
+    except Exception as e:
+        logger.error(f"獲取已儲存報表失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="獲取已儲存報表失敗"
+        )
+
+@router.get("/{report_id}")
+async def get_saved_report(
+    report_id: int,
+    auth: AuthenticationResult = Depends(verify_auth),
+    db: AsyncSession = Depends(get_db)
+):
+    """取得已儲存報表最近一次產生的結果（不即時查詢 GA4）
+
+    status：success 為最新結果；stale 為最近一次更新失敗、回傳先前的結果；
+    pending 為尚未產生結果；error 為尚未產生結果且更新失敗（原因見 saved_report.last_error）。
+    """
+    try:
+        report = await _get_owned_report(db, report_id, auth)
+        materialized_at, data = saved_report_scheduler.get_result(report)
+        if data is None:
+            result_status = "error" if report.last_error else "pending"
+        else:
+            result_status = "stale" if report.last_error else "success"
+
+        return {
+            "user": auth.user_name,
+            "user_type": auth.user_type,
+            "property_id": report.property_id,
+            "saved_report": _summary(report),
+            "materialized_at": materialized_at.isoformat() if materialized_at else None,
+            "timestamp": datetime.now().isoformat(),
+            "data": data,
+            "status": result_status
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取已儲存報表結果失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="獲取已儲存報表結果失敗"
+        )
+
+@router.delete("/{report_id}")
+async def delete_saved_report(
+    report_id: int,
+    auth: AuthenticationResult = Depends(verify_auth),
+    db: AsyncSession = Depends(get_db)
+):
+    """刪除已儲存報表"""
+    try:
+        report = await _get_owned_report(db, report_id, auth)
+
+        # 軟刪除
+        report.is_active = False
+        report.updated_at = datetime.utcnow()
+        await db.commit()
+        saved_report_scheduler.forget(report_id)
+
+        return {
+            "success": True,
+            "message": "已儲存報表已刪除"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"刪除已儲存報表失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="刪除已儲存報表失敗"
+        )
@@ -10,6 +10,7 @@ from sqlalchemy import select
 
 from models import User, OAuthToken, UserApiKey, GoogleAnalyticsProperty, ApiUsageLog
 from oauth import oauth_handler, OAuthUserManager
+from services.date_resolver import date_resolver
 
 logger = logging.getLogger(__name__)
 
@@ -238,6 +239,8 @@ class AuthService:
                     
                     # 如果 API Key 沒有關聯特定屬性，使用默認的 GA4_PROPERTY_ID
                     property_id = property_obj.property_id if property_obj else self.GA4_PROPERTY_ID
+                    if property_obj:
+                        date_resolver.register_time_zone(property_obj.property_id, property_obj.time_zone)
                     
                     logger.info(f"用戶 API Key 認證成功 - 用戶: {user.email}, GA4屬性: {property_id}")
                     
@@ -300,7 +303,11 @@ class AuthService:
                 )
                 default_property = result.scalar_one_or_none()
             
-            return default_property.property_id if default_property else None
+            if not default_property:
+                return None
+            
+            date_resolver.register_time_zone(default_property.property_id, default_property.time_zone)
+            return default_property.property_id
         
         except Exception as e:
             logger.error(f"獲取用戶預設屬性失敗: {e}")
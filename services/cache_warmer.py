@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Optional
+
+from services.report_cache import report_cache
+from services.single_flight import ga4_single_flight
+
+logger = logging.getLogger(__name__)
+
+class CacheWarmer:
+    """依使用熱度預熱快取
+
+    以記憶體中的衰減計數器記錄每個快取鍵（屬性 + 查詢）的請求熱度，
+    熱門查詢在快取到期前由背景更新，儀表板的常用查詢不會遇到冷快取；
+    每小時的 GA4 更新次數受預算限制，預算不足時優先更新最熱門的查詢。
+    即時報表不列入預熱，在線人數由即時數據輪詢器負責。
+    更新失敗的查詢依指數退避重試，連續失敗達上限後停止追蹤（例如更新函數持有的 OAuth token 已過期）。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_CACHE_WARMING", "true").lower() == "true"
+        self.interval = int(os.getenv("CACHE_WARM_INTERVAL", "5"))
+        self.lead = int(os.getenv("CACHE_WARM_LEAD_SECONDS", "15"))
+        self.min_score = float(os.getenv("CACHE_WARM_MIN_SCORE", "3"))
+        self.half_life = int(os.getenv("CACHE_WARM_HALF_LIFE", "900"))
+        self.budget = int(os.getenv("CACHE_WARM_BUDGET_PER_HOUR", "600"))
+        self.max_tracked = int(os.getenv("CACHE_WARM_MAX_TRACKED", "1000"))
+        self.max_failures = int(os.getenv("CACHE_WARM_MAX_FAILURES", "3"))
+
+        self._tracked = OrderedDict()  # 快取鍵 -> [熱度, 最後請求時間, 更新函數, 連續失敗次數, 下次可重試時間]
+        self._refreshed_at = deque()  # 最近一小時內的更新時間
+        self.refreshed = 0
+        self.skipped_budget = 0
+        self.failed = 0
+        self.abandoned = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """啟動預熱排程"""
+        if not self.enabled:
+            logger.info("快取預熱已停用")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"快取預熱已啟動 - 每小時預算: {self.budget}")
+
+    async def stop(self):
+        """停止預熱排程"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("快取預熱已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record(self, key: str, refresh: Callable[[], Awaitable[Any]]):
+        """記錄一次查詢與其更新函數（預熱排程未啟動時不記錄）"""
+        if not self.running:
+            return
+
+        now = time.monotonic()
+        entry = self._tracked.get(key)
+        if entry is None:
+            self._tracked[key] = [1.0, now, refresh, 0, 0.0]
+            while len(self._tracked) > self.max_tracked:
+                self._tracked.popitem(last=False)
+            return
+
+        entry[0] = self._decayed(entry, now) + 1
+        entry[1] = now
+        entry[2] = refresh
+        self._tracked.move_to_end(key)
+
+    def stats(self) -> dict:
+        """預熱狀態（供健康檢查使用）"""
+        now = time.monotonic()
+        return {
+            "running": self.running,
+            "tracked": len(self._tracked),
+            "hot": len([entry for entry in self._tracked.values() if self._decayed(entry, now) >= self.min_score]),
+            "refreshed": self.refreshed,
+            "skipped_budget": self.skipped_budget,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+            "budget_per_hour": self.budget,
+            "budget_used": len(self._refreshed_at)
+        }
+
+    async def _run(self):
+        """預熱主循環"""
+        while True:
+            try:
+                self.warm_due()
+            except Exception as e:
+                logger.error(f"快取預熱循環失敗: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    def warm_due(self):
+        """更新即將到期的熱門查詢（依熱度排序，受每小時預算限制）"""
+        now = time.monotonic()
+        while self._refreshed_at and now - self._refreshed_at[0] >= 3600:
+            self._refreshed_at.popleft()
+
+        due = []
+        for key, entry in list(self._tracked.items()):
+            score = self._decayed(entry, now)
+            if score < self.min_score / 4:
+                # 已冷卻的查詢不再追蹤
+                del self._tracked[key]
+                continue
+            if score < self.min_score or now < entry[4] or ga4_single_flight.in_flight(key):
+                continue
+            # 已過期的項目不預熱：由下一次請求的 stale-while-revalidate 更新
+            expires_in = report_cache.expires_in(key)
+            if expires_in is not None and 0 <= expires_in <= self.lead:
+                due.append((score, key, entry[2]))
+
+        due.sort(key=lambda item: item[0], reverse=True)
+        for position, (_, key, refresh) in enumerate(due):
+            if len(self._refreshed_at) >= self.budget:
+                self.skipped_budget += len(due) - position
+                break
+            ga4_single_flight.start(key, self._guarded(key, refresh))
+            self._refreshed_at.append(now)
+            self.refreshed += 1
+
+    def _guarded(self, key: str, refresh: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+        async def run():
+            try:
+                result = await refresh()
+            except Exception as e:
+                self._record_failure(key)
+                logger.warning(f"快取預熱更新失敗: {e}")
+                raise
+            entry = self._tracked.get(key)
+            if entry is not None:
+                entry[3] = 0
+                entry[4] = 0.0
+            return result
+        return run
+
+    def _record_failure(self, key: str):
+        """記錄更新失敗：依連續失敗次數指數退避，達上限後停止追蹤"""
+        self.failed += 1
+        entry = self._tracked.get(key)
+        if entry is None:
+            return
+
+        entry[3] += 1
+        if entry[3] >= self.max_failures:
+            del self._tracked[key]
+            self.abandoned += 1
+            logger.warning(f"快取預熱連續失敗 {entry[3]} 次，停止追蹤 - 快取鍵: {key}")
+            return
+        entry[4] = time.monotonic() + self.interval * 2 ** entry[3]
+
+    def _decayed(self, entry: list, now: float) -> float:
+        """依半衰期衰減後的熱度"""
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+# 全局快取預熱實例
+cache_warmer = CacheWarmer()
@@ -0,0 +1,122 @@
+import os
+import re
+import logging
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+_DAYS_AGO_PATTERN = re.compile(r"^(\d+)daysAgo$")
+
+class DateResolver:
+    """以 GA4 屬性時區解析日期
+
+    GA4 以屬性時區解讀 today / yesterday / NdaysAgo。這裡將相對日期轉換為
+    屬性時區下的絕對 ISO 日期，使快取鍵跨日仍然正確，且與等價的絕對日期範圍共用；
+    同時計算每個日期的數據何時跨日、何時處理完成而不再變動。
+    """
+
+    def __init__(self):
+        self.default_time_zone = self._load_zone(os.getenv("GA4_DEFAULT_TIME_ZONE"))
+        # GA4 數據處理延遲：日期結束後經過此時數視為不再變動
+        self.settle_hours = int(os.getenv("GA4_DATA_SETTLE_HOURS", "48"))
+        self._time_zones: Dict[str, tzinfo] = {}  # property_id -> 時區
+
+    def register_time_zone(self, property_id: str, time_zone: Optional[str]):
+        """記錄屬性的時區（來自 GoogleAnalyticsProperty.time_zone）"""
+        if not property_id or not time_zone:
+            return
+        zone = self._load_zone(time_zone)
+        if zone is not None:
+            self._time_zones[property_id] = zone
+
+    def time_zone_for(self, property_id: Optional[str]) -> Optional[tzinfo]:
+        """屬性的時區，未知時使用預設時區（未設定時為伺服器本地時區）"""
+        return self._time_zones.get(property_id, self.default_time_zone)
+
+    def now(self, property_id: Optional[str] = None) -> datetime:
+        """屬性時區的目前時間（含時區資訊）"""
+        zone = self.time_zone_for(property_id)
+        return datetime.now(zone) if zone is not None else datetime.now().astimezone()
+
+    def today(self, property_id: Optional[str] = None) -> date:
+        """屬性時區的今天"""
+        return self.now(property_id).date()
+
+    def resolve(self, value: str, today: date) -> Optional[date]:
+        """將 GA4 日期字串轉換為日期，無法辨識時回傳 None"""
+        if value == "today":
+            return today
+        if value == "yesterday":
+            return today - timedelta(days=1)
+
+        match = _DAYS_AGO_PATTERN.match(value)
+        if match:
+            return today - timedelta(days=int(match.group(1)))
+
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def is_absolute(value: str) -> bool:
+        """是否為 YYYY-MM-DD 格式的絕對日期"""
+        try:
+            date.fromisoformat(value)
+            return True
+        except ValueError:
+            return False
+
+    def canonicalize(self, request, property_id: Optional[str] = None):
+        """將查詢中的相對日期就地改寫為屬性時區下的絕對日期，回傳同一個查詢"""
+        date_ranges = getattr(request, "date_ranges", None)
+        if not date_ranges:
+            return request
+
+        today = self.today(property_id)
+        for date_range in date_ranges:
+            start = self.resolve(date_range.start_date, today)
+            end = self.resolve(date_range.end_date, today)
+            # 無法辨識的日期保留原值，交由 GA4 回報錯誤
+            if start is not None:
+                date_range.start_date = start.isoformat()
+            if end is not None:
+                date_range.end_date = end.isoformat()
+        return request
+
+    def day_end(self, day: date, property_id: Optional[str] = None) -> datetime:
+        """指定日期在屬性時區的結束時刻（隔日午夜）"""
+        zone = self.time_zone_for(property_id) or self.now().tzinfo
+        return datetime.combine(day + timedelta(days=1), time.min, tzinfo=zone)
+
+    def immutable_at(self, day: date, property_id: Optional[str] = None) -> datetime:
+        """指定日期的數據不再變動的時刻"""
+        return self.day_end(day, property_id) + timedelta(hours=self.settle_hours)
+
+    def seconds_until(self, moment: datetime, property_id: Optional[str] = None) -> int:
+        """距離指定時刻的秒數（至少 1 秒）"""
+        return max(int((moment - self.now(property_id)).total_seconds()), 1)
+
+    def stats(self) -> dict:
+        """時區狀態（供健康檢查使用）"""
+        return {
+            "default_time_zone": str(self.default_time_zone or "local"),
+            "properties_with_time_zone": len(self._time_zones),
+            "settle_hours": self.settle_hours
+        }
+
+    @staticmethod
+    def _load_zone(name: Optional[str]) -> Optional[tzinfo]:
+        """載入 IANA 時區，無效或系統缺少時區資料時回傳 None"""
+        if not name:
+            return None
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            logger.warning(f"無法載入時區 {name}: {e}")
+            return None
+
+# 全局日期解析實例
+date_resolver = DateResolver()
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from google.analytics.data_v1beta import BetaAnalyticsDataClient
+from google.oauth2 import service_account
+from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+GA4_SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
+
+class GA4ClientRegistry:
+    """長期存活的 GA4 客戶端註冊表
+
+    - Service Account 客戶端：每個進程共用一個
+    - OAuth 客戶端：以用戶 ID 為鍵的 LRU，token 輪換或閒置逾時即淘汰
+
+    淘汰只移除註冊表的參考而不關閉通道：進行中的查詢、數據服務快取與背景工作可能仍持有該客戶端，
+    gRPC 通道在最後一個參考釋放後由垃圾回收關閉。
+    """
+
+    def __init__(self):
+        self.max_oauth_clients = int(os.getenv("GA4_OAUTH_CLIENT_CACHE_SIZE", "100"))
+        self.oauth_idle_timeout = int(os.getenv("GA4_OAUTH_CLIENT_IDLE_SECONDS", "1800"))
+        self._service_account_client = None
+        self._service_account_admin_client = None
+        self._oauth_clients = OrderedDict()  # user_id -> (access_token, client, last_used)
+        self._lock = threading.Lock()
+
+    def get_service_account_client(self) -> BetaAnalyticsDataClient:
+        """獲取共用的 Service Account 客戶端（首次呼叫時建立）"""
+        if self._service_account_client is not None:
+            return self._service_account_client
+
+        with self._lock:
+            if self._service_account_client is None:
+                self._service_account_client = BetaAnalyticsDataClient(
+                    credentials=self._load_service_account_credentials()
+                )
+                logger.info("GA4 Service Account 客戶端已建立")
+            return self._service_account_client
+
+    def get_service_account_admin_client(self):
+        """獲取共用的 Service Account Admin API 客戶端（首次呼叫時建立）"""
+        if self._service_account_admin_client is not None:
+            return self._service_account_admin_client
+
+        # Admin API 只用於背景中繼資料同步，延遲載入
+        from google.analytics.admin import AnalyticsAdminServiceClient
+
+        with self._lock:
+            if self._service_account_admin_client is None:
+                self._service_account_admin_client = AnalyticsAdminServiceClient(
+                    credentials=self._load_service_account_credentials()
+                )
+                logger.info("GA4 Service Account Admin 客戶端已建立")
+            return self._service_account_admin_client
+
+    def get_oauth_client(self, user_id: int, access_token: str) -> BetaAnalyticsDataClient:
+        """獲取指定 OAuth 用戶的客戶端，token 變更時重建"""
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._oauth_clients.get(user_id)
+            if entry and entry[0] == access_token:
+                self._oauth_clients[user_id] = (access_token, entry[1], now)
+                self._oauth_clients.move_to_end(user_id)
+                return entry[1]
+
+            # token 已輪換時直接取代舊客戶端（舊客戶端不關閉，仍在使用者可完成查詢）
+            client = BetaAnalyticsDataClient(credentials=Credentials(token=access_token))
+            self._oauth_clients[user_id] = (access_token, client, now)
+            self._oauth_clients.move_to_end(user_id)
+            logger.info(f"GA4 OAuth 客戶端已建立 - 用戶 ID: {user_id}")
+
+            while len(self._oauth_clients) > self.max_oauth_clients:
+                self._oauth_clients.popitem(last=False)
+
+        return client
+
+    def invalidate_oauth_client(self, user_id: int):
+        """移除指定用戶的客戶端（例如 token 被撤銷時）"""
+        with self._lock:
+            self._oauth_clients.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """註冊表狀態（供健康檢查使用）"""
+        return {
+            "service_account_client": self._service_account_client is not None,
+            "oauth_clients": len(self._oauth_clients),
+            "max_oauth_clients": self.max_oauth_clients
+        }
+
+    def _evict_idle(self, now: float):
+        """淘汰閒置逾時的 OAuth 客戶端（呼叫者需持有鎖）"""
+        # OrderedDict 依最近使用排序，從最舊的開始檢查即可
+        while self._oauth_clients:
+            user_id, (_, _, last_used) = next(iter(self._oauth_clients.items()))
+            if now - last_used < self.oauth_idle_timeout:
+                break
+            del self._oauth_clients[user_id]
+
+    def _load_service_account_credentials(self):
+        """解析 SERVICE_ACCOUNT_JSON 並建立憑證"""
+        service_account_json = os.getenv("SERVICE_ACCOUNT_JSON")
+        if not service_account_json:
+            raise ValueError("SERVICE_ACCOUNT_JSON 環境變數未設定")
+
+        try:
+            credentials_info = json.loads(service_account_json)
+        except json.JSONDecodeError:
+            # 預處理 SERVICE_ACCOUNT_JSON - 修正控制字符問題
+            processed_json = service_account_json.replace('\\n', '\\\\n').replace('\n', '\\n')
+            credentials_info = json.loads(processed_json)
+
+        return service_account.Credentials.from_service_account_info(
+            credentials_info,
+            scopes=GA4_SCOPES
+        )
+
+# 全局 GA4 客戶端註冊表
+ga4_client_registry = GA4ClientRegistry()
@@ -0,0 +1,173 @@
+from typing import Callable, Dict, List
+
+from google.analytics.data_v1beta.types import MetricType, RunReportResponse
+
+def _to_int(value: str) -> int:
+    return int(value) if value else 0
+
+def _to_float(value: str) -> float:
+    return float(value) if value else 0.0
+
+def _metric_converter(metric_type: int) -> Callable[[str], object]:
+    """依指標型別決定轉換函數（每個欄位只決定一次）"""
+    if metric_type == MetricType.TYPE_INTEGER:
+        return _to_int
+    return _to_float
+
+def _raw(message):
+    """取得 proto-plus 包裝下的原始 protobuf 訊息"""
+    return type(message).pb(message) if hasattr(type(message), "pb") else message
+
+def decode_rows(response) -> List[Dict]:
+    """將 GA4 報表回應解碼為 {維度/指標名稱: 值} 的列表
+
+    直接讀取底層 protobuf 訊息，略過 proto-plus 對每個欄位的包裝與型別轉換；
+    欄位依 dimension_headers / metric_headers 對應，指標型別每欄只判斷一次。
+    """
+    raw = _raw(response)
+    dimension_names = [header.name for header in raw.dimension_headers]
+    metric_names = [header.name for header in raw.metric_headers]
+    converters = [_metric_converter(header.type_) for header in raw.metric_headers]
+    metric_columns = list(zip(metric_names, converters))
+
+    rows = []
+    for row in raw.rows:
+        record = {
+            name: value.value
+            for name, value in zip(dimension_names, row.dimension_values)
+        }
+        for (name, convert), value in zip(metric_columns, row.metric_values):
+            record[name] = convert(value.value)
+        rows.append(record)
+
+    return rows
+
+def decode_totals(response) -> Dict:
+    """解碼 metric_aggregations=[TOTAL] 產生的總計列為 {指標名稱: 值}，沒有總計時回傳空字典"""
+    raw = _raw(response)
+    if not raw.totals:
+        return {}
+
+    converters = [
+        (header.name, _metric_converter(header.type_)) for header in raw.metric_headers
+    ]
+    return {
+        name: convert(value.value)
+        for (name, convert), value in zip(converters, raw.totals[0].metric_values)
+    }
+
+def decode_range_totals(response) -> Dict[str, Dict]:
+    """解碼多個日期範圍查詢的總計列為 {日期範圍名稱: {指標名稱: 值}}（每個日期範圍一列總計）"""
+    raw = _raw(response)
+    dimension_names = [header.name for header in raw.dimension_headers]
+    if "dateRange" not in dimension_names:
+        return {}
+
+    position = dimension_names.index("dateRange")
+    converters = [
+        (header.name, _metric_converter(header.type_)) for header in raw.metric_headers
+    ]
+    return {
+        row.dimension_values[position].value: {
+            name: convert(value.value)
+            for (name, convert), value in zip(converters, row.metric_values)
+        }
+        for row in raw.totals
+    }
+
+def decode_pivot(response, row_fields: List[str], column_fields: List[str]) -> Dict:
+    """將 run_pivot_report 回應解碼為密集矩陣：values[指標][列][欄]，沒有數據的格子為 0
+
+    列與欄的順序依 GA4 的 pivot 標題（已依 pivot 的排序與 limit 選出）。
+    """
+    raw = _raw(response)
+    dimension_names = [header.name for header in raw.dimension_headers]
+    row_positions = [dimension_names.index(name) for name in row_fields]
+    column_positions = [dimension_names.index(name) for name in column_fields]
+
+    row_headers = [
+        tuple(value.value for value in header.dimension_values)
+        for header in raw.pivot_headers[0].pivot_dimension_headers
+    ]
+    column_headers = [
+        tuple(value.value for value in header.dimension_values)
+        for header in raw.pivot_headers[1].pivot_dimension_headers
+    ]
+    row_index = {key: position for position, key in enumerate(row_headers)}
+    column_index = {key: position for position, key in enumerate(column_headers)}
+
+    metric_names = [header.name for header in raw.metric_headers]
+    converters = [_metric_converter(header.type_) for header in raw.metric_headers]
+    values = {name: [[0] * len(column_headers) for _ in row_headers] for name in metric_names}
+    for row in raw.rows:
+        dimension_values = row.dimension_values
+        row_position = row_index.get(tuple(dimension_values[i].value for i in row_positions))
+        column_position = column_index.get(tuple(dimension_values[i].value for i in column_positions))
+        if row_position is None or column_position is None:
+            continue
+        for name, convert, value in zip(metric_names, converters, row.metric_values):
+            values[name][row_position][column_position] = convert(value.value)
+
+    return {
+        "rows": row_fields,
+        "columns": column_fields,
+        "metrics": metric_names,
+        "row_headers": [list(key) for key in row_headers],
+        "column_headers": [list(key) for key in column_headers],
+        "values": values,
+        "rowCount": raw.pivot_headers[0].row_count,
+        "columnCount": raw.pivot_headers[1].row_count
+    }
+
+def sort_rows(rows: List[Dict], order_bys) -> List[Dict]:
+    """依查詢的 order_bys 就地排序已解碼的列（由次要排序鍵往主要排序鍵穩定排序）"""
+    for order_by in reversed(order_bys):
+        if order_by.metric.metric_name:
+            name = order_by.metric.metric_name
+            rows.sort(key=lambda row: row.get(name, 0), reverse=order_by.desc)
+        elif order_by.dimension.dimension_name:
+            name = order_by.dimension.dimension_name
+            rows.sort(key=lambda row: row.get(name, ""), reverse=order_by.desc)
+    return rows
+
+def project_response(request, response) -> RunReportResponse:
+    """從涵蓋原查詢的回應（相同維度、指標為超集、不帶排序與筆數限制）投影出原查詢的指標、排序與筆數"""
+    dimension_names = [header.name for header in response.dimension_headers]
+    metric_names = [metric.name for metric in request.metrics]
+    metric_types = {header.name: header.type_ for header in response.metric_headers}
+
+    rows = decode_rows(response)
+    # GA4 預設不回傳指標全為 0 的列；來源回應多出的列依原查詢的指標排除
+    if not request.keep_empty_rows:
+        rows = [row for row in rows if any(row[name] for name in metric_names)]
+
+    rows = sort_rows(rows, request.order_bys)
+    row_count = len(rows)
+    if request.limit:
+        rows = rows[request.offset:request.offset + request.limit]
+    elif request.offset:
+        rows = rows[request.offset:]
+
+    return encode_response(dimension_names, metric_names, metric_types, rows, row_count)
+
+def encode_response(dimension_names: List[str], metric_names: List[str],
+                    metric_types: Dict[str, int], rows: List[Dict], row_count: int) -> RunReportResponse:
+    """以已解碼的列建立 RunReportResponse，讓既有的解析方法不需修改"""
+    raw = RunReportResponse.pb()()
+    for name in dimension_names:
+        raw.dimension_headers.add(name=name)
+    for name in metric_names:
+        raw.metric_headers.add(name=name, type_=metric_types.get(name, MetricType.TYPE_FLOAT))
+
+    for record in rows:
+        row = raw.rows.add()
+        for name in dimension_names:
+            row.dimension_values.add(value=record[name])
+        for name in metric_names:
+            value = record[name]
+            if metric_types.get(name) == MetricType.TYPE_INTEGER:
+                value = int(value)
+            row.metric_values.add(value=str(value))
+
+    raw.row_count = row_count
+    return RunReportResponse.wrap(raw)
@@ -0,0 +1,90 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class GA4Executor:
+    """GA4 RPC 非阻塞執行層
+
+    同步的 gRPC 呼叫交給有界執行緒池執行，避免阻塞事件循環；
+    若傳入的是協程函數（例如 BetaAnalyticsDataAsyncClient 的方法）則直接 await。
+    """
+
+    def __init__(self):
+        self.max_workers = int(os.getenv("GA4_EXECUTOR_MAX_WORKERS", "32"))
+        self.slow_call_ms = int(os.getenv("GA4_SLOW_CALL_MS", "2000"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="ga4-rpc"
+        )
+        # 限制同時送入執行緒池的呼叫數，超出者在事件循環中等待而非堆積在池佇列
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+        # 統計數據
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    async def run(self, func, *args, **kwargs):
+        """執行一次 GA4 RPC 並記錄延遲"""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                result = await func(*args, **kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self._executor, functools.partial(func, *args, **kwargs)
+                )
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.in_flight -= 1
+            self.total_latency_ms += elapsed_ms
+            self.max_latency_ms = max(self.max_latency_ms, elapsed_ms)
+            self._slots.release()
+
+            if elapsed_ms >= self.slow_call_ms:
+                name = getattr(func, "__name__", repr(func))
+                logger.warning(f"GA4 呼叫緩慢: {name} 耗時 {elapsed_ms:.0f}ms")
+
+    def stats(self) -> dict:
+        """執行層狀態（供健康檢查使用）"""
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_latency_ms": round(self.total_latency_ms / finished, 2) if finished else 0,
+            "max_latency_ms": round(self.max_latency_ms, 2)
+        }
+
+    def shutdown(self):
+        """關閉執行緒池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# 全局 GA4 執行層實例
+ga4_executor = GA4Executor()
@@ -1,45 +1,32 @@
 import os
-import json
 import logging
-from typing import Optional
+from collections import OrderedDict
 
 from fastapi import HTTPException, status
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.oauth2 import service_account
-from google.oauth2.credentials import Credentials
 
 from services.auth_service import AuthenticationResult
+from services.ga4_clients import ga4_client_registry
+from ga4_extensions import GA4DataService
 
 logger = logging.getLogger(__name__)
 
 class GA4Service:
     def __init__(self):
-        self.SERVICE_ACCOUNT_JSON = os.getenv("SERVICE_ACCOUNT_JSON")
+        self.client_registry = ga4_client_registry
+        self.max_data_services = int(os.getenv("GA4_DATA_SERVICE_CACHE_SIZE", "500"))
+        self._data_services = OrderedDict()  # (property_id, 憑證身分) -> GA4DataService
     
     def get_ga4_client(self, auth_result: AuthenticationResult):
-        """根據認證結果獲取對應的 GA4 客戶端"""
+        """根據認證結果獲取對應的 GA4 客戶端（由註冊表重用，不再每次請求重建）"""
         try:
             if auth_result.user_type == "oauth":
-                # OAuth 模式：使用用戶的 access token
-                credentials = Credentials(token=auth_result.access_token)
-                client = BetaAnalyticsDataClient(credentials=credentials)
-            else:
-                # API Key 模式：使用 Service Account
-                if not self.SERVICE_ACCOUNT_JSON:
-                    raise ValueError("SERVICE_ACCOUNT_JSON 環境變數未設定")
-                
-                # 預處理 SERVICE_ACCOUNT_JSON - 修正控制字符問題
-                processed_json = self.SERVICE_ACCOUNT_JSON.replace('\\n', '\\\\n').replace('\n', '\\n')
-                
-                credentials_info = json.loads(processed_json)
-                credentials = service_account.Credentials.from_service_account_info(
-                    credentials_info,
-                    scopes=["https://www.googleapis.com/auth/analytics.readonly"]
+                # OAuth 模式：依用戶 ID 重用客戶端，token 輪換時自動重建
+                return self.client_registry.get_oauth_client(
+                    auth_result.user_id, auth_result.access_token
                 )
-                client = BetaAnalyticsDataClient(credentials=credentials)
             
-            logger.info(f"GA4客戶端初始化成功 - 模式: {auth_result.user_type}")
-            return client
+            # API Key 模式：使用共用的 Service Account 客戶端
+            return self.client_registry.get_service_account_client()
         
         except Exception as e:
             logger.error(f"GA4客戶端初始化失敗: {str(e)}")
@@ -48,5 +35,42 @@ class GA4Service:
                 detail=f"GA4服務初始化失敗: {str(e)}"
             )
 
+    def get_data_service(self, auth_result: AuthenticationResult) -> GA4DataService:
+        """獲取綁定呼叫者屬性與憑證的 GA4DataService（以 LRU 重用）"""
+        if not auth_result.ga4_property_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="未找到有效的GA4屬性ID"
+            )
+        
+        client = self.get_ga4_client(auth_result)
+        key = (auth_result.ga4_property_id, self._credential_identity(auth_result))
+        
+        service = self._data_services.get(key)
+        if service is None or service.client is not client:
+            # 新的組合，或 OAuth token 輪換後客戶端已重建
+            service = GA4DataService(auth_result.ga4_property_id, client)
+            self._data_services[key] = service
+        self._data_services.move_to_end(key)
+        
+        while len(self._data_services) > self.max_data_services:
+            self._data_services.popitem(last=False)
+        
+        return service
+    
+    def stats(self) -> dict:
+        """數據服務註冊表狀態（供健康檢查使用）"""
+        return {
+            "data_services": len(self._data_services),
+            "max_data_services": self.max_data_services
+        }
+    
+    @staticmethod
+    def _credential_identity(auth_result: AuthenticationResult) -> str:
+        """憑證身分：OAuth 用戶各自獨立，API Key 共用 Service Account"""
+        if auth_result.user_type == "oauth":
+            return f"oauth:{auth_result.user_id}"
+        return "service_account"
+
 # 全局 GA4 服務實例
-ga4_service = GA4Service() 
\ No newline at end of file
+ga4_service = GA4Service() 
@@ -0,0 +1,265 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from google.oauth2.credentials import Credentials
+
+from database import async_session_factory
+from models import GoogleAnalyticsProperty, GA4PropertyMetadata
+from oauth import OAuthUserManager, oauth_handler
+from services.ga4_clients import ga4_client_registry
+from services.ga4_executor import ga4_executor
+from services.date_resolver import date_resolver
+from services.property_metadata import property_metadata
+
+logger = logging.getLogger(__name__)
+
+class PropertyMetadataSync:
+    """GA4 屬性中繼資料背景同步
+
+    定期為每個活躍屬性取得屬性設定（時區、幣別、產業類別）與 getMetadata
+    （可用維度與指標，含自訂定義），寫入資料庫並更新記憶體註冊表。
+    只同步超過刷新間隔或尚未同步的屬性；Service Account 無權存取時改用屬性擁有者的 OAuth token。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_METADATA_SYNC", "true").lower() == "true"
+        self.interval = int(os.getenv("METADATA_SYNC_INTERVAL", "600"))
+        self.refresh_hours = int(os.getenv("METADATA_REFRESH_HOURS", "24"))
+        self.batch_size = int(os.getenv("METADATA_SYNC_BATCH_SIZE", "10"))
+
+        self._failed_at: Dict[str, datetime] = {}
+        self.synced = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """啟動背景同步"""
+        if not self.enabled:
+            logger.info("屬性中繼資料同步已停用")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"屬性中繼資料同步已啟動 - 間隔: {self.interval}s")
+
+    async def stop(self):
+        """停止背景同步"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("屬性中繼資料同步已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> dict:
+        """同步狀態（供健康檢查使用）"""
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "refresh_hours": self.refresh_hours,
+            "synced": self.synced,
+            "failed": self.failed,
+            **property_metadata.stats()
+        }
+
+    async def _run(self):
+        """同步主循環：先載入資料庫中已同步的中繼資料，再定期同步到期的屬性"""
+        await self._load_stored()
+
+        while True:
+            try:
+                await self.sync_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"屬性中繼資料同步循環失敗: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    async def _load_stored(self):
+        """從資料庫載入已同步的中繼資料到記憶體註冊表"""
+        if not async_session_factory:
+            return
+
+        try:
+            async with async_session_factory() as session:
+                result = await session.execute(select(GA4PropertyMetadata))
+                for stored in result.scalars().all():
+                    self._register(stored)
+        except Exception as e:
+            logger.warning(f"載入屬性中繼資料失敗: {e}")
+
+    async def sync_due(self):
+        """同步尚未同步或超過刷新間隔的屬性（每輪最多 batch_size 個）"""
+        if not async_session_factory:
+            return
+
+        owners = await self.load_owners()
+        now = datetime.utcnow()
+        refresh_before = now - timedelta(hours=self.refresh_hours)
+
+        due = []
+        for property_id in owners:
+            synced_at = property_metadata.synced_at(property_id)
+            if synced_at is not None and synced_at > refresh_before:
+                continue
+            # 失敗的屬性等到下一個刷新週期才重試
+            failed_at = self._failed_at.get(property_id)
+            if failed_at is not None and failed_at > refresh_before:
+                continue
+            due.append(property_id)
+
+        for property_id in due[:self.batch_size]:
+            await self.sync_property(property_id, owners[property_id])
+
+    async def sync_property(self, property_id: str, owner_ids: List[int]) -> bool:
+        """同步單一屬性的設定與中繼資料"""
+        try:
+            details, metadata = await self._fetch(property_id, owner_ids)
+        except Exception as e:
+            self.failed += 1
+            self._failed_at[property_id] = datetime.utcnow()
+            logger.warning(f"屬性中繼資料同步失敗 - 屬性: {property_id}, 錯誤: {e}")
+            return False
+
+        dimensions = [
+            {"api_name": dimension.api_name, "custom": dimension.custom_definition,
+             "deprecated": list(dimension.deprecated_api_names)}
+            for dimension in metadata.dimensions
+        ]
+        metrics = [
+            {"api_name": metric.api_name, "type": metric.type_.name, "custom": metric.custom_definition,
+             "deprecated": list(metric.deprecated_api_names)}
+            for metric in metadata.metrics
+        ]
+        synced_at = datetime.utcnow()
+
+        async with async_session_factory() as session:
+            # 同一個 GA4 屬性可能被多個用戶加入，全部更新
+            result = await session.execute(
+                select(GoogleAnalyticsProperty).where(
+                    GoogleAnalyticsProperty.property_id == property_id
+                )
+            )
+            for ga4_property in result.scalars().all():
+                ga4_property.time_zone = details.time_zone or ga4_property.time_zone
+                ga4_property.currency_code = details.currency_code or ga4_property.currency_code
+                if details.industry_category:
+                    ga4_property.industry_category = details.industry_category.name
+
+            result = await session.execute(
+                select(GA4PropertyMetadata).where(
+                    GA4PropertyMetadata.property_id == property_id
+                )
+            )
+            stored = result.scalar_one_or_none()
+            if stored is None:
+                stored = GA4PropertyMetadata(property_id=property_id)
+                session.add(stored)
+            stored.dimensions = json.dumps(dimensions)
+            stored.metrics = json.dumps(metrics)
+            stored.synced_at = synced_at
+
+            await session.commit()
+
+        self._register(stored)
+        date_resolver.register_time_zone(property_id, details.time_zone)
+        self._failed_at.pop(property_id, None)
+        self.synced += 1
+        logger.info(f"屬性中繼資料已同步 - 屬性: {property_id}, 維度: {len(dimensions)}, 指標: {len(metrics)}")
+        return True
+
+    async def load_owners(self) -> Dict[str, List[int]]:
+        """載入活躍屬性與其擁有者（property_id -> 用戶 ID 列表）"""
+        owners: Dict[str, List[int]] = {}
+
+        static_property = os.getenv("GA4_PROPERTY_ID")
+        if static_property:
+            owners[static_property] = []
+
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(GoogleAnalyticsProperty.property_id, GoogleAnalyticsProperty.user_id).where(
+                    GoogleAnalyticsProperty.is_active == True
+                )
+            )
+            for property_id, user_id in result.all():
+                owners.setdefault(property_id, []).append(user_id)
+
+        return owners
+
+    async def _fetch(self, property_id: str, owner_ids: List[int]) -> Tuple:
+        """取得屬性設定與中繼資料：先用 Service Account，失敗時依序改用擁有者的 OAuth token（過期時刷新）"""
+        try:
+            return await self._fetch_with(
+                property_id,
+                ga4_client_registry.get_service_account_admin_client(),
+                ga4_client_registry.get_service_account_client()
+            )
+        except Exception as service_account_error:
+            last_error = service_account_error
+
+        from google.analytics.admin import AnalyticsAdminServiceClient
+
+        for user_id in owner_ids:
+            async with async_session_factory() as session:
+                access_token = await OAuthUserManager.get_valid_access_token(session, user_id, oauth_handler)
+            if access_token is None:
+                continue
+            # Admin 客戶端只在此次同步使用，結束後關閉 gRPC 通道
+            admin_client = AnalyticsAdminServiceClient(credentials=Credentials(token=access_token))
+            try:
+                return await self._fetch_with(
+                    property_id,
+                    admin_client,
+                    ga4_client_registry.get_oauth_client(user_id, access_token)
+                )
+            except Exception as e:
+                last_error = e
+            finally:
+                admin_client.transport.close()
+
+        raise last_error
+
+    @staticmethod
+    async def _fetch_with(property_id: str, admin_client, data_client) -> Tuple:
+        """以指定客戶端取得屬性設定與中繼資料"""
+        details, metadata = await asyncio.gather(
+            ga4_executor.run(admin_client.get_property, name=f"properties/{property_id}"),
+            ga4_executor.run(data_client.get_metadata, name=f"properties/{property_id}/metadata")
+        )
+        return details, metadata
+
+    @staticmethod
+    def _register(stored: GA4PropertyMetadata):
+        """將資料庫記錄載入記憶體註冊表"""
+        dimensions = json.loads(stored.dimensions)
+        metrics = json.loads(stored.metrics)
+
+        aliases = {}
+        for field in dimensions + metrics:
+            for deprecated in field.get("deprecated", []):
+                aliases[deprecated] = field["api_name"]
+
+        property_metadata.update(
+            stored.property_id,
+            [dimension["api_name"] for dimension in dimensions],
+            {metric["api_name"]: metric["type"] for metric in metrics},
+            aliases=aliases,
+            synced_at=stored.synced_at.replace(tzinfo=None) if stored.synced_at.tzinfo else stored.synced_at
+        )
+
+# 全局屬性中繼資料同步實例
+metadata_sync = PropertyMetadataSync()
@@ -0,0 +1,112 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class InvalidQueryError(ValueError):
+    """查詢包含屬性不支援的維度或指標"""
+
+    def __init__(self, property_id: str, invalid_fields: List[str]):
+        self.property_id = property_id
+        self.invalid_fields = invalid_fields
+        super().__init__(f"屬性 {property_id} 不支援的欄位: {', '.join(invalid_fields)}")
+
+class PropertyMetadataRegistry:
+    """GA4 屬性中繼資料的記憶體註冊表
+
+    保存每個屬性可用的維度與指標（含自訂定義），由背景同步工作填入。
+    查詢送出前先在本地驗證欄位，不必等 GA4 回傳錯誤才發現；
+    尚未同步的屬性不做驗證。
+    """
+
+    def __init__(self):
+        self._properties: Dict[str, dict] = {}  # property_id -> {"dimensions", "metrics", "aliases", "synced_at"}
+
+    def update(self, property_id: str, dimensions: Iterable[str], metrics: Dict[str, str],
+               aliases: Optional[Dict[str, str]] = None, synced_at: Optional[datetime] = None):
+        """更新屬性的可用維度與指標（指標名稱 -> 型別；aliases 為已淘汰名稱 -> 目前名稱）"""
+        self._properties[property_id] = {
+            "dimensions": set(dimensions),
+            "metrics": dict(metrics),
+            "aliases": dict(aliases or {}),
+            "synced_at": synced_at or datetime.utcnow()
+        }
+
+    def get(self, property_id: str) -> Optional[dict]:
+        """讀取屬性的中繼資料，尚未同步時回傳 None"""
+        return self._properties.get(property_id)
+
+    def synced_at(self, property_id: str) -> Optional[datetime]:
+        """屬性中繼資料的同步時間"""
+        metadata = self._properties.get(property_id)
+        return metadata["synced_at"] if metadata else None
+
+    def invalid_fields(self, property_id: str, request) -> List[str]:
+        """回傳查詢中屬性不支援的維度與指標名稱"""
+        metadata = self._properties.get(property_id)
+        if metadata is None:
+            return []
+
+        dimensions = [dimension.name for dimension in request.dimensions]
+        metrics = [metric.name for metric in request.metrics]
+        if request.dimension_filter:
+            dimensions.extend(self._filter_fields(request.dimension_filter))
+        if request.metric_filter:
+            metrics.extend(self._filter_fields(request.metric_filter))
+
+        aliases = metadata["aliases"]
+        invalid = [
+            name for name in dimensions
+            if aliases.get(name, name) not in metadata["dimensions"]
+        ]
+        invalid += [
+            name for name in metrics
+            if aliases.get(name, name) not in metadata["metrics"]
+        ]
+        return list(dict.fromkeys(invalid))
+
+    def validate(self, property_id: str, request):
+        """驗證查詢欄位，有不支援的欄位時拋出 InvalidQueryError"""
+        invalid = self.invalid_fields(property_id, request)
+        if invalid:
+            raise InvalidQueryError(property_id, invalid)
+
+    def canonicalize(self, property_id: str, request):
+        """將查詢中已淘汰的維度與指標名稱就地改寫為目前的名稱，回傳同一個查詢"""
+        metadata = self._properties.get(property_id)
+        if metadata is None or not metadata["aliases"]:
+            return request
+
+        aliases = metadata["aliases"]
+        for field in list(request.dimensions) + list(request.metrics):
+            field.name = aliases.get(field.name, field.name)
+        for order_by in request.order_bys:
+            if order_by.metric.metric_name:
+                order_by.metric.metric_name = aliases.get(order_by.metric.metric_name, order_by.metric.metric_name)
+            if order_by.dimension.dimension_name:
+                order_by.dimension.dimension_name = aliases.get(order_by.dimension.dimension_name, order_by.dimension.dimension_name)
+        return request
+
+    def stats(self) -> dict:
+        """註冊表狀態（供健康檢查使用）"""
+        return {
+            "properties": len(self._properties)
+        }
+
+    @classmethod
+    def _filter_fields(cls, expression) -> List[str]:
+        """遞迴取出篩選條件中使用的欄位名稱"""
+        if expression.filter.field_name:
+            return [expression.filter.field_name]
+
+        fields = []
+        for group in (expression.and_group, expression.or_group):
+            for child in group.expressions:
+                fields.extend(cls._filter_fields(child))
+        if expression.not_expression:
+            fields.extend(cls._filter_fields(expression.not_expression))
+        return fields
+
+# 全局屬性中繼資料實例
+property_metadata = PropertyMetadataRegistry()
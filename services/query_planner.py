@@ -0,0 +1,169 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from google.analytics.data_v1beta.types import RunReportRequest
+
+from services.ga4_decoder import project_response
+
+logger = logging.getLogger(__name__)
+
+class QueryPlanner:
+    """相容 run_report 查詢的合併
+
+    同一時間窗內送出、維度 / 日期範圍 / 篩選條件相同而只有指標、排序或筆數不同的查詢
+    （例如同一儀表板的多個面板或每日分區），合併為單一 GA4 查詢（指標取聯集，
+    不超過 GA4 的指標上限），再於本地為每個呼叫者投影出自己的指標、排序與筆數。
+    合併查詢被截斷或失敗時，改為逐一送出原查詢。
+    同屬性沒有其他進行中或等待中的查詢時直接送出，只有同時湧入的查詢才等待時間窗。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_QUERY_MERGING", "true").lower() == "true"
+        self.window = int(os.getenv("QUERY_MERGE_WINDOW_MS", "10")) / 1000
+        self.max_metrics = int(os.getenv("QUERY_MERGE_MAX_METRICS", "10"))
+        self.row_limit = int(os.getenv("QUERY_MERGE_ROW_LIMIT", "10000"))
+
+        self._pending: Dict[tuple, List[Tuple]] = {}  # 分組鍵 -> [(查詢, future, execute)]
+        self._active: Dict[str, int] = {}  # 屬性 -> 進行中或等待中的查詢數
+        self.direct = 0
+        self.merged_queries = 0
+        self.merged_requests = 0
+        self.fallbacks = 0
+
+    def merge_key(self, property_id: str, request: RunReportRequest) -> Optional[tuple]:
+        """可合併查詢的分組鍵（去除指標、排序與筆數後的查詢內容），不可合併時回傳 None"""
+        if request.metric_aggregations or request.comparisons or request.cohort_spec:
+            return None
+
+        shape = RunReportRequest.pb()()
+        shape.CopyFrom(RunReportRequest.pb(request))
+        for field in ("metrics", "order_bys", "limit", "offset", "return_property_quota"):
+            shape.ClearField(field)
+        return (property_id, shape.SerializeToString(deterministic=True))
+
+    async def run(self, property_id: str, request: RunReportRequest,
+                  execute: Callable[[RunReportRequest], Awaitable]):
+        """執行查詢；時間窗內有相容的查詢時合併送出
+
+        execute 直接呼叫 GA4（不經快取）；合併查詢以組內第一個呼叫者的 execute 送出，
+        逐一查詢時各自使用自己的 execute。
+        """
+        key = self.merge_key(property_id, request) if self.enabled else None
+        if key is None:
+            return await execute(request)
+
+        busy = self._active.get(property_id, 0) > 0
+        self._active[property_id] = self._active.get(property_id, 0) + 1
+        try:
+            pending = self._pending.get(key)
+            if pending is None and not busy:
+                # 同屬性沒有其他查詢：不等待時間窗，直接送出
+                self.direct += 1
+                return await execute(request)
+
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            if pending is None:
+                pending = self._pending[key] = []
+                # 以獨立任務等待時間窗，呼叫者中途取消也不影響同組的其他查詢
+                loop.create_task(self._flush(key))
+            pending.append((request, future, execute))
+            return await asyncio.shield(future)
+        finally:
+            self._active[property_id] -= 1
+            if not self._active[property_id]:
+                del self._active[property_id]
+
+    def stats(self) -> dict:
+        """查詢合併狀態（供健康檢查使用）"""
+        return {
+            "enabled": self.enabled,
+            "window_ms": int(self.window * 1000),
+            "pending_groups": len(self._pending),
+            "direct": self.direct,
+            "merged_queries": self.merged_queries,
+            "merged_requests": self.merged_requests,
+            "fallbacks": self.fallbacks
+        }
+
+    async def _flush(self, key: tuple):
+        """時間窗結束後送出該組查詢"""
+        await asyncio.sleep(self.window)
+        waiters = self._pending.pop(key, [])
+
+        await asyncio.gather(*(
+            self._run_group(group) for group in self._group(waiters)
+        ))
+
+    def _group(self, waiters: List[Tuple]) -> List[List]:
+        """依指標聯集分組，每組的指標聯集不超過上限"""
+        groups: List[Tuple[List[str], List]] = []
+        for waiter in waiters:
+            metrics = [metric.name for metric in waiter[0].metrics]
+            for group_metrics, group in groups:
+                union = group_metrics + [name for name in metrics if name not in group_metrics]
+                if len(union) <= self.max_metrics:
+                    group_metrics[:] = union
+                    group.append(waiter)
+                    break
+            else:
+                groups.append((list(dict.fromkeys(metrics)), [waiter]))
+        return [group for _, group in groups]
+
+    async def _run_group(self, group: List):
+        """送出一組查詢：單一查詢原樣送出，多個查詢合併後投影"""
+        if len(group) > 1:
+            try:
+                execute = group[0][2]
+                response = await execute(self._merge(group))
+            except Exception as e:
+                logger.warning(f"合併查詢失敗，改為逐一查詢: {e}")
+                response = None
+
+            if response is not None and response.row_count <= len(response.rows):
+                self.merged_queries += 1
+                self.merged_requests += len(group)
+                for request, future, _ in group:
+                    if not future.done():
+                        future.set_result(project_response(request, response))
+                return
+
+            self.fallbacks += 1
+            if response is not None:
+                logger.info(f"合併查詢回應被截斷，改為逐一查詢 - 列數: {response.row_count}")
+
+        await asyncio.gather(*(self._run_single(*waiter) for waiter in group))
+
+    @staticmethod
+    async def _run_single(request: RunReportRequest, future: asyncio.Future,
+                          execute: Callable[[RunReportRequest], Awaitable]):
+        try:
+            result = await execute(request)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def _merge(self, group: List) -> RunReportRequest:
+        """建立指標取聯集、不帶排序與筆數限制的合併查詢"""
+        raw = RunReportRequest.pb()()
+        raw.CopyFrom(RunReportRequest.pb(group[0][0]))
+        raw.ClearField("metrics")
+        raw.ClearField("order_bys")
+        raw.offset = 0
+        raw.limit = self.row_limit
+
+        names = []
+        for request, _, _ in group:
+            for metric in request.metrics:
+                if metric.name not in names:
+                    names.append(metric.name)
+                    raw.metrics.add().CopyFrom(type(metric).pb(metric))
+        return RunReportRequest.wrap(raw)
+
+# 全局查詢合併實例
+query_planner = QueryPlanner()
@@ -0,0 +1,53 @@
+import os
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 即時報表能力：實時 API 是否接受 pagePath / pageTitle 維度
+CAPABILITY_PAGE_PATH = "page_path"
+
+class RealtimeCapabilityCache:
+    """各屬性即時報表能力的快取
+
+    記錄每個屬性哪些即時維度組合可用，之後的請求直接使用可用的查詢，
+    不必每次先送出注定失敗的查詢再回退；記錄過期後才重新探測。
+    """
+
+    def __init__(self):
+        self.ttl = int(os.getenv("REALTIME_CAPABILITY_TTL", "86400"))
+        self._entries: Dict[Tuple[str, str], Tuple[bool, float]] = {}  # (property_id, 能力) -> (是否支援, 記錄時間)
+        self.probes = 0
+
+    def get(self, property_id: str, capability: str) -> Optional[bool]:
+        """讀取能力記錄，未知或已過期時回傳 None（代表需要探測）"""
+        entry = self._entries.get((property_id, capability))
+        if entry is None:
+            return None
+
+        supported, recorded_at = entry
+        if time.monotonic() - recorded_at >= self.ttl:
+            del self._entries[(property_id, capability)]
+            return None
+        return supported
+
+    def record(self, property_id: str, capability: str, supported: bool):
+        """記錄探測結果"""
+        if (property_id, capability) not in self._entries:
+            self.probes += 1
+        self._entries[(property_id, capability)] = (supported, time.monotonic())
+        if not supported:
+            logger.info(f"屬性 {property_id} 不支援即時能力 {capability}，{self.ttl}s 內直接使用回退查詢")
+
+    def stats(self) -> dict:
+        """能力快取狀態（供健康檢查使用）"""
+        return {
+            "entries": len(self._entries),
+            "unsupported": len([entry for entry in self._entries.values() if not entry[0]]),
+            "probes": self.probes,
+            "ttl": self.ttl
+        }
+
+# 全局即時報表能力快取實例
+realtime_capabilities = RealtimeCapabilityCache()
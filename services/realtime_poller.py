@@ -0,0 +1,336 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from sqlalchemy import select
+from google.analytics.data_v1beta.types import RunRealtimeReportRequest
+
+from database import async_session_factory
+from models import GoogleAnalyticsProperty
+from oauth import OAuthUserManager, oauth_handler
+from services.ga4_clients import ga4_client_registry
+from services.ga4_executor import ga4_executor
+from services.ga4_decoder import decode_rows
+from services.date_resolver import date_resolver
+
+logger = logging.getLogger(__name__)
+
+class RealtimePoller:
+    """背景即時數據輪詢器
+
+    依固定節奏為每個活躍屬性查詢一次即時在線人數並存成記憶體快照，
+    路由直接讀取快照，GA4 成本與延遲隨屬性數量而非客戶端數量增長。
+    近期沒有被請求的屬性會降低輪詢頻率，長時間無人請求則停止輪詢。
+    數值變動時推送給串流訂閱者，一次上游輪詢即可扇出給所有訂閱者。
+    Service Account 無權存取的屬性改用訂閱者的 OAuth 客戶端輪詢（每次輪詢重新取得有效的 token）；
+    仍然失敗時通知訂閱者錯誤，已有快照時標記為過期，恢復後立即推送最新數值。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_REALTIME_POLLER", "true").lower() == "true"
+        self.interval = int(os.getenv("REALTIME_POLL_INTERVAL", "15"))
+        self.idle_interval = int(os.getenv("REALTIME_POLL_IDLE_INTERVAL", "120"))
+        self.idle_after = int(os.getenv("REALTIME_POLL_IDLE_AFTER", "300"))
+        self.drop_after = int(os.getenv("REALTIME_POLL_DROP_AFTER", "3600"))
+        self.property_refresh_interval = int(os.getenv("REALTIME_POLL_PROPERTY_REFRESH", "300"))
+        self.tick = max(1, min(self.interval, 5))
+        self.subscriber_queue_size = int(os.getenv("REALTIME_STREAM_QUEUE_SIZE", "5"))
+
+        self._snapshots: Dict[str, dict] = {}
+        self._last_requested: Dict[str, float] = {}
+        self._next_poll: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self._errors: Dict[str, str] = {}  # 屬性 -> 最近一次輪詢錯誤
+        self._known_properties: Set[str] = set()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._fallback_users: Dict[str, Dict[asyncio.Queue, int]] = {}  # 屬性 -> {訂閱佇列: OAuth 用戶 ID}
+        self._oauth_only: Set[str] = set()  # 只能以 OAuth 客戶端輪詢的屬性
+        self.dropped_updates = 0
+        self._properties_loaded_at = 0.0
+        self._started_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """啟動背景輪詢"""
+        if not self.enabled:
+            logger.info("即時數據輪詢器已停用")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"即時數據輪詢器已啟動 - 間隔: {self.interval}s")
+
+    async def stop(self):
+        """停止背景輪詢"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("即時數據輪詢器已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def touch(self, property_id: str):
+        """記錄屬性被請求，使其維持在高頻輪詢"""
+        now = time.monotonic()
+        was_idle = self._is_idle(property_id, now)
+        self._last_requested[property_id] = now
+        self._known_properties.add(property_id)
+        if was_idle:
+            # 從閒置恢復時立即安排下一次輪詢
+            self._next_poll[property_id] = now
+
+    def get_snapshot(self, property_id: str) -> Optional[dict]:
+        """O(1) 讀取屬性的即時快照；快照過舊或輪詢器未運行時回傳 None"""
+        if not property_id:
+            return None
+
+        self.touch(property_id)
+        if not self.running:
+            return None
+
+        snapshot = self._snapshots.get(property_id)
+        if snapshot is None:
+            return None
+
+        # 只接受高頻輪詢節奏下的新鮮快照
+        if time.monotonic() - snapshot["polled_at"] > self.interval * 2:
+            return None
+        return snapshot
+
+    def latest(self, property_id: str) -> Optional[dict]:
+        """讀取屬性最近一次的快照（不檢查新鮮度）"""
+        return self._snapshots.get(property_id)
+
+    def subscribe(self, property_id: str, user_id: Optional[int] = None) -> asyncio.Queue:
+        """訂閱屬性的即時數值變動，回傳接收快照的佇列
+
+        user_id 為訂閱者的 OAuth 用戶，Service Account 無法存取屬性時改用該用戶的 token 輪詢；
+        佇列收到含 error 的項目表示屬性無法輪詢，同時含 stale 時表示最近的快照已過期。
+        """
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.setdefault(property_id, set()).add(queue)
+        if user_id is not None:
+            self._fallback_users.setdefault(property_id, {})[queue] = user_id
+            if self._failures.get(property_id):
+                # 先前以 Service Account 輪詢失敗，有了 OAuth 客戶端後立即重試
+                self._next_poll[property_id] = time.monotonic()
+        self.touch(property_id)
+        return queue
+
+    def unsubscribe(self, property_id: str, queue: asyncio.Queue):
+        """取消訂閱"""
+        subscribers = self._subscribers.get(property_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[property_id]
+        fallback_users = self._fallback_users.get(property_id)
+        if fallback_users is not None:
+            fallback_users.pop(queue, None)
+            if not fallback_users:
+                del self._fallback_users[property_id]
+        # 以取消訂閱的時間作為最後請求時間，之後依一般規則降頻
+        self._last_requested[property_id] = time.monotonic()
+
+    def _publish(self, property_id: str, snapshot: dict):
+        """將快照推送給所有訂閱者；慢速消費者只保留最新的數值"""
+        for queue in self._subscribers.get(property_id, ()):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                    self.dropped_updates += 1
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(snapshot)
+
+    def stats(self) -> dict:
+        """輪詢器狀態（供健康檢查使用）"""
+        now = time.monotonic()
+        tracked = [p for p in self._known_properties if not self._is_dropped(p, now)]
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "tracked_properties": len(tracked),
+            "active_properties": len([p for p in tracked if not self._is_idle(p, now)]),
+            "snapshots": len(self._snapshots),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "dropped_updates": self.dropped_updates
+        }
+
+    async def _run(self):
+        """輪詢主循環"""
+        while True:
+            try:
+                now = time.monotonic()
+                if now - self._properties_loaded_at >= self.property_refresh_interval:
+                    await self._load_properties()
+
+                for property_id in [p for p in self._known_properties if self._is_dropped(p, now)]:
+                    self._drop(property_id)
+
+                due = [p for p in self._known_properties if self._is_due(p, now)]
+                if due:
+                    await asyncio.gather(*(self._poll(property_id) for property_id in due))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"即時數據輪詢循環失敗: {e}")
+
+            await asyncio.sleep(self.tick)
+
+    async def _load_properties(self):
+        """從資料庫與環境變數載入需要輪詢的屬性"""
+        self._properties_loaded_at = time.monotonic()
+
+        static_property = os.getenv("GA4_PROPERTY_ID")
+        if static_property:
+            self._known_properties.add(static_property)
+
+        if not async_session_factory:
+            return
+
+        try:
+            async with async_session_factory() as session:
+                result = await session.execute(
+                    select(
+                        GoogleAnalyticsProperty.property_id,
+                        GoogleAnalyticsProperty.time_zone
+                    ).where(
+                        GoogleAnalyticsProperty.is_active == True
+                    ).distinct()
+                )
+                for property_id, time_zone in result.all():
+                    self._known_properties.add(property_id)
+                    date_resolver.register_time_zone(property_id, time_zone)
+        except Exception as e:
+            logger.warning(f"載入輪詢屬性失敗: {e}")
+
+    async def _poll(self, property_id: str):
+        """查詢單一屬性的即時在線人數並更新快照"""
+        now = time.monotonic()
+        try:
+            response = await self._fetch(property_id)
+
+            rows = decode_rows(response)
+            active_users = rows[0]["activeUsers"] if rows else 0
+
+            previous = self._snapshots.get(property_id)
+            snapshot = {
+                "property_id": property_id,
+                "activeUsers": active_users,
+                "updated_at": datetime.now().isoformat(),
+                "polled_at": time.monotonic(),
+                "version": (previous["version"] + 1) if previous else 1
+            }
+            self._snapshots[property_id] = snapshot
+            # 先前輪詢失敗時訂閱者已收到過期通知，恢復後即使數值未變也推送
+            if previous is None or previous["activeUsers"] != active_users or property_id in self._errors:
+                self._publish(property_id, snapshot)
+            self._failures.pop(property_id, None)
+            self._errors.pop(property_id, None)
+            self._next_poll[property_id] = now + self._current_interval(property_id, now)
+
+        except Exception as e:
+            # 失敗時指數退避（例如 Service Account 無權存取 OAuth 用戶的屬性）
+            failures = self._failures.get(property_id, 0) + 1
+            self._failures[property_id] = failures
+            self._errors[property_id] = str(e)
+            backoff = min(self.idle_interval * (2 ** (failures - 1)), self.drop_after)
+            self._next_poll[property_id] = now + backoff
+            if failures == 1:
+                logger.warning(f"即時數據輪詢失敗 - 屬性: {property_id}, 錯誤: {e}")
+            self._publish(property_id, self.error_event(property_id))
+
+    def error_event(self, property_id: str) -> Optional[dict]:
+        """屬性最近一次輪詢失敗的通知；已有快照時附上最後的數值並標記為過期"""
+        error = self._errors.get(property_id)
+        if error is None:
+            return None
+        event = {"property_id": property_id, "error": error}
+        snapshot = self._snapshots.get(property_id)
+        if snapshot is not None:
+            event.update(stale=True, activeUsers=snapshot["activeUsers"], updated_at=snapshot["updated_at"])
+        return event
+
+    async def _fetch(self, property_id: str):
+        """以 Service Account 查詢即時在線人數，失敗時改用訂閱者的 OAuth 客戶端"""
+        request = RunRealtimeReportRequest(
+            property=f"properties/{property_id}",
+            metrics=[{"name": "activeUsers"}]
+        )
+        if property_id in self._oauth_only:
+            fallback_client = await self._fallback_client(property_id)
+            if fallback_client is not None:
+                return await ga4_executor.run(fallback_client.run_realtime_report, request=request)
+
+        try:
+            client = ga4_client_registry.get_service_account_client()
+            return await ga4_executor.run(client.run_realtime_report, request=request)
+        except Exception:
+            fallback_client = await self._fallback_client(property_id)
+            if fallback_client is None:
+                raise
+
+        response = await ga4_executor.run(fallback_client.run_realtime_report, request=request)
+        self._oauth_only.add(property_id)
+        return response
+
+    async def _fallback_client(self, property_id: str):
+        """以訂閱者的有效 token（必要時刷新）取得 OAuth 客戶端；沒有可用的訂閱者時回傳 None"""
+        if not async_session_factory:
+            return None
+
+        for user_id in dict.fromkeys(self._fallback_users.get(property_id, {}).values()):
+            try:
+                async with async_session_factory() as session:
+                    access_token = await OAuthUserManager.get_valid_access_token(session, user_id, oauth_handler)
+            except Exception as e:
+                logger.warning(f"取得即時輪詢 OAuth token 失敗 - 用戶: {user_id}, 錯誤: {e}")
+                continue
+            if access_token:
+                return ga4_client_registry.get_oauth_client(user_id, access_token)
+        return None
+
+    def _drop(self, property_id: str):
+        """停止輪詢長時間無人請求的屬性並清除其所有狀態；再次被請求時重新加入"""
+        self._known_properties.discard(property_id)
+        self._last_requested.pop(property_id, None)
+        self._next_poll.pop(property_id, None)
+        self._snapshots.pop(property_id, None)
+        self._failures.pop(property_id, None)
+        self._errors.pop(property_id, None)
+        self._fallback_users.pop(property_id, None)
+        self._oauth_only.discard(property_id)
+
+    def _is_due(self, property_id: str, now: float) -> bool:
+        return now >= self._next_poll.get(property_id, 0)
+
+    def _current_interval(self, property_id: str, now: float) -> int:
+        return self.idle_interval if self._is_idle(property_id, now) else self.interval
+
+    def _is_idle(self, property_id: str, now: float) -> bool:
+        if self._subscribers.get(property_id):
+            return False
+        last_requested = self._last_requested.get(property_id, self._started_at)
+        return now - last_requested > self.idle_after
+
+    def _is_dropped(self, property_id: str, now: float) -> bool:
+        if self._subscribers.get(property_id):
+            return False
+        last_requested = self._last_requested.get(property_id, self._started_at)
+        return now - last_requested > self.drop_after
+
+# 全局即時數據輪詢器實例
+realtime_poller = RealtimePoller()
@@ -0,0 +1,199 @@
+import os
+import time
+import hashlib
+import logging
+import contextlib
+import contextvars
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from services.date_resolver import date_resolver
+
+logger = logging.getLogger(__name__)
+
+# TTL 類別
+TTL_REALTIME = "realtime"
+TTL_INTRADAY = "intraday"
+TTL_HISTORICAL = "historical"
+TTL_SETTLED = "settled"
+
+# 快取查詢結果狀態
+CACHE_FRESH = "fresh"
+CACHE_STALE = "stale"
+CACHE_MISS = "miss"
+
+class ReportCache:
+    """GA4 報表回應快取
+
+    以「屬性 ID + 請求內容的標準化雜湊」為鍵，因此共用同一 GA4 屬性的
+    所有 API Key / 用戶會共用快取項目。依請求性質套用不同 TTL，並以 LRU 限制大小。
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("GA4_CACHE_MAX_ENTRIES", "2000"))
+        self.ttls = {
+            TTL_REALTIME: int(os.getenv("GA4_CACHE_TTL_REALTIME", "45")),
+            TTL_INTRADAY: int(os.getenv("GA4_CACHE_TTL_INTRADAY", "300")),
+            TTL_HISTORICAL: int(os.getenv("GA4_CACHE_TTL_HISTORICAL", "21600")),
+            TTL_SETTLED: int(os.getenv("GA4_CACHE_TTL_SETTLED", "604800")),
+        }
+        # 過期後仍可先回傳舊資料、同時於背景更新的寬限秒數
+        self.graces = {
+            TTL_REALTIME: int(os.getenv("GA4_CACHE_GRACE_REALTIME", "120")),
+            TTL_INTRADAY: int(os.getenv("GA4_CACHE_GRACE_INTRADAY", "900")),
+            TTL_HISTORICAL: int(os.getenv("GA4_CACHE_GRACE_HISTORICAL", "86400")),
+            TTL_SETTLED: int(os.getenv("GA4_CACHE_GRACE_SETTLED", "604800")),
+        }
+        self._entries = OrderedDict()  # key -> (expires_at, stale_until, value)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(property_id: str, request) -> str:
+        """以屬性 ID 與請求的確定性序列化結果產生快取鍵"""
+        payload = type(request).pb(request).SerializeToString(deterministic=True)
+        digest = hashlib.sha256(type(request).__name__.encode() + b":" + payload).hexdigest()
+        return f"{property_id}:{digest}"
+
+    def lookup(self, key: str) -> Tuple[Optional[Any], str]:
+        """讀取快取項目並回傳 (值, 狀態)，過期但仍在寬限期內者狀態為 stale"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, CACHE_MISS
+
+        expires_at, stale_until, value = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            del self._entries[key]
+            self.misses += 1
+            return None, CACHE_MISS
+
+        self._entries.move_to_end(key)
+        if now >= expires_at:
+            self.stale_hits += 1
+            return value, CACHE_STALE
+
+        self.hits += 1
+        return value, CACHE_FRESH
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """快取項目距離過期的秒數（不影響命中統計與 LRU 順序），不存在時回傳 None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[0] - time.monotonic()
+
+    def set(self, key: str, value: Any, ttl: int, grace: int = 0):
+        """寫入快取項目，超出容量時淘汰最久未使用者"""
+        if ttl <= 0:
+            return
+
+        expires_at = time.monotonic() + ttl
+        self._entries[key] = (expires_at, expires_at + max(grace, 0), value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def policy_for(self, request, realtime: bool = False, property_id: Optional[str] = None) -> Tuple[int, int]:
+        """依請求的日期範圍判斷 TTL 類別，回傳 (TTL 秒數, 寬限秒數)
+
+        日期以屬性時區解讀：包含今天的查詢在當地午夜到期，
+        已結束但仍在處理期的日期在數據不再變動的時刻到期，之後以 settled 類別長期快取。
+        """
+        if realtime:
+            return self.ttls[TTL_REALTIME], self.graces[TTL_REALTIME]
+
+        date_ranges = list(getattr(request, "date_ranges", []) or [])
+        if not date_ranges:
+            return self.ttls[TTL_INTRADAY], self.graces[TTL_INTRADAY]
+
+        now = date_resolver.now(property_id)
+        today = now.date()
+        ttl_class = TTL_SETTLED
+        expires_in = None
+        relative = False
+        for date_range in date_ranges:
+            if not date_resolver.is_absolute(date_range.start_date) or not date_resolver.is_absolute(date_range.end_date):
+                relative = True
+
+            end_date = date_resolver.resolve(date_range.end_date, today)
+            if end_date is None or end_date >= today:
+                ttl_class = TTL_INTRADAY
+                horizon = date_resolver.seconds_until(date_resolver.day_end(today, property_id), property_id)
+            else:
+                immutable_at = date_resolver.immutable_at(end_date, property_id)
+                if immutable_at <= now:
+                    continue
+                if ttl_class == TTL_SETTLED:
+                    ttl_class = TTL_HISTORICAL
+                horizon = date_resolver.seconds_until(immutable_at, property_id)
+            expires_in = horizon if expires_in is None else min(expires_in, horizon)
+
+        ttl, grace = self.ttls[ttl_class], self.graces[ttl_class]
+        if expires_in is not None:
+            # 在跨日或數據不再變動的時刻準時到期
+            ttl = min(ttl, expires_in)
+        if relative:
+            # 未經標準化的相對日期在午夜後代表不同的日子，寬限期不可跨日
+            horizon = date_resolver.seconds_until(date_resolver.day_end(today, property_id), property_id)
+            ttl = min(ttl, horizon)
+            grace = max(min(grace, horizon - ttl), 0)
+
+        return ttl, grace
+
+    def clear(self):
+        """清空快取"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """快取狀態（供健康檢查使用）"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0,
+            "ttls": self.ttls,
+            "graces": self.graces
+        }
+
+class CacheFreshness:
+    """單一 API 請求的快取新鮮度記錄（是否有資料來自過期快取）"""
+
+    def __init__(self):
+        self.stale = False
+
+_freshness = contextvars.ContextVar("ga4_cache_freshness", default=None)
+
+def track_freshness() -> CacheFreshness:
+    """在目前請求的上下文中開始記錄快取新鮮度"""
+    freshness = CacheFreshness()
+    _freshness.set(freshness)
+    return freshness
+
+def mark_stale():
+    """標記目前請求使用了過期快取"""
+    freshness = _freshness.get()
+    if freshness is not None:
+        freshness.stale = True
+
+@contextlib.contextmanager
+def freshness_scope():
+    """另外記錄一段查詢的快取新鮮度（例如判斷結果能否再快取），結束後併入外層請求的記錄"""
+    outer = _freshness.get()
+    scope = CacheFreshness()
+    token = _freshness.set(scope)
+    try:
+        yield scope
+    finally:
+        _freshness.reset(token)
+        if scope.stale and outer is not None:
+            outer.stale = True
+
+# 全局報表快取實例
+report_cache = ReportCache()
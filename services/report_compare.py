@@ -0,0 +1,199 @@
+import os
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from google.analytics.data_v1beta.types import DateRange, RunReportRequest
+
+from services.ga4_decoder import decode_rows, decode_range_totals
+from services.date_resolver import date_resolver
+from services.report_query import report_query_compiler, ReportQuery, QueryValidationError
+
+logger = logging.getLogger(__name__)
+
+# GA4 單次查詢最多 4 個日期範圍
+GA4_MAX_DATE_RANGES = 4
+
+class ComparePeriod(BaseModel):
+    """比較期間；name 會成為 GA4 回應中的 dateRange 維度值"""
+    start_date: str
+    end_date: str
+    name: Optional[str] = None
+
+class CompareQuery(BaseModel):
+    """期間比較查詢：第一個期間為當期，與其餘期間逐一比較；
+    未指定期間時以 query 的日期範圍與其前一個等長期間比較"""
+    query: ReportQuery
+    periods: List[ComparePeriod] = []
+    limit: int = 20
+    movers: int = 5
+
+class ReportComparator:
+    """以單次 run_report（多個日期範圍）比較期間
+
+    所有期間放入同一個 RunReportRequest，GA4 回傳帶 dateRange 維度的列；
+    本地依維度值將各期間的列對齊為欄式陣列，計算差值、成長率與變動最大的項目，
+    只回傳前幾列與總計，取代客戶端分別查詢再自行比對。
+    """
+
+    def __init__(self):
+        self.row_limit = int(os.getenv("COMPARE_ROW_LIMIT", "10000"))
+        self.comparisons = 0
+        self.truncated = 0
+
+    def periods(self, compare: CompareQuery, property_id: str) -> List[ComparePeriod]:
+        """驗證比較期間；未指定時以查詢的日期範圍與其前一個等長期間比較"""
+        query = report_query_compiler.resolve(compare.query)
+        periods = compare.periods
+        today = date_resolver.today(property_id)
+        if not periods:
+            start = date_resolver.resolve(query.start_date, today)
+            end = date_resolver.resolve(query.end_date, today)
+            if start is None or end is None:
+                raise QueryValidationError("日期格式錯誤，請使用 YYYY-MM-DD、today、yesterday 或 NdaysAgo")
+            previous_end = start - timedelta(days=1)
+            previous_start = previous_end - (end - start)
+            periods = [
+                ComparePeriod(start_date=query.start_date, end_date=query.end_date),
+                ComparePeriod(start_date=previous_start.isoformat(), end_date=previous_end.isoformat())
+            ]
+
+        if not 2 <= len(periods) <= GA4_MAX_DATE_RANGES:
+            raise QueryValidationError(f"比較期間數量必須介於 2 與 {GA4_MAX_DATE_RANGES} 之間")
+
+        named = []
+        for position, period in enumerate(periods):
+            name = period.name or f"period_{position}"
+            if name.startswith("date_range_") or name.startswith("RESERVED_"):
+                raise QueryValidationError(f"期間名稱不可使用保留前綴: {name}")
+            named.append(period.model_copy(update={"name": name}))
+        if len({period.name for period in named}) != len(named):
+            raise QueryValidationError("期間名稱不可重複")
+        return named
+
+    def compile(self, compare: CompareQuery, periods: List[ComparePeriod], property_id: str) -> RunReportRequest:
+        """驗證並編譯為包含所有期間的單一 RunReportRequest（每個期間各自檢查日期限制）"""
+        query = report_query_compiler.resolve(compare.query)
+        if query.realtime:
+            raise QueryValidationError("即時報表不支援期間比較")
+        if compare.limit < 1 or compare.movers < 0:
+            raise QueryValidationError("limit 必須大於 0，movers 不可為負數")
+
+        # 比較需要各期間的完整列才能對齊，筆數以比較上限查詢並一律取得各期間總計
+        row_limit = min(self.row_limit, report_query_compiler.max_rows)
+        requests = [
+            report_query_compiler.compile(
+                query.model_copy(update={
+                    "start_date": period.start_date,
+                    "end_date": period.end_date,
+                    "limit": row_limit,
+                    "offset": 0,
+                    "totals": True
+                }),
+                property_id
+            )
+            for period in periods
+        ]
+
+        request = requests[0]
+        request.date_ranges = [
+            DateRange(start_date=period.start_date, end_date=period.end_date, name=period.name)
+            for period in periods
+        ]
+        return request
+
+    def compare(self, request: RunReportRequest, response, query: ReportQuery,
+                limit: int, movers: int) -> Dict:
+        """依維度值對齊各期間的列，計算差值、成長率、總計與變動最大的項目"""
+        query = report_query_compiler.resolve(query)
+        dimensions = query.dimensions
+        metrics = query.metrics
+        names = [date_range.name for date_range in request.date_ranges]
+        positions = {name: position for position, name in enumerate(names)}
+
+        # 欄式對齊：每個維度組合一個編號，每個指標每個期間一個陣列
+        rows = decode_rows(response)
+        index: Dict[tuple, int] = {}
+        keys: List[tuple] = []
+        slots = []
+        for row in rows:
+            key = tuple(row[name] for name in dimensions)
+            slot = index.get(key)
+            if slot is None:
+                slot = index[key] = len(keys)
+                keys.append(key)
+            slots.append(slot)
+
+        columns = {name: [[0] * len(keys) for _ in names] for name in metrics}
+        for row, slot in zip(rows, slots):
+            period = positions.get(row.get("dateRange"))
+            if period is None:
+                continue
+            for name in metrics:
+                columns[name][period][slot] = row[name]
+
+        primary = next((order.field for order in query.order_by if order.field in metrics), metrics[0])
+        current = columns[primary][0]
+        baseline = columns[primary][1]
+        ranked = sorted(range(len(keys)), key=lambda slot: current[slot], reverse=True)
+        by_delta = sorted(range(len(keys)), key=lambda slot: current[slot] - baseline[slot], reverse=True)
+
+        def record(slot: int) -> Dict:
+            item = dict(zip(dimensions, keys[slot]))
+            item.update(self._compare_values({name: [values[slot] for values in columns[name]] for name in metrics}))
+            return item
+
+        totals = decode_range_totals(response)
+        truncated = response.row_count > len(rows)
+        self.comparisons += 1
+        if truncated:
+            self.truncated += 1
+            logger.warning(f"期間比較結果已截斷 - 列數: {response.row_count}, 上限: {len(rows)}")
+
+        return {
+            "dimensions": dimensions,
+            "metrics": metrics,
+            "periods": [
+                {"name": date_range.name, "start_date": date_range.start_date, "end_date": date_range.end_date}
+                for date_range in request.date_ranges
+            ],
+            "totals": self._compare_values({
+                name: [totals.get(period, {}).get(name, 0) for period in names] for name in metrics
+            }),
+            "rows": [record(slot) for slot in ranked[:limit]],
+            "rowCount": len(keys),
+            "movers": {
+                "metric": primary,
+                "gainers": [record(slot) for slot in by_delta[:movers] if current[slot] > baseline[slot]],
+                "decliners": [
+                    record(slot) for slot in reversed(by_delta[-movers:] if movers else [])
+                    if current[slot] < baseline[slot]
+                ]
+            },
+            "truncated": truncated
+        }
+
+    def stats(self) -> dict:
+        """期間比較狀態（供健康檢查使用）"""
+        return {
+            "comparisons": self.comparisons,
+            "truncated": self.truncated,
+            "row_limit": self.row_limit
+        }
+
+    @staticmethod
+    def _compare_values(values: Dict[str, List]) -> Dict:
+        """各指標的期間值，以及當期相對其餘各期間的差值與成長率（%）"""
+        delta = {}
+        growth = {}
+        for name, series in values.items():
+            base = series[0]
+            delta[name] = [base - other for other in series[1:]]
+            growth[name] = [
+                round((base - other) / other * 100, 2) if other else None for other in series[1:]
+            ]
+        return {"values": values, "delta": delta, "growth": growth}
+
+# 全局期間比較實例
+report_comparator = ReportComparator()
@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from services.ga4_decoder import decode_rows
+from services.report_partitioner import SESSION_WEIGHTED_METRICS
+
+logger = logging.getLogger(__name__)
+
+# 立方體可提供的指標：可加總的指標直接加總，比率指標以工作階段數加權重算
+CUBE_METRICS = [
+    "sessions",
+    "engagedSessions",
+    "screenPageViews",
+    "newUsers",
+    "eventCount",
+    "userEngagementDuration",
+    "bounceRate",
+    "engagementRate",
+    "averageSessionDuration",
+]
+
+# 立方體定義：名稱 -> 最細粒度的維度（較粗的細分由本地彙總）
+CUBE_DEFINITIONS = {
+    "audience": ["country", "deviceCategory"],
+    "geography": ["country", "city"],
+    "technology": ["deviceCategory", "operatingSystem", "browser"],
+}
+
+class ReportCube:
+    """單一粒度的欄式報表數據，可依任意維度子集彙總"""
+
+    def __init__(self, dimensions: List[str], metrics: List[str], rows: List[Dict]):
+        self.dimensions = {name: [row[name] for row in rows] for name in dimensions}
+        self.metrics = {name: [row[name] for row in rows] for name in metrics}
+        self.size = len(rows)
+
+    def rollup(self, by: List[str], metrics: List[str]) -> List[Dict]:
+        """依 by 維度彙總指標；比率指標以「比率 × 工作階段數」加總後除以工作階段數"""
+        # 每列對應的群組編號
+        index: Dict[tuple, int] = {}
+        groups = []
+        keys = zip(*(self.dimensions[name] for name in by)) if by else [()] * self.size
+        for key in keys:
+            group = index.get(key)
+            if group is None:
+                group = index[key] = len(index)
+            groups.append(group)
+
+        sessions = self.metrics["sessions"]
+        session_totals = [0] * len(index)
+        for group, value in zip(groups, sessions):
+            session_totals[group] += value
+
+        columns = {}
+        for name in metrics:
+            totals = [0] * len(index)
+            if name in SESSION_WEIGHTED_METRICS:
+                for group, value, weight in zip(groups, self.metrics[name], sessions):
+                    totals[group] += value * weight
+                totals = [
+                    total / session_totals[group] if session_totals[group] else 0.0
+                    for group, total in enumerate(totals)
+                ]
+            else:
+                for group, value in zip(groups, self.metrics[name]):
+                    totals[group] += value
+            columns[name] = totals
+
+        rows = []
+        for key, group in index.items():
+            record = dict(zip(by, key))
+            for name in metrics:
+                record[name] = columns[name][group]
+            rows.append(record)
+        return rows
+
+class ReportCubeStore:
+    """報表立方體的選擇與快取
+
+    每個屬性與日期範圍只向 GA4 取得一次最細粒度的數據，
+    較粗的細分（例如只看設備、只看國家、作業系統 × 設備）在本地彙總，不再另外查詢。
+    只有可加總或可由組成指標重算的指標能彙總；其他指標（例如 totalUsers）由呼叫端直接查詢 GA4。
+    """
+
+    def __init__(self):
+        self.max_cubes = int(os.getenv("REPORT_CUBE_CACHE_SIZE", "200"))
+        self._cubes = OrderedDict()  # (property_id, 立方體名稱, 起始日, 結束日) -> (到期時間, ReportCube)
+        self.hits = 0
+        self.misses = 0
+
+    def select(self, by: List[str], metrics: List[str]) -> Optional[str]:
+        """選擇能回答查詢的最小立方體，沒有時回傳 None"""
+        if any(name not in CUBE_METRICS for name in metrics):
+            return None
+
+        candidates = [
+            (len(dimensions), name) for name, dimensions in CUBE_DEFINITIONS.items()
+            if set(by) <= set(dimensions)
+        ]
+        return min(candidates)[1] if candidates else None
+
+    def get(self, property_id: str, name: str, start_date: str, end_date: str) -> Optional[ReportCube]:
+        """讀取未過期的立方體"""
+        key = (property_id, name, start_date, end_date)
+        entry = self._cubes.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._cubes[key]
+            self.misses += 1
+            return None
+
+        self._cubes.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def build(self, property_id: str, name: str, start_date: str, end_date: str,
+              response, ttl: int, cache: bool = True) -> Optional[ReportCube]:
+        """由 GA4 回應建立立方體（cache 為 False 時不快取）；回應被截斷時無法精確彙總，回傳 None"""
+        if response.row_count > len(response.rows):
+            logger.info(f"立方體數據被截斷，改為直接查詢 - 立方體: {name}, 列數: {response.row_count}")
+            return None
+
+        cube = ReportCube(CUBE_DEFINITIONS[name], CUBE_METRICS, decode_rows(response))
+        if not cache:
+            return cube
+
+        self._cubes[(property_id, name, start_date, end_date)] = (time.monotonic() + ttl, cube)
+        while len(self._cubes) > self.max_cubes:
+            self._cubes.popitem(last=False)
+        return cube
+
+    def stats(self) -> dict:
+        """立方體快取狀態（供健康檢查使用）"""
+        return {
+            "cubes": len(self._cubes),
+            "rows": sum(cube.size for _, cube in self._cubes.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# 全局報表立方體實例
+report_cubes = ReportCubeStore()
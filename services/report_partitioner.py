@@ -0,0 +1,198 @@
+import os
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from google.analytics.data_v1beta.types import (
+    RunReportRequest,
+    RunReportResponse,
+    DateRange
+)
+
+from services.ga4_decoder import decode_rows, sort_rows, encode_response
+from services.date_resolver import date_resolver
+
+logger = logging.getLogger(__name__)
+
+# 跨日可直接加總的指標
+ADDITIVE_METRICS = {
+    "screenPageViews",
+    "sessions",
+    "engagedSessions",
+    "newUsers",
+    "eventCount",
+    "userEngagementDuration",
+    "conversions",
+    "keyEvents",
+    "totalRevenue",
+}
+
+# 以工作階段數加權的比率指標：每日「比率 × 工作階段數」即為可加總的分子
+SESSION_WEIGHTED_METRICS = {
+    "bounceRate",
+    "engagementRate",
+    "averageSessionDuration",
+}
+
+class ReportPartitioner:
+    """歷史報表的每日分區與合併
+
+    將單一日期範圍的 run_report 查詢拆成每日一個分區，各分區獨立快取；
+    已結束的日期可長期快取，滑動視窗的儀表板每次只需查詢仍在變動的日期。
+    只有能在本地精確合併的查詢才會分區：
+    - 含 date 維度的查詢（各列本身就屬於單一日期，直接串接）
+    - 指標皆可加總或可由組成指標重算（totalUsers 等跨日去重的指標不可合併）
+    """
+
+    def __init__(self):
+        self.max_days = int(os.getenv("GA4_PARTITION_MAX_DAYS", "90"))
+        self.row_limit = int(os.getenv("GA4_PARTITION_ROW_LIMIT", "10000"))
+        self.partitioned = 0
+        self.fallbacks = 0
+
+    def can_partition(self, request: RunReportRequest, property_id: Optional[str] = None) -> bool:
+        """查詢是否可依日期分區後於本地精確合併"""
+        return self._day_range(request, property_id) is not None
+
+    def split(self, request: RunReportRequest, property_id: Optional[str] = None) -> Optional[List[RunReportRequest]]:
+        """將查詢拆成每日分區，不可分區時回傳 None
+
+        分區不帶排序與筆數限制，因此不同排序、limit 的相同查詢共用分區快取。
+        """
+        day_range = self._day_range(request, property_id)
+        if day_range is None:
+            return None
+
+        start, end = day_range
+        partitions = []
+        day = start
+        while day <= end:
+            partition = RunReportRequest.wrap(self._copy(request))
+            partition.date_ranges = [DateRange(start_date=day.isoformat(), end_date=day.isoformat())]
+            partition.order_bys = []
+            partition.limit = self.row_limit
+            partition.offset = 0
+            partitions.append(partition)
+            day += timedelta(days=1)
+
+        return partitions
+
+    def merge(self, request: RunReportRequest, responses: List) -> Optional[RunReportResponse]:
+        """合併每日分區的回應，並套用原查詢的排序與筆數限制
+
+        任一分區被截斷（列數超過分區上限）時無法精確合併，回傳 None。
+        """
+        for response in responses:
+            if response.row_count > len(response.rows):
+                self.fallbacks += 1
+                logger.info(f"分區回應被截斷，改為整段查詢 - 列數: {response.row_count}")
+                return None
+
+        dimension_names = [dimension.name for dimension in request.dimensions]
+        metric_names = [metric.name for metric in request.metrics]
+        metric_types = self._metric_types(responses)
+
+        if "date" in dimension_names:
+            # 含 date 維度時每列只來自單一分區，直接串接各分區的列（不重新加權比率指標）
+            rows = [row for response in responses for row in decode_rows(response)]
+        else:
+            rows = self._merge_rows(responses, dimension_names, metric_names)
+
+        rows = sort_rows(rows, request.order_bys)
+        row_count = len(rows)
+        if request.limit:
+            rows = rows[request.offset:request.offset + request.limit]
+
+        self.partitioned += 1
+        return encode_response(dimension_names, metric_names, metric_types, rows, row_count)
+
+    def stats(self) -> dict:
+        """分區狀態（供健康檢查使用）"""
+        return {
+            "max_days": self.max_days,
+            "row_limit": self.row_limit,
+            "partitioned": self.partitioned,
+            "fallbacks": self.fallbacks
+        }
+
+    def mergeable(self, request: RunReportRequest) -> bool:
+        """查詢的維度與指標是否能由每日分區精確合併（不考慮日期範圍）"""
+        if len(request.date_ranges) != 1 or request.metric_aggregations or request.offset:
+            return False
+        # 指標篩選作用於整段期間的彙總值，逐日篩選後加總的結果不同
+        if "metric_filter" in request:
+            return False
+
+        dimension_names = {dimension.name for dimension in request.dimensions}
+        if "date" in dimension_names:
+            return True
+
+        metric_names = {metric.name for metric in request.metrics}
+        if not metric_names <= ADDITIVE_METRICS | SESSION_WEIGHTED_METRICS:
+            return False
+        # 比率指標需要工作階段數作為權重
+        return not (metric_names & SESSION_WEIGHTED_METRICS and "sessions" not in metric_names)
+
+    def _day_range(self, request: RunReportRequest, property_id: Optional[str]):
+        """回傳可分區查詢的 (起始日, 結束日)，不可分區時回傳 None"""
+        if not self.mergeable(request):
+            return None
+
+        today = date_resolver.today(property_id)
+        date_range = request.date_ranges[0]
+        start = date_resolver.resolve(date_range.start_date, today)
+        end = date_resolver.resolve(date_range.end_date, today)
+        if start is None or end is None or end > today:
+            return None
+
+        days = (end - start).days + 1
+        if days < 2 or days > self.max_days:
+            return None
+        return start, end
+
+    @staticmethod
+    def _merge_rows(responses: List, dimension_names: List[str], metric_names: List[str]) -> List[Dict]:
+        """跨日合併相同維度值的列：可加總指標直接加總，比率指標以工作階段數加權重算"""
+        merged: Dict[tuple, Dict] = {}
+        for response in responses:
+            for row in decode_rows(response):
+                key = tuple(row.get(name, "") for name in dimension_names)
+                sessions = row.get("sessions", 0)
+                totals = merged.get(key)
+                if totals is None:
+                    totals = merged[key] = {name: 0 for name in metric_names}
+                for name in metric_names:
+                    if name in SESSION_WEIGHTED_METRICS:
+                        totals[name] += row[name] * sessions
+                    else:
+                        totals[name] += row[name]
+
+        rows = []
+        for key, totals in merged.items():
+            record = dict(zip(dimension_names, key))
+            sessions = totals.get("sessions", 0)
+            for name in metric_names:
+                if name in SESSION_WEIGHTED_METRICS:
+                    record[name] = totals[name] / sessions if sessions else 0.0
+                else:
+                    record[name] = totals[name]
+            rows.append(record)
+        return rows
+
+    @staticmethod
+    def _copy(request: RunReportRequest):
+        """複製底層 protobuf 訊息"""
+        raw = RunReportRequest.pb()()
+        raw.CopyFrom(RunReportRequest.pb(request))
+        return raw
+
+    @staticmethod
+    def _metric_types(responses: List) -> Dict[str, int]:
+        """從分區回應取得指標型別"""
+        for response in responses:
+            if response.metric_headers:
+                return {header.name: header.type_ for header in response.metric_headers}
+        return {}
+
+# 全局報表分區實例
+report_partitioner = ReportPartitioner()
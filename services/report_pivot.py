@@ -0,0 +1,137 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from google.analytics.data_v1beta.types import RunPivotReportRequest, Pivot, OrderBy
+
+from services.ga4_decoder import decode_pivot
+from services.report_query import report_query_compiler, ReportQuery, QueryFilter, QueryValidationError
+
+logger = logging.getLogger(__name__)
+
+class PivotQuery(BaseModel):
+    """交叉表查詢：rows × columns 的每個組合一格，每個指標一個矩陣；
+    指定 preset 時以預設查詢為基礎，明確提供的欄位覆寫預設值"""
+    preset: Optional[str] = None
+    rows: List[str] = []
+    columns: List[str] = []
+    metrics: List[str] = []
+    start_date: str = "7daysAgo"
+    end_date: str = "today"
+    dimension_filters: List[QueryFilter] = []
+    metric_filters: List[QueryFilter] = []
+    row_limit: int = 20
+    column_limit: int = 10
+
+# 預設交叉表
+PIVOT_PRESETS: Dict[str, PivotQuery] = {
+    "device_by_country": PivotQuery(
+        rows=["country"],
+        columns=["deviceCategory"],
+        metrics=["totalUsers", "sessions"],
+        column_limit=5
+    ),
+    "channel_by_device": PivotQuery(
+        rows=["sessionDefaultChannelGroup"],
+        columns=["deviceCategory"],
+        metrics=["sessions", "engagementRate"],
+        column_limit=5
+    ),
+    "page_by_device": PivotQuery(
+        rows=["pagePath"],
+        columns=["deviceCategory"],
+        metrics=["screenPageViews"],
+        column_limit=5
+    ),
+}
+
+class ReportPivotCompiler:
+    """將 PivotQuery 編譯為 GA4 run_pivot_report 查詢並解碼為密集矩陣
+
+    欄位與成本限制沿用通用報表查詢的驗證；列與欄各為一個 pivot，
+    依第一個指標由大到小取前 row_limit / column_limit 個值，GA4 只回傳這些組合，
+    不必查詢全部組合的扁平報表再於本地重組。
+    """
+
+    # GA4 batchRunPivotReports 單次最多 5 個報表
+    MAX_BATCH_REPORTS = 5
+
+    def __init__(self):
+        self.max_cells = int(os.getenv("PIVOT_MAX_CELLS", "10000"))
+        self.pivots = 0
+
+    def resolve(self, query: PivotQuery) -> PivotQuery:
+        """套用預設交叉表，回傳不含 preset 的完整查詢"""
+        if not query.preset:
+            return query
+
+        preset = PIVOT_PRESETS.get(query.preset)
+        if preset is None:
+            raise QueryValidationError(f"不支援的預設交叉表: {query.preset}")
+
+        overrides = {
+            field: getattr(query, field)
+            for field in query.model_fields_set if field != "preset"
+        }
+        return preset.model_copy(update=overrides)
+
+    def compile(self, query: PivotQuery, property_id: str) -> RunPivotReportRequest:
+        """驗證並編譯為 RunPivotReportRequest"""
+        query = self.resolve(query)
+        if not query.rows or not query.columns:
+            raise QueryValidationError("交叉表需要至少一個列維度與一個欄維度")
+        overlap = set(query.rows) & set(query.columns)
+        if overlap:
+            raise QueryValidationError(f"維度不可同時作為列與欄: {', '.join(sorted(overlap))}")
+        if query.row_limit < 1 or query.column_limit < 1:
+            raise QueryValidationError("row_limit 與 column_limit 必須大於 0")
+        if query.row_limit * query.column_limit > self.max_cells:
+            raise QueryValidationError(f"交叉表格數 (row_limit × column_limit) 超過上限 {self.max_cells}")
+
+        # 以通用報表查詢驗證欄位、日期與成本限制，並取得已正規化的欄位名稱與篩選條件
+        request = report_query_compiler.compile(
+            ReportQuery(
+                dimensions=query.rows + query.columns,
+                metrics=query.metrics,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                dimension_filters=query.dimension_filters,
+                metric_filters=query.metric_filters,
+                limit=min(query.row_limit * query.column_limit, report_query_compiler.max_rows)
+            ),
+            property_id
+        )
+
+        names = [dimension.name for dimension in request.dimensions]
+        order = [OrderBy(metric={"metric_name": request.metrics[0].name}, desc=True)]
+        pivot = RunPivotReportRequest(
+            property=request.property,
+            dimensions=request.dimensions,
+            metrics=request.metrics,
+            date_ranges=request.date_ranges,
+            pivots=[
+                Pivot(field_names=names[:len(query.rows)], limit=query.row_limit, order_bys=order),
+                Pivot(field_names=names[len(query.rows):], limit=query.column_limit, order_bys=order),
+            ]
+        )
+        if "dimension_filter" in request:
+            pivot.dimension_filter = request.dimension_filter
+        if "metric_filter" in request:
+            pivot.metric_filter = request.metric_filter
+        return pivot
+
+    def decode(self, request: RunPivotReportRequest, response) -> Dict:
+        """將交叉表回應解碼為密集矩陣"""
+        self.pivots += 1
+        return decode_pivot(response, list(request.pivots[0].field_names), list(request.pivots[1].field_names))
+
+    def stats(self) -> dict:
+        """交叉表狀態（供健康檢查使用）"""
+        return {
+            "pivots": self.pivots,
+            "max_cells": self.max_cells
+        }
+
+# 全局交叉表查詢實例
+report_pivot_compiler = ReportPivotCompiler()
@@ -0,0 +1,361 @@
+import os
+import re
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel
+from google.analytics.data_v1beta.types import (
+    RunReportRequest,
+    RunRealtimeReportRequest,
+    DateRange,
+    OrderBy,
+    FilterExpression,
+    FilterExpressionList,
+    Filter,
+    MetricAggregation
+)
+
+from services.date_resolver import date_resolver
+from services.property_metadata import property_metadata
+
+logger = logging.getLogger(__name__)
+
+_FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9_:]*$")
+
+# 即時報表可用的維度與指標（getMetadata 只涵蓋一般報表，即時報表以固定清單驗證）
+REALTIME_DIMENSIONS = {
+    "appVersion", "audienceId", "audienceName", "audienceResourceName", "city", "cityId",
+    "country", "countryId", "deviceCategory", "eventName", "minutesAgo", "platform",
+    "streamId", "streamName", "unifiedScreenName",
+}
+REALTIME_METRICS = {"activeUsers", "conversions", "eventCount", "keyEvents", "screenPageViews"}
+
+# 高基數維度：組合越多，回傳列數與 GA4 配額成本越高
+HIGH_CARDINALITY_DIMENSIONS = {
+    "pagePath", "pagePathPlusQueryString", "pageLocation", "fullPageUrl", "pageTitle",
+    "pageReferrer", "landingPage", "landingPagePlusQueryString", "searchTerm", "city", "cityId",
+    "unifiedScreenName", "unifiedPagePathScreen", "dateHour", "dateHourMinute", "transactionId",
+    "itemName", "itemId",
+}
+
+_STRING_MATCH_TYPES = {
+    "exact": Filter.StringFilter.MatchType.EXACT,
+    "begins_with": Filter.StringFilter.MatchType.BEGINS_WITH,
+    "ends_with": Filter.StringFilter.MatchType.ENDS_WITH,
+    "contains": Filter.StringFilter.MatchType.CONTAINS,
+    "full_regexp": Filter.StringFilter.MatchType.FULL_REGEXP,
+    "partial_regexp": Filter.StringFilter.MatchType.PARTIAL_REGEXP,
+}
+
+_NUMERIC_OPERATIONS = {
+    "equal": Filter.NumericFilter.Operation.EQUAL,
+    "less_than": Filter.NumericFilter.Operation.LESS_THAN,
+    "less_than_or_equal": Filter.NumericFilter.Operation.LESS_THAN_OR_EQUAL,
+    "greater_than": Filter.NumericFilter.Operation.GREATER_THAN,
+    "greater_than_or_equal": Filter.NumericFilter.Operation.GREATER_THAN_OR_EQUAL,
+}
+
+class QueryValidationError(ValueError):
+    """查詢不合法或超出成本限制"""
+
+class QueryFilter(BaseModel):
+    """篩選條件：字串比對 (exact / begins_with / ends_with / contains / full_regexp /
+    partial_regexp)、清單 (in_list) 或數值比較 (equal / less_than / greater_than ...)"""
+    field: str
+    operator: str = "exact"
+    value: Optional[Union[float, str]] = None
+    values: Optional[List[str]] = None
+    case_sensitive: bool = False
+
+class QueryOrder(BaseModel):
+    """排序條件（維度或指標名稱）"""
+    field: str
+    desc: bool = True
+
+class ReportQuery(BaseModel):
+    """通用報表查詢；指定 preset 時以預設查詢為基礎，明確提供的欄位覆寫預設值"""
+    preset: Optional[str] = None
+    realtime: bool = False
+    dimensions: List[str] = []
+    metrics: List[str] = []
+    start_date: str = "7daysAgo"
+    end_date: str = "today"
+    dimension_filters: List[QueryFilter] = []
+    metric_filters: List[QueryFilter] = []
+    order_by: List[QueryOrder] = []
+    limit: int = 100
+    offset: int = 0
+    totals: bool = False
+
+# 預設查詢：既有的報表端點都建立在這些預設之上
+QUERY_PRESETS: Dict[str, ReportQuery] = {
+    "traffic_sources": ReportQuery(
+        dimensions=["sessionDefaultChannelGroup", "sessionSource", "sessionMedium"],
+        metrics=["sessions", "totalUsers", "newUsers", "bounceRate"],
+        order_by=[QueryOrder(field="sessions")],
+        limit=20
+    ),
+    "pageviews": ReportQuery(
+        dimensions=["pagePath", "pageTitle"],
+        metrics=["screenPageViews", "sessions", "averageSessionDuration", "bounceRate"],
+        order_by=[QueryOrder(field="screenPageViews")],
+        limit=20
+    ),
+    "devices": ReportQuery(
+        dimensions=["deviceCategory", "operatingSystem", "browser"],
+        metrics=["totalUsers", "sessions", "bounceRate", "averageSessionDuration"],
+        order_by=[QueryOrder(field="totalUsers")],
+        limit=15
+    ),
+    "geographic": ReportQuery(
+        dimensions=["country", "city"],
+        metrics=["totalUsers", "sessions", "screenPageViews"],
+        order_by=[QueryOrder(field="totalUsers")],
+        limit=20
+    ),
+    "top_pages": ReportQuery(
+        dimensions=["pagePath", "pageTitle", "fullPageUrl"],
+        metrics=["screenPageViews", "totalUsers", "sessions", "averageSessionDuration", "bounceRate"],
+        order_by=[QueryOrder(field="screenPageViews")],
+        start_date="1daysAgo",
+        limit=20
+    ),
+    "page_sources": ReportQuery(
+        dimensions=["pagePath", "sessionSource", "sessionMedium"],
+        metrics=["screenPageViews", "sessions", "engagedSessions"],
+        order_by=[QueryOrder(field="screenPageViews")],
+        limit=20
+    ),
+    "search_terms": ReportQuery(
+        dimensions=["searchTerm", "pagePath"],
+        metrics=["totalUsers", "sessions", "screenPageViews", "averageSessionDuration"],
+        order_by=[QueryOrder(field="totalUsers")],
+        limit=20
+    ),
+    "performance": ReportQuery(
+        dimensions=["pagePath", "pageTitle", "deviceCategory"],
+        metrics=["averageSessionDuration", "bounceRate", "screenPageViews", "engagementRate", "sessionsPerUser"],
+        order_by=[QueryOrder(field="screenPageViews")],
+        limit=20
+    ),
+    "realtime_overview": ReportQuery(
+        realtime=True,
+        dimensions=["country", "deviceCategory"],
+        metrics=["activeUsers", "screenPageViews", "eventCount"],
+        totals=True,
+        limit=1000
+    ),
+    "realtime_top_screens": ReportQuery(
+        realtime=True,
+        dimensions=["unifiedScreenName"],
+        metrics=["activeUsers", "screenPageViews"],
+        order_by=[QueryOrder(field="activeUsers")],
+        limit=10
+    ),
+}
+
+class ReportQueryCompiler:
+    """將 ReportQuery 驗證並編譯為 GA4 查詢
+
+    驗證包含欄位名稱（一般報表以同步的屬性中繼資料、即時報表以固定清單）
+    與成本限制（維度 / 指標數、高基數維度數、列數、日期範圍天數）。
+    編譯結果依屬性與查詢內容快取，相同的查詢不必重複驗證與建立。
+    """
+
+    def __init__(self):
+        self.max_dimensions = int(os.getenv("QUERY_MAX_DIMENSIONS", "9"))
+        self.max_metrics = int(os.getenv("QUERY_MAX_METRICS", "10"))
+        self.max_high_cardinality = int(os.getenv("QUERY_MAX_HIGH_CARDINALITY_DIMENSIONS", "3"))
+        self.max_rows = int(os.getenv("QUERY_MAX_ROWS", "10000"))
+        self.max_days = int(os.getenv("QUERY_MAX_DAYS", "400"))
+        self.max_filters = int(os.getenv("QUERY_MAX_FILTERS", "10"))
+        self.max_plans = int(os.getenv("QUERY_PLAN_CACHE_SIZE", "500"))
+        self._plans = OrderedDict()  # (property_id, 中繼資料同步時間, 查詢 JSON) -> (查詢類別, 序列化查詢)
+        self.plan_hits = 0
+        self.plan_misses = 0
+
+    def resolve(self, query: ReportQuery) -> ReportQuery:
+        """套用預設查詢，回傳不含 preset 的完整查詢"""
+        if not query.preset:
+            return query
+
+        preset = QUERY_PRESETS.get(query.preset)
+        if preset is None:
+            raise QueryValidationError(f"不支援的預設查詢: {query.preset}")
+
+        overrides = {
+            field: getattr(query, field)
+            for field in query.model_fields_set if field != "preset"
+        }
+        return preset.model_copy(update=overrides)
+
+    def preset(self, name: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+               limit: Optional[int] = None) -> ReportQuery:
+        """以預設查詢建立指定日期範圍與筆數的查詢（未指定者沿用預設值）"""
+        update = {"start_date": start_date, "end_date": end_date, "limit": limit}
+        return QUERY_PRESETS[name].model_copy(
+            update={field: value for field, value in update.items() if value is not None}
+        )
+
+    def compile(self, query: ReportQuery, property_id: str, cache: bool = True):
+        """驗證並編譯查詢（含成本限制），結果依屬性與查詢內容快取；
+        cache 為 False 時不讀寫計畫快取（例如逐日的快照查詢，大量只用一次的計畫會擠掉常用查詢）"""
+        query = self.resolve(query)
+        key = (property_id, property_metadata.synced_at(property_id), query.model_dump_json())
+        plan = self._plans.get(key) if cache else None
+        if plan is not None:
+            self.plan_hits += 1
+            self._plans.move_to_end(key)
+            request_type, payload = plan
+            return request_type.deserialize(payload)
+
+        self.plan_misses += 1
+        self.check_limits(query, property_id)
+        request = self.build(query, property_id)
+        if not query.realtime:
+            property_metadata.canonicalize(property_id, request)
+            property_metadata.validate(property_id, request)
+        if not cache:
+            return request
+
+        # 儲存序列化結果：相對日期等欄位在執行時才就地改寫，快取的計畫不受影響
+        self._plans[key] = (type(request), type(request).serialize(request))
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+        return request
+
+    def check_limits(self, query: ReportQuery, property_id: Optional[str] = None):
+        """檢查欄位與成本限制"""
+        if not query.metrics:
+            raise QueryValidationError("請至少指定一個指標")
+        if len(query.dimensions) > self.max_dimensions:
+            raise QueryValidationError(f"維度數量超過上限 {self.max_dimensions}")
+        if len(query.metrics) > self.max_metrics:
+            raise QueryValidationError(f"指標數量超過上限 {self.max_metrics}")
+        if len(query.dimension_filters) + len(query.metric_filters) > self.max_filters:
+            raise QueryValidationError(f"篩選條件數量超過上限 {self.max_filters}")
+        if not 1 <= query.limit <= self.max_rows:
+            raise QueryValidationError(f"limit 必須介於 1 與 {self.max_rows} 之間")
+        if query.offset < 0:
+            raise QueryValidationError("offset 不可為負數")
+
+        fields = query.dimensions + query.metrics + [item.field for item in query.dimension_filters + query.metric_filters]
+        invalid = [name for name in fields if not _FIELD_NAME_PATTERN.match(name)]
+        if invalid:
+            raise QueryValidationError(f"欄位名稱格式錯誤: {', '.join(invalid)}")
+
+        high_cardinality = [name for name in query.dimensions if name in HIGH_CARDINALITY_DIMENSIONS]
+        if len(high_cardinality) > self.max_high_cardinality:
+            raise QueryValidationError(
+                f"高基數維度過多 ({', '.join(high_cardinality)})，上限 {self.max_high_cardinality}"
+            )
+
+        order_fields = [order.field for order in query.order_by]
+        unknown_order = [name for name in order_fields if name not in query.dimensions + query.metrics]
+        if unknown_order:
+            raise QueryValidationError(f"排序欄位必須是查詢中的維度或指標: {', '.join(unknown_order)}")
+
+        if query.realtime:
+            invalid = [
+                name for name in query.dimensions
+                if name not in REALTIME_DIMENSIONS and not name.startswith("customUser:")
+            ]
+            invalid += [name for name in query.metrics if name not in REALTIME_METRICS]
+            if invalid:
+                raise QueryValidationError(f"即時報表不支援的欄位: {', '.join(invalid)}")
+            return
+
+        today = date_resolver.today(property_id)
+        start = date_resolver.resolve(query.start_date, today)
+        end = date_resolver.resolve(query.end_date, today)
+        if start is None or end is None:
+            raise QueryValidationError("日期格式錯誤，請使用 YYYY-MM-DD、today、yesterday 或 NdaysAgo")
+        if start > end:
+            raise QueryValidationError("start_date 不可晚於 end_date")
+        if (end - start).days + 1 > self.max_days:
+            raise QueryValidationError(f"日期範圍超過上限 {self.max_days} 天")
+
+    def build(self, query: ReportQuery, property_id: str):
+        """將查詢建立為 RunReportRequest 或 RunRealtimeReportRequest（不檢查成本限制）"""
+        fields = {
+            "property": f"properties/{property_id}",
+            "dimensions": [{"name": name} for name in query.dimensions],
+            "metrics": [{"name": name} for name in query.metrics],
+            "order_bys": [self._build_order(order, query) for order in query.order_by],
+            "limit": query.limit,
+        }
+        if query.dimension_filters:
+            fields["dimension_filter"] = self._build_filter_expression(query.dimension_filters)
+        if query.metric_filters:
+            fields["metric_filter"] = self._build_filter_expression(query.metric_filters)
+        if query.totals:
+            fields["metric_aggregations"] = [MetricAggregation.TOTAL]
+
+        if query.realtime:
+            return RunRealtimeReportRequest(**fields)
+
+        if query.offset:
+            fields["offset"] = query.offset
+        return RunReportRequest(
+            date_ranges=[DateRange(start_date=query.start_date, end_date=query.end_date)],
+            **fields
+        )
+
+    def stats(self) -> dict:
+        """編譯快取狀態（供健康檢查使用）"""
+        return {
+            "plans": len(self._plans),
+            "plan_hits": self.plan_hits,
+            "plan_misses": self.plan_misses
+        }
+
+    @staticmethod
+    def _build_order(order: QueryOrder, query: ReportQuery) -> OrderBy:
+        if order.field in query.metrics:
+            return OrderBy(metric={"metric_name": order.field}, desc=order.desc)
+        return OrderBy(dimension={"dimension_name": order.field}, desc=order.desc)
+
+    @classmethod
+    def _build_filter_expression(cls, filters: List[QueryFilter]) -> FilterExpression:
+        """多個篩選條件以 AND 組合"""
+        expressions = [FilterExpression(filter=cls._build_filter(item)) for item in filters]
+        if len(expressions) == 1:
+            return expressions[0]
+        return FilterExpression(and_group=FilterExpressionList(expressions=expressions))
+
+    @staticmethod
+    def _build_filter(item: QueryFilter) -> Filter:
+        operator = item.operator.lower()
+        if operator in _STRING_MATCH_TYPES:
+            if item.value is None:
+                raise QueryValidationError(f"篩選條件 {item.field} 缺少 value")
+            return Filter(
+                field_name=item.field,
+                string_filter=Filter.StringFilter(
+                    match_type=_STRING_MATCH_TYPES[operator],
+                    value=str(item.value),
+                    case_sensitive=item.case_sensitive
+                )
+            )
+        if operator == "in_list":
+            if not item.values:
+                raise QueryValidationError(f"篩選條件 {item.field} 缺少 values")
+            return Filter(
+                field_name=item.field,
+                in_list_filter=Filter.InListFilter(values=item.values, case_sensitive=item.case_sensitive)
+            )
+        if operator in _NUMERIC_OPERATIONS:
+            try:
+                number = float(item.value)
+            except (TypeError, ValueError):
+                raise QueryValidationError(f"篩選條件 {item.field} 需要數值 value")
+            value = {"int64_value": int(number)} if number.is_integer() else {"double_value": number}
+            return Filter(
+                field_name=item.field,
+                numeric_filter=Filter.NumericFilter(operation=_NUMERIC_OPERATIONS[operator], value=value)
+            )
+        raise QueryValidationError(f"不支援的篩選運算子: {item.operator}")
+
+# 全局報表查詢編譯實例
+report_query_compiler = ReportQueryCompiler()
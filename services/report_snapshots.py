@@ -0,0 +1,170 @@
+import os
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from database import async_session_factory
+from oauth import OAuthUserManager, oauth_handler
+from ga4_extensions import GA4DataService
+from services.ga4_clients import ga4_client_registry
+from services.date_resolver import date_resolver
+from services.report_query import report_query_compiler, ReportQuery
+from services.report_partitioner import report_partitioner
+from services.report_store import report_store
+from services.metadata_sync import metadata_sync
+
+logger = logging.getLogger(__name__)
+
+# 每日快照的報表：頁面、來源、頁面 × 來源、設備、地理
+SNAPSHOT_PRESETS = ["top_pages", "pageviews", "traffic_sources", "page_sources", "devices", "geographic"]
+
+class ReportSnapshotJob:
+    """每日報表快照背景工作
+
+    每個活躍屬性的日期一旦不再變動，就預先查詢該日的常用報表並寫入快照儲存，
+    之後查詢已結束日期的 /analytics/* 端點直接由資料庫回傳，不必即時查詢 GA4。
+    快照一律為完整粒度（不帶排序、筆數為分區上限）：可分區的報表即為每日分區，
+    單日查詢由快照在本地投影出自己的排序與筆數，SQL 查詢也能取得完整的每日數據。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_REPORT_SNAPSHOTS", "true").lower() == "true"
+        self.interval = int(os.getenv("REPORT_SNAPSHOT_INTERVAL", "3600"))
+        self.backfill_days = int(os.getenv("REPORT_SNAPSHOT_BACKFILL_DAYS", "7"))
+        self.retention_days = int(os.getenv("REPORT_SNAPSHOT_RETENTION_DAYS", "400"))
+
+        self.snapshots = 0
+        self.failed = 0
+        self.pruned = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """啟動背景快照工作"""
+        if not self.enabled or not report_store.active:
+            logger.info("每日報表快照已停用")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"每日報表快照已啟動 - 間隔: {self.interval}s")
+
+    async def stop(self):
+        """停止背景快照工作"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("每日報表快照已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> dict:
+        """快照工作狀態（供健康檢查使用）"""
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "backfill_days": self.backfill_days,
+            "snapshots": self.snapshots,
+            "failed": self.failed,
+            "pruned": self.pruned,
+            **report_store.stats()
+        }
+
+    async def _run(self):
+        """快照主循環"""
+        while True:
+            try:
+                await self.snapshot_due()
+                self.pruned += await report_store.prune(
+                    (date.today() - timedelta(days=self.retention_days)).isoformat()
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"每日報表快照循環失敗: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    async def snapshot_due(self):
+        """為每個活躍屬性寫入最近已不再變動日期的快照"""
+        owners = await metadata_sync.load_owners()
+        for property_id, owner_ids in owners.items():
+            days = self.settled_days(property_id)
+            if not days:
+                continue
+            try:
+                await self.snapshot_property(property_id, owner_ids, days)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"每日報表快照失敗 - 屬性: {property_id}, 錯誤: {e}")
+
+    def settled_days(self, property_id: str) -> List[date]:
+        """回補範圍內數據已不再變動的日期"""
+        now = date_resolver.now(property_id)
+        today = now.date()
+        days = [today - timedelta(days=offset) for offset in range(1, self.backfill_days + 1)]
+        return [day for day in days if date_resolver.immutable_at(day, property_id) <= now]
+
+    def snapshot_queries(self, property_id: str, day: date) -> Dict[str, ReportQuery]:
+        """單日快照的完整粒度查詢：報表名稱 -> 查詢（與每日分區的查詢形式相同）"""
+        return {
+            name: report_query_compiler.preset(name, day.isoformat(), day.isoformat()).model_copy(
+                update={"order_by": [], "limit": report_partitioner.row_limit}
+            )
+            for name in SNAPSHOT_PRESETS
+        }
+
+    async def snapshot_property(self, property_id: str, owner_ids: List[int], days: List[date]):
+        """寫入單一屬性尚未快照的報表"""
+        pending = []
+        for day in days:
+            for query in self.snapshot_queries(property_id, day).values():
+                request = report_query_compiler.compile(query, property_id, cache=False)
+                if not await report_store.exists(property_id, request):
+                    pending.append(query)
+        if not pending:
+            return
+
+        # 第一個查詢決定可用的憑證，其餘查詢沿用
+        data_service = await self._first_snapshot(property_id, owner_ids, pending[0])
+        self.snapshots += 1
+        for query in pending[1:]:
+            await data_service.run_query(query)
+            self.snapshots += 1
+        logger.info(f"已寫入每日報表快照 - 屬性: {property_id}, 報表: {len(pending)}")
+
+    async def _first_snapshot(self, property_id: str, owner_ids: List[int], query: ReportQuery) -> GA4DataService:
+        """以實際查詢選擇憑證：先用 Service Account，失敗時依序改用屬性擁有者的 OAuth token，回傳成功的數據服務"""
+        try:
+            data_service = GA4DataService(property_id=property_id)
+            await data_service.run_query(query)
+            return data_service
+        except Exception as service_account_error:
+            last_error = service_account_error
+
+        for user_id in owner_ids:
+            async with async_session_factory() as session:
+                access_token = await OAuthUserManager.get_valid_access_token(session, user_id, oauth_handler)
+            if access_token is None:
+                continue
+            try:
+                data_service = GA4DataService(
+                    property_id=property_id,
+                    client=ga4_client_registry.get_oauth_client(user_id, access_token)
+                )
+                await data_service.run_query(query)
+                return data_service
+            except Exception as e:
+                last_error = e
+
+        raise last_error
+
+# 全局每日報表快照實例
+report_snapshot_job = ReportSnapshotJob()
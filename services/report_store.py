@@ -0,0 +1,191 @@
+import os
+import logging
+from typing import List, Optional
+
+from sqlalchemy import select, delete
+from google.analytics.data_v1beta.types import RunReportRequest, RunReportResponse
+
+from services.ga4_decoder import project_response
+from services.report_cache import report_cache
+from services.date_resolver import date_resolver
+from services.report_partitioner import report_partitioner
+
+logger = logging.getLogger(__name__)
+
+class ReportSnapshotStore:
+    """已結束日期報表的持久化儲存
+
+    日期範圍已不再變動（超過數據處理期）的 run_report 回應寫入資料庫，
+    之後相同的查詢（包含重新啟動後）直接由資料庫回傳，不再消耗 GA4 配額；
+    只有排序或筆數不同的查詢可由完整粒度（不帶排序、分區筆數上限）的快照在本地投影。
+    資料庫由 V2 啟動時掛上；未掛上時（例如 V1）所有操作皆為空操作。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_REPORT_STORE", "true").lower() == "true"
+        self._session_factory = None
+        self._model = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def attach(self, session_factory):
+        """掛上資料庫（V2 啟動時呼叫）"""
+        if not self.enabled or session_factory is None:
+            return
+
+        from models import GA4ReportSnapshot
+        self._session_factory = session_factory
+        self._model = GA4ReportSnapshot
+        logger.info("報表快照儲存已啟用")
+
+    @property
+    def active(self) -> bool:
+        return self._session_factory is not None
+
+    def is_settled(self, request, property_id: str) -> bool:
+        """查詢的日期範圍是否皆已不再變動"""
+        date_ranges = list(getattr(request, "date_ranges", []) or [])
+        if not date_ranges:
+            return False
+
+        now = date_resolver.now(property_id)
+        for date_range in date_ranges:
+            if not date_resolver.is_absolute(date_range.start_date) or not date_resolver.is_absolute(date_range.end_date):
+                return False
+            end = date_resolver.resolve(date_range.end_date, now.date())
+            if date_resolver.immutable_at(end, property_id) > now:
+                return False
+        return True
+
+    async def load(self, property_id: str, request) -> Optional[RunReportResponse]:
+        """讀取已結束日期的報表快照，沒有快照或日期仍在變動時回傳 None"""
+        if not self.active or not self.is_settled(request, property_id):
+            return None
+
+        key = report_cache.make_key(property_id, request)
+        full_grain = self.full_grain(request)
+        keys = [key] if full_grain is None else [key, report_cache.make_key(property_id, full_grain)]
+        try:
+            async with self._session_factory() as session:
+                result = await session.execute(
+                    select(self._model.request_key, self._model.payload).where(
+                        self._model.request_key.in_(keys)
+                    )
+                )
+                payloads = dict(result.all())
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"讀取報表快照失敗: {e}")
+            return None
+
+        if key in payloads:
+            self.hits += 1
+            return RunReportResponse.deserialize(payloads[key])
+
+        if full_grain is not None and keys[1] in payloads:
+            response = RunReportResponse.deserialize(payloads[keys[1]])
+            # 完整粒度快照被截斷時無法精確投影
+            if response.row_count <= len(response.rows):
+                self.hits += 1
+                return project_response(request, response)
+
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def full_grain(request) -> Optional[RunReportRequest]:
+        """查詢對應的完整粒度查詢（不帶排序、筆數為分區上限），已是完整粒度或無法投影時回傳 None"""
+        if not isinstance(request, RunReportRequest) or len(request.date_ranges) != 1 or request.metric_aggregations:
+            return None
+        if not request.order_bys and not request.offset and request.limit == report_partitioner.row_limit:
+            return None
+
+        raw = RunReportRequest.pb()()
+        raw.CopyFrom(RunReportRequest.pb(request))
+        raw.ClearField("order_bys")
+        raw.offset = 0
+        raw.limit = report_partitioner.row_limit
+        return RunReportRequest.wrap(raw)
+
+    async def load_many(self, property_id: str, requests: List) -> List[Optional[RunReportResponse]]:
+        """一次讀取多個查詢的快照，依序回傳（沒有快照者為 None）"""
+        if not self.active or not requests:
+            return [None] * len(requests)
+
+        keys = [report_cache.make_key(property_id, request) for request in requests]
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(self._model.request_key, self._model.payload).where(
+                    self._model.request_key.in_(keys)
+                )
+            )
+            payloads = dict(result.all())
+
+        return [
+            RunReportResponse.deserialize(payloads[key]) if key in payloads else None
+            for key in keys
+        ]
+
+    async def exists(self, property_id: str, request) -> bool:
+        """是否已有該查詢的快照"""
+        if not self.active:
+            return False
+
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(self._model.id).where(
+                    self._model.request_key == report_cache.make_key(property_id, request)
+                )
+            )
+            return result.scalar_one_or_none() is not None
+
+    async def save(self, property_id: str, request, response):
+        """寫入已結束日期的報表快照（日期仍在變動的查詢不寫入）"""
+        if not self.active or not self.is_settled(request, property_id):
+            return
+
+        date_range = request.date_ranges[0]
+        snapshot = self._model(
+            request_key=report_cache.make_key(property_id, request),
+            property_id=property_id,
+            start_date=min(item.start_date for item in request.date_ranges),
+            end_date=max(item.end_date for item in request.date_ranges),
+            row_count=response.row_count,
+            payload=RunReportResponse.serialize(response)
+        )
+        try:
+            async with self._session_factory() as session:
+                session.add(snapshot)
+                await session.commit()
+            self.writes += 1
+        except Exception as e:
+            # 同一查詢同時寫入時唯一鍵衝突，保留先寫入的快照即可
+            self.errors += 1
+            logger.debug(f"寫入報表快照失敗 - 屬性: {property_id}, 日期: {date_range.start_date}: {e}")
+
+    async def prune(self, before: str) -> int:
+        """刪除起始日早於指定日期的快照，回傳刪除筆數"""
+        if not self.active:
+            return 0
+
+        async with self._session_factory() as session:
+            result = await session.execute(
+                delete(self._model).where(self._model.start_date < before)
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+    def stats(self) -> dict:
+        """快照儲存狀態（供健康檢查使用）"""
+        return {
+            "active": self.active,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors
+        }
+
+# 全局報表快照儲存實例
+report_store = ReportSnapshotStore()
@@ -0,0 +1,277 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from database import async_session_factory
+from models import SavedReport, User, UserApiKey, GoogleAnalyticsProperty
+from oauth import OAuthUserManager, oauth_handler
+from ga4_extensions import GA4DataService
+from services.auth_service import AuthenticationResult, auth_service
+from services.ga4_service import ga4_service
+from services.report_cache import freshness_scope
+from services.report_query import ReportQuery
+
+logger = logging.getLogger(__name__)
+
+class SavedReportScheduler:
+    """已儲存報表的伺服器端更新排程
+
+    每個已儲存報表依自己的更新間隔在背景執行查詢，結果寫入資料庫並保留在記憶體中；
+    讀取時直接回傳最近一次的結果，GA4 負載只取決於已儲存報表的數量與間隔，
+    與客戶端輪詢的頻率無關。
+    每次更新前重新確認擁有者仍可存取屬性，存取權已移除的報表自動停用；
+    查詢結果來自過期快取時保留上一次的結果，於下一輪檢查時重試。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_SAVED_REPORTS", "true").lower() == "true"
+        self.tick = int(os.getenv("SAVED_REPORT_TICK", "30"))
+        self.min_interval = int(os.getenv("SAVED_REPORT_MIN_INTERVAL", "300"))
+        self.max_per_owner = int(os.getenv("SAVED_REPORT_MAX_PER_OWNER", "50"))
+        self.batch_size = int(os.getenv("SAVED_REPORT_BATCH_SIZE", "20"))
+
+        self._results: Dict[int, Tuple[datetime, dict]] = {}  # 報表 ID -> (產生時間, 結果)
+        self.materialized = 0
+        self.failed = 0
+        self.deferred = 0
+        self.deactivated = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """啟動背景更新排程"""
+        if not self.enabled:
+            logger.info("已儲存報表排程已停用")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"已儲存報表排程已啟動 - 檢查間隔: {self.tick}s")
+
+    async def stop(self):
+        """停止背景更新排程"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("已儲存報表排程已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> dict:
+        """排程狀態（供健康檢查使用）"""
+        return {
+            "running": self.running,
+            "tick": self.tick,
+            "cached_results": len(self._results),
+            "materialized": self.materialized,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "deactivated": self.deactivated
+        }
+
+    @staticmethod
+    def owner_of(auth: AuthenticationResult) -> str:
+        """已儲存報表的擁有者識別"""
+        return f"{auth.user_type}:{auth.user_id if auth.user_id else auth.user_name}"
+
+    def get_result(self, report: SavedReport) -> Tuple[Optional[datetime], Optional[dict]]:
+        """讀取最近一次的結果（記憶體優先，重新啟動後由資料庫載入一次）"""
+        cached = self._results.get(report.id)
+        if cached is not None:
+            return cached
+        if report.result is None:
+            return None, None
+
+        self._results[report.id] = (report.materialized_at, json.loads(report.result))
+        return self._results[report.id]
+
+    def forget(self, report_id: int):
+        """移除已刪除報表的結果"""
+        self._results.pop(report_id, None)
+
+    async def _run(self):
+        """排程主循環"""
+        while True:
+            try:
+                await self.refresh_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"已儲存報表排程循環失敗: {e}")
+
+            await asyncio.sleep(self.tick)
+
+    async def refresh_due(self):
+        """更新到期的已儲存報表（每個報表各自讀取憑證與寫入結果，單一報表失敗不影響其他報表）"""
+        if not async_session_factory:
+            return
+
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(SavedReport).where(
+                    SavedReport.is_active == True,
+                    SavedReport.next_refresh_at <= datetime.utcnow()
+                ).order_by(SavedReport.next_refresh_at).limit(self.batch_size)
+            )
+            reports = result.scalars().all()
+
+        for report in reports:
+            try:
+                await self._refresh(report)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"已儲存報表更新失敗 - 報表: {report.id}, 錯誤: {e}")
+                # 依更新間隔重試，不在每輪檢查時重複失敗
+                report.last_error = str(e)
+                report.next_refresh_at = datetime.utcnow() + timedelta(seconds=report.refresh_interval)
+                try:
+                    await self._store(report)
+                except Exception as store_error:
+                    logger.error(f"寫入已儲存報表狀態失敗 - 報表: {report.id}, 錯誤: {store_error}")
+
+    async def _refresh(self, report: SavedReport):
+        """更新單一報表：短暫的會話取得憑證，查詢 GA4 時不佔用資料庫連線，完成後立即寫入"""
+        async with async_session_factory() as session:
+            if not await self._owner_has_access(session, report):
+                await self._deactivate(session, report)
+                return
+            data_service = await self._data_service(session, report)
+
+        await self.materialize(report, data_service)
+        await self._store(report)
+
+    async def _deactivate(self, session, report: SavedReport):
+        """停用擁有者已無存取權的報表"""
+        await session.execute(
+            update(SavedReport).where(SavedReport.id == report.id).values(
+                is_active=False,
+                last_error="報表擁有者已無此屬性的存取權"
+            )
+        )
+        await session.commit()
+        self.forget(report.id)
+        self.deactivated += 1
+        logger.warning(f"已儲存報表擁有者已無存取權，報表已停用 - 報表: {report.id}, 擁有者: {report.owner}")
+
+    async def _store(self, report: SavedReport):
+        """寫入報表的結果欄位；查詢期間已刪除的報表不會被還原"""
+        async with async_session_factory() as session:
+            await session.execute(
+                update(SavedReport).where(
+                    SavedReport.id == report.id,
+                    SavedReport.is_active == True
+                ).values(
+                    next_refresh_at=report.next_refresh_at,
+                    result=report.result,
+                    materialized_at=report.materialized_at,
+                    last_error=report.last_error
+                )
+            )
+            await session.commit()
+
+    async def materialize(self, report: SavedReport, data_service: Optional[GA4DataService]):
+        """執行已儲存報表的查詢並記錄結果（呼叫端負責提交資料庫變更）"""
+        now = datetime.utcnow()
+        report.next_refresh_at = now + timedelta(seconds=report.refresh_interval)
+        if data_service is None:
+            self.failed += 1
+            report.last_error = "找不到可用的 GA4 憑證"
+            return
+
+        try:
+            with freshness_scope() as freshness:
+                data = await data_service.run_query(ReportQuery.model_validate_json(report.query))
+        except Exception as e:
+            self.failed += 1
+            report.last_error = str(e)
+            logger.warning(f"已儲存報表更新失敗 - 報表: {report.id}, 錯誤: {e}")
+            return
+
+        if freshness.stale:
+            # 結果來自過期快取（背景更新中），保留上一次的結果與產生時間，下一輪檢查時重試
+            self.deferred += 1
+            report.next_refresh_at = now + timedelta(seconds=self.tick)
+            return
+
+        report.result = json.dumps(data, ensure_ascii=False)
+        report.materialized_at = now
+        report.last_error = None
+        self._results[report.id] = (now, data)
+        self.materialized += 1
+
+    @staticmethod
+    async def _owner_has_access(session, report: SavedReport) -> bool:
+        """確認報表擁有者（用戶、用戶 API Key 或靜態 API Key）仍有效且仍可存取報表的屬性"""
+        if report.owner_type == "api_key":
+            # 靜態 API Key 一律使用 GA4_PROPERTY_ID
+            user_name = report.owner.split(":", 1)[1]
+            return (
+                auth_service.ENABLE_API_KEY_MODE
+                and user_name in auth_service.API_KEYS.values()
+                and report.property_id == auth_service.GA4_PROPERTY_ID
+            )
+
+        if report.owner_type == "oauth":
+            result = await session.execute(
+                select(GoogleAnalyticsProperty.property_id).join(
+                    User, GoogleAnalyticsProperty.user_id == User.id
+                ).where(
+                    GoogleAnalyticsProperty.user_id == report.user_id,
+                    GoogleAnalyticsProperty.is_active == True,
+                    User.is_active == True
+                )
+            )
+        else:
+            # 未關聯屬性的用戶 API Key 使用預設的 GA4_PROPERTY_ID
+            result = await session.execute(
+                select(GoogleAnalyticsProperty.property_id).select_from(UserApiKey).join(
+                    User, UserApiKey.user_id == User.id
+                ).outerjoin(
+                    GoogleAnalyticsProperty, UserApiKey.property_id == GoogleAnalyticsProperty.id
+                ).where(
+                    UserApiKey.user_id == report.user_id,
+                    UserApiKey.is_active == True,
+                    User.is_active == True
+                )
+            )
+
+        return any(
+            (property_id or auth_service.GA4_PROPERTY_ID) == report.property_id
+            for property_id in result.scalars().all()
+        )
+
+    @staticmethod
+    async def _data_service(session, report: SavedReport) -> Optional[GA4DataService]:
+        """以報表擁有者的憑證取得數據服務：OAuth 用戶使用其 token（過期時刷新），API Key 使用 Service Account"""
+        access_token = None
+        if report.owner_type == "oauth":
+            access_token = await OAuthUserManager.get_valid_access_token(session, report.user_id, oauth_handler)
+            if access_token is None:
+                return None
+
+        auth = AuthenticationResult(
+            user_name=report.owner,
+            user_type=report.owner_type,
+            user_id=report.user_id,
+            ga4_property_id=report.property_id,
+            access_token=access_token
+        )
+        try:
+            return ga4_service.get_data_service(auth)
+        except Exception as e:
+            logger.warning(f"已儲存報表無法取得 GA4 客戶端 - 報表: {report.id}, 錯誤: {e}")
+            return None
+
+# 全局已儲存報表排程實例
+saved_report_scheduler = SavedReportScheduler()
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """合併相同鍵的進行中請求
+
+    同一個鍵同時只會執行一次；其餘呼叫者等待同一結果，
+    成功時共用回傳值，失敗時每個等待者都會收到相同的例外。
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Task
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """執行 func，或加入已在進行中的相同呼叫"""
+        if key in self._calls:
+            self.shared += 1
+        task = self.start(key, func)
+
+        # shield：單一等待者被取消（例如客戶端斷線）時不會中斷共用的呼叫
+        return await asyncio.shield(task)
+
+    def start(self, key: str, func: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """啟動呼叫但不等待結果（已有相同呼叫進行中則直接回傳該呼叫）"""
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished, key=key: self._finish(key, finished))
+        return task
+
+    def in_flight(self, key: str) -> bool:
+        """指定鍵是否有進行中的呼叫"""
+        return key in self._calls
+
+    def _finish(self, key: str, task: asyncio.Task):
+        """呼叫結束後移除鍵，並取回例外避免未處理警告"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"共用呼叫失敗 ({key}): {task.exception()}")
+
+    def stats(self) -> dict:
+        """合併狀態（供健康檢查使用）"""
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "shared": self.shared
+        }
+
+# 全局 GA4 請求合併實例
+ga4_single_flight = SingleFlight()
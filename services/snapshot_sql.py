@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, List, Set, Tuple
+
+from services.ga4_decoder import decode_rows
+from services.date_resolver import date_resolver
+from services.report_query import QUERY_PRESETS, report_query_compiler
+from services.report_store import report_store
+from services.report_snapshots import report_snapshot_job, SNAPSHOT_PRESETS
+
+logger = logging.getLogger(__name__)
+
+# 沙盒內允許的 SQLite 操作：只能讀取與呼叫內建函數
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+}
+
+class SnapshotQueryError(ValueError):
+    """SQL 查詢不合法、逾時或超出限制"""
+
+class SnapshotSQLEngine:
+    """以 SQL 查詢本地報表快照
+
+    將呼叫者屬性在指定日期範圍內的每日快照載入記憶體中的 SQLite 資料庫
+    （每個快照報表一個資料表，另加 date 欄位），在唯讀沙盒中執行查詢：
+    只允許單一 SELECT 敘述，並限制執行時間（含解碼與載入）、回傳列數與字串大小。不會呼叫 GA4。
+    """
+
+    def __init__(self):
+        self.max_rows = int(os.getenv("SQL_MAX_ROWS", "1000"))
+        self.max_days = int(os.getenv("SQL_MAX_DAYS", "90"))
+        self.timeout = int(os.getenv("SQL_TIMEOUT_MS", "2000")) / 1000
+        self.max_value_bytes = int(os.getenv("SQL_MAX_VALUE_BYTES", "1000000"))
+        self.queries = 0
+        self.rejected = 0
+
+    def tables(self) -> Dict[str, List[str]]:
+        """可查詢的資料表與欄位"""
+        return {
+            name: ["date"] + QUERY_PRESETS[name].dimensions + QUERY_PRESETS[name].metrics
+            for name in SNAPSHOT_PRESETS
+        }
+
+    async def query(self, property_id: str, sql: str, start_date: str, end_date: str) -> Dict:
+        """在屬性的快照上執行唯讀 SQL 查詢"""
+        if not report_store.active:
+            raise SnapshotQueryError("報表快照儲存未啟用")
+
+        today = date_resolver.today(property_id)
+        start = date_resolver.resolve(start_date, today)
+        end = date_resolver.resolve(end_date, today)
+        if start is None or end is None:
+            raise SnapshotQueryError("日期格式錯誤，請使用 YYYY-MM-DD、today、yesterday 或 NdaysAgo")
+        if start > end:
+            raise SnapshotQueryError("start_date 不可晚於 end_date")
+        if (end - start).days + 1 > self.max_days:
+            raise SnapshotQueryError(f"日期範圍超過上限 {self.max_days} 天")
+
+        snapshots = await self._load_snapshots(property_id, start, end, self._referenced_tables(sql))
+        try:
+            columns, rows, truncated, loaded_days, truncated_tables = await asyncio.to_thread(
+                self._execute, snapshots, sql
+            )
+        except SnapshotQueryError:
+            self.rejected += 1
+            raise
+
+        self.queries += 1
+        return {
+            "columns": columns,
+            "rows": rows,
+            "rowCount": len(rows),
+            "truncated": truncated,
+            "truncated_tables": truncated_tables,
+            "snapshot_days": loaded_days
+        }
+
+    def stats(self) -> dict:
+        """SQL 查詢狀態（供健康檢查使用）"""
+        return {
+            "queries": self.queries,
+            "rejected": self.rejected,
+            "max_rows": self.max_rows,
+            "timeout_ms": int(self.timeout * 1000)
+        }
+
+    @staticmethod
+    def _referenced_tables(sql: str) -> Set[str]:
+        """SQL 中出現的快照資料表名稱（不分大小寫；多判斷只會多載入資料，不影響結果）"""
+        words = {word.lower() for word in re.findall(r"\w+", sql)}
+        return {name for name in SNAPSHOT_PRESETS if name.lower() in words}
+
+    async def _load_snapshots(self, property_id: str, start, end, tables: Set[str]) -> List[Tuple[str, str, object]]:
+        """讀取日期範圍內指定資料表的快照，回傳 [(資料表名稱, 日期, 回應)]（尚未解碼）"""
+        keys: List[Tuple[str, str]] = []
+        requests = []
+        day = start
+        while day <= end:
+            for name, query in report_snapshot_job.snapshot_queries(property_id, day).items():
+                if name not in tables:
+                    continue
+                keys.append((name, day.isoformat()))
+                # 逐日的快照計畫只用於此次載入，不寫入共用的計畫快取
+                requests.append(report_query_compiler.compile(query, property_id, cache=False))
+            day += timedelta(days=1)
+
+        return [
+            (name, day, response)
+            for (name, day), response in zip(keys, await report_store.load_many(property_id, requests))
+            if response is not None
+        ]
+
+    def _execute(self, snapshots: List[Tuple[str, str, object]], sql: str) -> Tuple[List[str], List[List], bool, int, List[str]]:
+        """解碼快照並在記憶體 SQLite 沙盒中執行查詢（於執行緒中呼叫，逾時涵蓋解碼與載入）
+
+        回傳 (欄位, 列, 結果是否截斷, 有快照的天數, 快照被截斷的資料表)。
+        """
+        deadline = time.monotonic() + self.timeout
+        schema = self.tables()
+        tables: Dict[str, List[List]] = {name: [] for name in schema}
+        truncated_tables = set()
+        days = set()
+        for name, day, response in snapshots:
+            days.add(day)
+            if response.row_count > len(response.rows):
+                truncated_tables.add(name)
+            columns = schema[name]
+            for row in decode_rows(response):
+                row["date"] = day
+                tables[name].append([row.get(column) for column in columns])
+            if time.monotonic() > deadline:
+                raise SnapshotQueryError(f"查詢執行超過 {int(self.timeout * 1000)}ms")
+
+        connection = sqlite3.connect(":memory:")
+        try:
+            for name, columns in schema.items():
+                quoted = ", ".join(f'"{column}"' for column in columns)
+                connection.execute(f'CREATE TABLE "{name}" ({quoted})')
+                connection.executemany(
+                    f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(columns))})',
+                    tables[name]
+                )
+            connection.commit()
+
+            # 載入完成後才啟用沙盒：只允許讀取、限制字串大小，並在逾時時中斷執行
+            connection.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, self.max_value_bytes)
+            connection.set_authorizer(
+                lambda action, *args: sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+            )
+            connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+
+            try:
+                cursor = connection.execute(sql)
+                rows = cursor.fetchmany(self.max_rows + 1)
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > deadline:
+                    raise SnapshotQueryError(f"查詢執行超過 {int(self.timeout * 1000)}ms")
+                raise SnapshotQueryError(f"SQL 錯誤: {e}")
+            except (sqlite3.DatabaseError, sqlite3.Warning, sqlite3.ProgrammingError) as e:
+                raise SnapshotQueryError(f"SQL 錯誤: {e}")
+
+            if cursor.description is None:
+                raise SnapshotQueryError("只允許 SELECT 查詢")
+
+            columns = [column[0] for column in cursor.description]
+            truncated = len(rows) > self.max_rows
+            return (columns, [list(row) for row in rows[:self.max_rows]], truncated,
+                    len(days), sorted(truncated_tables))
+        finally:
+            connection.close()
+
+# 全局快照 SQL 查詢實例
+snapshot_sql = SnapshotSQLEngine()
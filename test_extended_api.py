@@ -107,6 +107,16 @@ def main():
                 ("/analytics/search-terms", {"start_date": "7daysAgo", "end_date": "today", "limit": 10}),
                 ("/analytics/performance", {"start_date": "7daysAgo", "end_date": "today", "limit": 5}),
             ]
+        },
+        {
+            "name": "組合查詢測試 (V2)",
+            "tests": [
+                ("/analytics/breakdown", {"by": "deviceCategory", "metrics": "sessions,bounceRate", "start_date": "7daysAgo", "end_date": "today"}),
+                ("/analytics/bundle", {"panels": "realtime_overview,devices,top_pages", "start_date": "7daysAgo", "end_date": "today", "limit": 5}),
+                ("/analytics/query/presets", None),
+                ("/analytics/pivot/presets", None),
+                ("/analytics/sql/tables", None),
+            ]
         }
     ]
     
@@ -144,6 +154,11 @@ def main():
         print("   GET /analytics/geographic            # 地理位置數據")
         print("   GET /analytics/search-terms          # 站內搜索分析")
         print("   GET /analytics/performance           # 頁面效能分析")
+        print("   GET /analytics/breakdown             # 維度細分 (V2)")
+        print("   GET /analytics/bundle                # 多面板組合查詢 (V2)")
+        print("   GET /analytics/query/presets         # 預設報表查詢 (V2)")
+        print("   GET /analytics/pivot/presets         # 預設交叉表 (V2)")
+        print("   GET /analytics/sql/tables            # 快照 SQL 資料表 (V2)")
         sys.exit(0)
     else:
         print("\n⚠️  部分測試失敗，請檢查服務狀態")
@@ -178,6 +178,119 @@ class V2APITester:
             print(f"❌ 用戶資訊測試異常: {e}")
             return False
     
+    async def test_metric_filter_query(self):
+        """測試含指標篩選的查詢不會依日期分區（篩選作用於整段期間的彙總值）"""
+        print("\n🔍 測試指標篩選查詢...")
+        try:
+            headers = {"X-API-Key": API_KEY}
+            before = await self.client.get(f"{self.base_url}/health")
+            partitioned = before.json()["ga4_runtime"]["partitions"]["partitioned"]
+            
+            response = await self.client.post(
+                f"{self.base_url}/analytics/query",
+                headers=headers,
+                json={
+                    "dimensions": ["pagePath"],
+                    "metrics": ["sessions"],
+                    "start_date": "7daysAgo",
+                    "end_date": "yesterday",
+                    "metric_filters": [{"field": "sessions", "operator": "greater_than", "value": 10}]
+                }
+            )
+            if response.status_code != 200:
+                print(f"❌ 指標篩選查詢失敗: {response.status_code}")
+                print(f"   響應: {response.text}")
+                return False
+            
+            after = await self.client.get(f"{self.base_url}/health")
+            if after.json()["ga4_runtime"]["partitions"]["partitioned"] != partitioned:
+                print(f"❌ 指標篩選查詢不應依日期分區合併")
+                return False
+            
+            print(f"✅ 指標篩選查詢以單一查詢執行")
+            print(f"   列數: {response.json()['data'].get('rowCount')}")
+            return True
+        
+        except Exception as e:
+            print(f"❌ 指標篩選查詢異常: {e}")
+            return False
+    
+    async def _post_analytics(self, title: str, path: str, payload: dict) -> bool:
+        """以 API Key 呼叫 POST 分析端點並確認回傳成功"""
+        print(f"\n📊 測試{title}...")
+        try:
+            headers = {"X-API-Key": API_KEY}
+            response = await self.client.post(f"{self.base_url}{path}", headers=headers, json=payload)
+            
+            if response.status_code == 200 and response.json().get("status") == "success":
+                data = response.json().get("data")
+                print(f"✅ {title}成功")
+                if isinstance(data, dict):
+                    print(f"   回傳欄位: {list(data.keys())[:6]}")
+                elif isinstance(data, list):
+                    print(f"   回傳項目: {len(data)}")
+                return True
+            else:
+                print(f"❌ {title}失敗: {response.status_code}")
+                print(f"   響應: {response.text}")
+                return False
+        
+        except Exception as e:
+            print(f"❌ {title}異常: {e}")
+            return False
+    
+    async def test_report_query(self):
+        """測試通用報表查詢"""
+        return await self._post_analytics("通用報表查詢", "/analytics/query", {"preset": "top_pages", "limit": 5})
+    
+    async def test_compare(self):
+        """測試期間比較（預設與前一個等長期間比較）"""
+        return await self._post_analytics("期間比較", "/analytics/compare", {
+            "query": {"preset": "traffic_sources", "start_date": "7daysAgo", "end_date": "yesterday"},
+            "limit": 5
+        })
+    
+    async def test_pivot(self):
+        """測試交叉表查詢"""
+        return await self._post_analytics("交叉表查詢", "/analytics/pivot", {"preset": "device_by_country", "row_limit": 5})
+    
+    async def test_pivot_batch(self):
+        """測試批次交叉表查詢"""
+        return await self._post_analytics("批次交叉表查詢", "/analytics/pivot/batch", {
+            "pivots": [{"preset": "device_by_country"}, {"preset": "channel_by_device"}]
+        })
+    
+    async def test_snapshot_sql(self):
+        """測試快照 SQL 查詢"""
+        return await self._post_analytics("快照 SQL 查詢", "/analytics/sql", {
+            "sql": "SELECT pagePath, SUM(screenPageViews) AS views FROM top_pages GROUP BY pagePath ORDER BY views DESC LIMIT 5",
+            "start_date": "7daysAgo",
+            "end_date": "yesterday"
+        })
+    
+    async def test_realtime_stream(self):
+        """測試即時在線人數串流（讀取第一個事件後中斷）"""
+        print("\n📡 測試即時在線人數串流...")
+        try:
+            headers = {"X-API-Key": API_KEY}
+            async with self.client.stream("GET", f"{self.base_url}/realtime/stream", headers=headers) as response:
+                if response.status_code != 200:
+                    print(f"❌ 即時串流失敗: {response.status_code}")
+                    return False
+                
+                async for line in response.aiter_lines():
+                    if line.startswith("event:") or line.startswith(":"):
+                        print(f"✅ 即時串流已連線")
+                        print(f"   第一個事件: {line}")
+                        return line != "event: error"
+            
+            print(f"❌ 即時串流未送出任何事件")
+            return False
+        
+        except Exception as e:
+            print(f"❌ 即時串流異常: {e}")
+            return False
+    
     async def run_all_tests(self):
         """執行所有測試"""
         print("🚀 開始 GA4 API Service V2 測試\n")
@@ -190,6 +303,13 @@ class V2APITester:
             ("無效認證", self.test_invalid_auth),
             ("無效 API Key", self.test_invalid_api_key),
             ("API Key 用戶訪問限制", self.test_user_info_without_oauth),
+            ("指標篩選查詢", self.test_metric_filter_query),
+            ("通用報表查詢", self.test_report_query),
+            ("期間比較", self.test_compare),
+            ("交叉表查詢", self.test_pivot),
+            ("批次交叉表查詢", self.test_pivot_batch),
+            ("快照 SQL 查詢", self.test_snapshot_sql),
+            ("即時在線人數串流", self.test_realtime_stream),
         ]
         
         results = []